@@ -48,8 +48,20 @@ def show_help():
   buy <валюта> <количество>  💰 Купить валюту
   sell <валюта> <количество> 💸 Продать валюту
   show-portfolio             📊 Показать портфель
-  show-rates                 📈 Показать курсы
+  trades [--limit N] [--page P] 🧾 Журнал сделок
+  cache-stats                🗃️  Кеш оценок портфелей
+  add-alert <пара> above|below <порог> 🔔 Оповещение о курсе
+  alerts / remove-alert <id> 🔕 Список / удаление оповещений
+  place-order buy|sell <валюта> <кол-во> <цена> 📌 Лимитная заявка
+  orders / cancel-order <id> 📋 Список / отмена заявок
+  show-rates [--base EUR] [--sort price|change|stale] 📈 Показать курсы
+  rate-stats <пара> [--rebuild] 📉 Скользящие статистики 1ч/24ч/7д
+  market-analytics [--window 7d] [--step 1h] 🧮 Корреляция и ковариация пар
   update-rates               🔄 Обновить курсы
+  source-stats               ⏱️  Задержки источников курсов
+  compact-history [--raw-days N] 🗜️  Сжать историю курсов
+  archive-history [--codec gzip|lzma] 📦 Архив закрытых месяцев истории
+  export rates|trades|audit|portfolios [--format csv|ndjson] [--gzip] 📤 Выгрузка данных
   get-rate <из> <в>          💱 Получить курс
 
 🎯 Примеры:
@@ -0,0 +1,70 @@
+"""Параллельные сделки многих сессий через один AuthUseCase."""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from valutatrade_hub.core.amount import to_units
+from valutatrade_hub.core.session import Session
+from valutatrade_hub.core.usecases import AuthUseCase
+
+USERS = 8
+SESSIONS_PER_USER = 2
+TRADES_PER_SESSION = 25
+BTC = 0.001
+
+
+@pytest.fixture
+def use_case(tmp_path, monkeypatch):
+    # Все файлы данных use-case'ов — относительные пути от data/
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    return AuthUseCase()
+
+
+def _workload(use_case, session, seed):
+    """Покупки и продажи BTC; возвращает ожидаемое изменение и число сделок"""
+    expected, trades = 0, 0
+    for i in range(TRADES_PER_SESSION):
+        # Продажа только из купленного этой же сессией, баланс не уходит в минус
+        side = "sell" if (i + seed) % 3 == 2 and expected > 0 else "buy"
+        use_case.execute_trade(session, side, "BTC", BTC)
+        expected += 1 if side == "buy" else -1
+        trades += 1
+    return session.user_id, expected, trades
+
+
+def test_parallel_trades_keep_balances_ledger_and_portfolios(use_case):
+    users = [use_case.create_user(f"user{i}", "password") for i in range(USERS)]
+    sessions = [Session.for_user(user) for user in users for _ in range(SESSIONS_PER_USER)]
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        results = list(pool.map(_workload, [use_case] * len(sessions), sessions,
+                                range(len(sessions))))
+
+    btc_unit = to_units(BTC, 8)
+    expected_units = {user.user_id: 0 for user in users}
+    expected_trades = {user.user_id: 0 for user in users}
+    for user_id, expected, trades in results:
+        expected_units[user_id] += expected * btc_unit
+        expected_trades[user_id] += trades
+
+    for user in users:
+        portfolio = use_case._load_user_portfolio(user.user_id)
+        assert portfolio.get_units("BTC") == expected_units[user.user_id]
+
+        assert use_case.ledger.trades_count(user.user_id) == expected_trades[user.user_id]
+        trades = list(use_case.ledger.iter_trades(user.user_id))
+        assert len(trades) == expected_trades[user.user_id]
+        assert sorted(trade["trade_id"] for trade in trades) == list(
+            range(1, expected_trades[user.user_id] + 1))
+        position = use_case.ledger.get_positions(user.user_id)["BTC"]
+        assert position.quantity == expected_units[user.user_id]
+
+    # Потерянное обновление — портфель, перезаписанный старой копией файла
+    with open("data/portfolios.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    assert sorted(item["user_id"] for item in saved) == sorted(expected_units)
+    for item in saved:
+        balance = to_units(item["wallets"].get("BTC", 0), 8)
+        assert balance == expected_units[item["user_id"]]
@@ -0,0 +1,32 @@
+"""Потоковое чтение JSON-массивов блоками произвольного размера."""
+import pytest
+
+from valutatrade_hub.infra.serialization import append_array, iter_array, write_array
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_numbers_split_at_chunk_boundary(tmp_path, pretty):
+    numbers = [12345, -0.5, 1e-07, 987654321, 0, 3.14159, 42]
+    path = tmp_path / "numbers.json"
+    write_array(path, numbers, pretty)
+
+    assert list(iter_array(path, chunk_size=1)) == numbers
+    for chunk_size in range(2, 16):
+        assert list(iter_array(path, chunk_size=chunk_size)) == numbers
+
+
+def test_mixed_items_with_chunk_size_one(tmp_path):
+    items = [{"rate": 92468.12, "pair": "BTC_USD"}, "строка", 7, [1, 22, 333], None, True]
+    path = tmp_path / "items.json"
+    write_array(path, items[:3], False)
+    append_array(path, items[3:], False)
+
+    assert list(iter_array(path, chunk_size=1)) == items
+
+
+def test_truncated_number_at_end_of_file_is_an_error(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text("[1,23", encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(iter_array(path, chunk_size=1))
@@ -0,0 +1,173 @@
+"""Нагрузочный прогон HTTP API: запросы в секунду на одном ядре и на N воркерах.
+
+Запуск: python -m valutatrade_hub.api.loadtest --workers 1,4 --duration 5
+
+Сервер поднимается отдельным процессом во временном каталоге с копией
+data/rates.json и data/rates.bin, поэтому рабочие данные не меняются.
+Клиенты — несколько процессов с asyncio и keep-alive соединениями.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _request(port: int, method: str, path: str, payload=None, token: str = None) -> Dict:  # type: ignore
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    head += f"Content-Length: {len(body)}\r\n\r\n"
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.sendall(head.encode('latin-1') + body)
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+def _wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Сервер не поднялся на порту {port}")
+
+
+async def _client(port: int, requests: List[bytes], deadline: float, latencies: List[float]):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            i += 1
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+def _client_process(port: int, requests: List[bytes], connections: int,
+                    duration: float, queue):
+    async def run():
+        latencies: List[float] = []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(_client(port, requests, deadline, latencies)
+                               for _ in range(connections)))
+        return latencies
+    queue.put(asyncio.run(run()))
+
+
+def _build_requests(endpoint: str, token: str) -> List[bytes]:
+    auth = f"Authorization: Bearer {token}\r\n"
+    rates = b"GET /rates HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+    portfolio = f"GET /portfolio HTTP/1.1\r\nHost: 127.0.0.1\r\n{auth}\r\n".encode('latin-1')
+    body = json.dumps({"currency": "BTC", "amount": 0.0001}).encode('utf-8')
+    buy = (f"POST /buy HTTP/1.1\r\nHost: 127.0.0.1\r\n{auth}"
+           f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body
+    return {
+        "rates": [rates],
+        "portfolio": [portfolio],
+        "buy": [buy],
+        # 8 чтений курсов : 1 портфель : 1 покупка
+        "mixed": [rates] * 8 + [portfolio, buy],
+    }[endpoint]
+
+
+def run_case(workers: int, endpoint: str, duration: float, clients: int,
+             connections: int) -> Tuple[float, float, float, int]:
+    port = _free_port()
+    with tempfile.TemporaryDirectory(prefix="valutatrade-load-") as workdir:
+        data_dir = Path(workdir) / "data"
+        data_dir.mkdir()
+        for name in ("rates.json", "rates.bin"):
+            if (_ROOT / "data" / name).exists():
+                shutil.copy(_ROOT / "data" / name, data_dir / name)
+
+        env = dict(os.environ, PYTHONPATH=str(_ROOT), VALUTATRADE_API_SECRET="loadtest")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "valutatrade_hub.api.server",
+             "--port", str(port), "--workers", str(workers)],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            _request(port, "POST", "/register", {"username": "load", "password": "load"})
+            token = _request(port, "POST", "/login",
+                             {"username": "load", "password": "load"})["token"]
+            _request(port, "POST", "/buy", {"currency": "BTC", "amount": 0.1}, token)
+
+            requests = _build_requests(endpoint, token)
+            queue = multiprocessing.Queue()
+            processes = [multiprocessing.Process(
+                target=_client_process, args=(port, requests, connections, duration, queue))
+                for _ in range(clients)]
+            for process in processes:
+                process.start()
+            latencies = []
+            for _ in processes:
+                latencies.extend(queue.get())
+            for process in processes:
+                process.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    count = len(latencies)
+    p50 = latencies[count // 2] if count else 0.0
+    p99 = latencies[min(count - 1, int(count * 0.99))] if count else 0.0
+    return count / duration, p50 * 1000, p99 * 1000, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон HTTP API")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}",
+                        help="Списки числа воркеров через запятую")
+    parser.add_argument("--endpoint", default="rates",
+                        choices=["rates", "portfolio", "buy", "mixed"])
+    parser.add_argument("--duration", type=float, default=5.0, help="Секунд на прогон")
+    parser.add_argument("--clients", type=int, default=2, help="Клиентских процессов")
+    parser.add_argument("--connections", type=int, default=32,
+                        help="Соединений на клиентский процесс")
+    args = parser.parse_args()
+
+    print(f"Эндпоинт: {args.endpoint}, {args.duration:g} с, "
+          f"{args.clients}×{args.connections} соединений")
+    print(f"{'Воркеры':<10} {'Запросов/с':<14} {'p50, мс':<10} {'p99, мс':<10} {'Всего':<10}")
+    print("-" * 56)
+    for workers in sorted({int(value) for value in args.workers.split(",")}):
+        rps, p50, p99, count = run_case(workers, args.endpoint, args.duration,
+                                        args.clients, args.connections)
+        print(f"{workers:<10} {rps:<14,.0f} {p50:<10.2f} {p99:<10.2f} {count:<10}")
+
+
+if __name__ == "__main__":
+    main()
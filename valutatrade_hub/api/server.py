@@ -0,0 +1,380 @@
+"""HTTP/JSON API поверх use-case'ов на asyncio (только стандартная библиотека).
+
+Запуск: python -m valutatrade_hub.api.server --port 8080 [--workers 4]
+
+  POST /register      {"username", "password"}
+  POST /login         {"username", "password"} -> {"token", "expires_in"}
+  POST /buy, /sell    {"currency", "amount"}             (токен)
+  GET  /portfolio     ?base=USD                          (токен)
+  GET  /rates         снимок курсов из памяти
+  GET  /analytics     ?window=7d&step=1h&pairs=BTC_USD,ETH_USD  корреляция и ковариация пар
+  POST /update-rates  {"source": имя источника, по умолчанию все} (токен)
+
+Токен передаётся заголовком "Authorization: Bearer <token>".
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+from ..core.exceptions import ApiRequestError, CurrencyNotFoundError, InsufficientFundsError
+from ..core.session import Session
+from ..core.usecases import AuthUseCase
+from ..infra.locking import CROSS_PROCESS
+from ..infra.settings import SettingsLoader
+from ..parser_service.analytics import DEFAULT_WINDOW, parse_duration
+from ..parser_service.api_clients import provider_names
+
+logger = logging.getLogger("valutatrade")
+
+_MAX_BODY = 64 * 1024
+# Как часто проверять, не опубликован ли новый снимок курсов
+_RATES_CHECK_INTERVAL = 0.5
+
+
+class ApiError(Exception):
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class SessionTokens:
+    """Подписанные HMAC токены сессии.
+
+    user_id, имя и срок действия лежат в самом токене, поэтому токен
+    проверяет любой воркер без общего хранилища сессий.
+    """
+
+    def __init__(self, secret: bytes, ttl_seconds: int = 3600):
+        self._secret = secret
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload: bytes) -> str:
+        digest = hmac.new(self._secret, payload, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode('ascii')
+
+    def issue(self, user_id: int, username: str) -> str:
+        expires = int(time.time()) + self.ttl_seconds
+        payload = json.dumps([user_id, username, expires]).encode('utf-8')
+        encoded = base64.urlsafe_b64encode(payload).rstrip(b"=").decode('ascii')
+        return f"{encoded}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> Optional[Session]:
+        try:
+            encoded, signature = token.split(".", 1)
+            payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        except ValueError:
+            return None
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        user_id, username, expires = json.loads(payload)
+        if expires < time.time():
+            return None
+        return Session(user_id, username)
+
+
+class ApiServer:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080,
+                 use_case: AuthUseCase = None, secret: bytes = None):  # type: ignore
+        settings = SettingsLoader()
+        self.host = host
+        self.port = port
+        self.use_case = use_case or AuthUseCase()
+        self.tokens = SessionTokens(secret or secrets.token_bytes(32),
+                                    settings.get("api_session_ttl_seconds", 3600))
+        # Use-case'ы потокобезопасны и получают Session в каждом вызове,
+        # поэтому блокирующая работа с хранилищем идёт в пуле потоков
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.get("api_executor_workers", 8), thread_name_prefix="api-storage")
+        self._server = None
+
+        self._rates_body = b""
+        self._rates_snapshot = None
+        self._rates_checked_at = 0.0
+
+        self._routes = {
+            ("POST", "/register"): self._register,
+            ("POST", "/login"): self._login,
+            ("POST", "/buy"): self._buy,
+            ("POST", "/sell"): self._sell,
+            ("GET", "/portfolio"): self._portfolio,
+            ("GET", "/rates"): self._rates,
+            ("GET", "/analytics"): self._analytics,
+            ("POST", "/update-rates"): self._update_rates,
+        }
+
+    async def start(self, reuse_port: bool = False):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, reuse_port=reuse_port or None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"API запущен на http://{self.host}:{self.port} (pid {os.getpid()})")
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def _run_blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._write(writer, HTTPStatus.BAD_REQUEST,
+                                      {"error": "Неверная строка запроса"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length_header = headers.get("content-length", "") or "0"
+                if not length_header.isdecimal():
+                    # Длину тела не узнать — соединение дальше не читается
+                    await self._write(writer, HTTPStatus.BAD_REQUEST,
+                                      {"error": "Неверный заголовок Content-Length"}, False)
+                    break
+                length = int(length_header)
+                if length > _MAX_BODY:
+                    await self._write(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                      {"error": "Слишком большое тело запроса"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (connection != "close" if version == "HTTP/1.1"
+                              else connection == "keep-alive")
+
+                status, payload = await self._dispatch(method, target, headers, body)
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: HTTPStatus, payload, keep_alive: bool):
+        body = payload if isinstance(payload, bytes) else json.dumps(
+            payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, target: str, headers: Dict, body: bytes):
+        url = urlparse(target)
+        handler = self._routes.get((method, url.path))
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, {"error": f"Нет обработчика {method} {url.path}"}
+
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть JSON-объектом")
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            return await handler(data=data, query=query, headers=headers)
+        except json.JSONDecodeError:
+            return HTTPStatus.BAD_REQUEST, {"error": "Тело запроса не является JSON"}
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, InsufficientFundsError, CurrencyNotFoundError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except ApiRequestError as e:
+            return HTTPStatus.BAD_GATEWAY, {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Ошибка обработки {method} {url.path}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Внутренняя ошибка сервера"}
+
+    def _authorize(self, headers: Dict) -> Session:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        session = self.tokens.verify(token) if scheme.lower() == "bearer" else None
+        if session is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Требуется действительный токен сессии")
+        return session
+
+    @staticmethod
+    def _require(data: Dict, *fields):
+        missing = [field for field in fields if field not in data]
+        if missing:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"Не хватает полей: {', '.join(missing)}")
+        return [data[field] for field in fields]
+
+    async def _register(self, data, query, headers):
+        username, password = self._require(data, "username", "password")
+        user = await self._run_blocking(self.use_case.create_user, str(username), str(password))
+        return HTTPStatus.CREATED, {"user_id": user.user_id, "username": user.username}
+
+    async def _login(self, data, query, headers):
+        username, password = self._require(data, "username", "password")
+        user = await self._run_blocking(self.use_case.authenticate, str(username), str(password))
+        if user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Неверный логин или пароль")
+        return HTTPStatus.OK, {"token": self.tokens.issue(user.user_id, user.username),
+                               "expires_in": self.tokens.ttl_seconds}
+
+    async def _trade(self, side: str, data, headers):
+        session = self._authorize(headers)
+        currency, amount = self._require(data, "currency", "amount")
+        # bool — подкласс int, но true не количество
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "amount должен быть числом")
+        result = await self._run_blocking(
+            self.use_case.execute_trade, session, side, str(currency), amount)
+        return HTTPStatus.OK, {"trade": result["trade"],
+                               "balance": {"currency": result["currency"],
+                                           "before": result["old_balance"],
+                                           "after": result["new_balance"]}}
+
+    async def _buy(self, data, query, headers):
+        return await self._trade("buy", data, headers)
+
+    async def _sell(self, data, query, headers):
+        return await self._trade("sell", data, headers)
+
+    async def _portfolio(self, data, query, headers):
+        session = self._authorize(headers)
+        base = query.get("base", "USD").upper()
+        valuation = await self._run_blocking(self.use_case.portfolio_valuation, session, base)
+        if valuation is None:
+            return HTTPStatus.OK, {"username": session.username, "base": base, "wallets": [],
+                                   "total": 0.0, "pnl": []}
+        rows, total, pnl_rows = valuation
+        return HTTPStatus.OK, {
+            "username": session.username,
+            "base": base,
+            "wallets": [{"currency": currency.code, "balance": balance,
+                         "rate": rate, "value": value}
+                        for currency, balance, rate, value in rows],
+            "total": total,
+            "pnl": [{"currency": currency.code, "average_cost": average_cost,
+                     "unrealized": unrealized, "realized": realized}
+                    for currency, average_cost, unrealized, realized in pnl_rows]
+        }
+
+    async def _rates(self, data, query, headers):
+        # Один разобранный снимок на процесс; тело ответа кодируется заново
+        # только после публикации нового снимка
+        now = time.monotonic()
+        if now - self._rates_checked_at >= _RATES_CHECK_INTERVAL:
+            self._rates_checked_at = now
+            snapshot = self.use_case.rates_updater.storage.get_snapshot()
+            if snapshot is not self._rates_snapshot:
+                self._rates_snapshot = snapshot
+                self._rates_body = json.dumps(
+                    snapshot.to_legacy_json(), ensure_ascii=False).encode('utf-8')
+        return HTTPStatus.OK, self._rates_body
+
+    async def _analytics(self, data, query, headers):
+        # Кешируется в хранилище до следующего поколения снимка курсов
+        window = parse_duration(query.get("window", DEFAULT_WINDOW))
+        step = parse_duration(query["step"]) if "step" in query else None
+        pairs = [pair_key.strip().upper() for pair_key in query["pairs"].split(",")
+                 if pair_key.strip()] if "pairs" in query else None
+        analytics = await self._run_blocking(
+            self.use_case.rates_updater.storage.get_market_analytics, window, step, pairs)
+        return HTTPStatus.OK, analytics.to_dict()
+
+    async def _update_rates(self, data, query, headers):
+        self._authorize(headers)
+        source = data.get("source")
+        if source is not None and source not in provider_names():
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"source: {' или '.join(provider_names())}")
+        result = await self._run_blocking(self.use_case.rates_updater.run_update, source)
+        self._rates_checked_at = 0.0
+        return HTTPStatus.OK, {"success": result["success"],
+                               "total_rates": result["total_rates"],
+                               "errors": result["errors"],
+                               "sources": result["sources"]}
+
+
+async def _serve(host: str, port: int, secret: bytes, reuse_port: bool):
+    server = ApiServer(host, port, secret=secret)
+    await server.start(reuse_port=reuse_port)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def _run_worker(host: str, port: int, secret: bytes, reuse_port: bool):
+    try:
+        asyncio.run(_serve(host, port, secret, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, workers: int = 1, secret: bytes = None):  # type: ignore
+    """Несколько воркеров слушают один порт через SO_REUSEPORT, ядро
+    распределяет соединения; общий секрет позволяет любому воркеру
+    принять токен, выданный другим"""
+    secret = secret or os.getenv("VALUTATRADE_API_SECRET", "").encode('utf-8') \
+        or secrets.token_bytes(32)
+    # Воркеры делают read-modify-write users.json и portfolios.json; без
+    # межпроцессной блокировки параллельные изменения терялись бы
+    if workers > 1 and not CROSS_PROCESS:
+        logger.warning("Нет межпроцессной блокировки файлов (fcntl), запускается один воркер")
+        print("⚠️  Несколько воркеров требуют fcntl.flock, запускается один воркер")
+        workers = 1
+    print(f"API запущен на http://{host}:{port}, воркеров: {max(workers, 1)}")
+    if workers <= 1:
+        _run_worker(host, port, secret, False)
+        return
+
+    processes = [multiprocessing.Process(target=_run_worker, args=(host, port, secret, True),
+                                         daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API ValutaTrade Hub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Число процессов на одном порту (SO_REUSEPORT)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
 import argparse
+import math
+from pathlib import Path
 from ..core.usecases import AuthUseCase
+from ..core.currencies import get_registry
 from ..core.exceptions import InsufficientFundsError, CurrencyNotFoundError, ApiRequestError
-from ..parser_service.updater import RatesUpdater
-from ..parser_service.config import ParserConfig
-from ..parser_service.storage import RatesStorage
+from ..core.export import (AUDIT_LOG, COLUMNS, DATASETS, FORMATS, audit_rows, portfolio_rows,
+                           rate_rows, trade_rows, write_rows)
+from ..parser_service.analytics import DEFAULT_WINDOW, parse_duration
+from ..parser_service.archive import CODECS
+from ..parser_service.api_clients import provider_names
+from ..parser_service.history import format_timestamp, parse_timestamp
+from ..parser_service.rates_view import SORT_KEYS
+from ..parser_service.retention import RetentionPolicy
+
+# Больше пар — вместо матрицы список сильнейших корреляций
+_MATRIX_LIMIT = 12
 
 auth_use_case = AuthUseCase()
+# Сессия пользователя, вошедшего в этом терминале
+session = None
 
 
 def interface():
+    global session
     # Проверяем наличие актуальных курсов при запуске
     try:
         from ..parser_service.updater import RatesUpdater
@@ -61,19 +75,107 @@ def interface():
         "show-portfolio", help="Показать портфель")
     show_portfolio_parser.add_argument(
         "--base", type=str, default="USD", help="Базовая валюта")
+    show_portfolio_parser.add_argument(
+        "--at", type=str, help="Стоимость на момент, например 2025-12-07T13:00Z")
+    show_portfolio_parser.add_argument(
+        "--from", dest="date_from", type=str, help="Начало дневного ряда")
+    show_portfolio_parser.add_argument(
+        "--to", dest="date_to", type=str, help="Конец дневного ряда")
+
+    trades_parser = subparsers.add_parser(
+        "trades", help="Журнал сделок")
+    trades_parser.add_argument(
+        "--limit", type=int, default=20, help="Сделок на странице")
+    trades_parser.add_argument(
+        "--page", type=int, default=1, help="Номер страницы, 1 — самые новые")
+
+    subparsers.add_parser(
+        "cache-stats", help="Статистика кеша оценок портфелей")
+
+    add_alert_parser = subparsers.add_parser(
+        "add-alert", help="Оповещение о пересечении курсом порога")
+    add_alert_parser.add_argument("pair", type=str, help="Пара, например BTC_USD")
+    add_alert_parser.add_argument(
+        "direction", type=str, choices=["above", "below"], help="Выше или ниже порога")
+    add_alert_parser.add_argument("threshold", type=float, help="Порог курса")
+
+    subparsers.add_parser("alerts", help="Активные оповещения")
+
+    remove_alert_parser = subparsers.add_parser(
+        "remove-alert", help="Удалить оповещение")
+    remove_alert_parser.add_argument("alert_id", type=int, help="Номер оповещения")
+
+    place_order_parser = subparsers.add_parser(
+        "place-order", help="Выставить лимитную заявку")
+    place_order_parser.add_argument(
+        "side", type=str, choices=["buy", "sell"], help="Покупка или продажа")
+    place_order_parser.add_argument("currency", type=str, help="Код валюты")
+    place_order_parser.add_argument("amount", type=float, help="Количество")
+    place_order_parser.add_argument("price", type=float, help="Лимитная цена в USD")
+
+    cancel_order_parser = subparsers.add_parser(
+        "cancel-order", help="Отменить лимитную заявку")
+    cancel_order_parser.add_argument("order_id", type=int, help="Номер заявки")
+
+    subparsers.add_parser("orders", help="Открытые лимитные заявки")
 
     update_parser = subparsers.add_parser(
         "update-rates", help="Обновить курсы валют")
     update_parser.add_argument(
-        "--source", type=str, choices=["coingecko", "exchangerate"], help="Источник")
+        "--source", type=str, choices=provider_names(), help="Источник")
+
+    subparsers.add_parser("source-stats", help="Задержки запросов к источникам курсов")
+
+    compact_parser = subparsers.add_parser(
+        "compact-history", help="Сжать историю курсов по политике хранения")
+    compact_parser.add_argument("--raw-days", type=float, help="Дней хранить сырые точки")
+    compact_parser.add_argument("--minute-days", type=float, help="Дней хранить минутные свечи")
+    compact_parser.add_argument("--hour-days", type=float, help="Дней хранить часовые свечи")
+
+    archive_parser = subparsers.add_parser(
+        "archive-history", help="Перенести закрытые месяцы истории в сжатый архив")
+    archive_parser.add_argument("--codec", type=str, choices=sorted(CODECS),
+                                help="Кодек сжатия сегментов")
+
+    export_parser = subparsers.add_parser(
+        "export", help="Выгрузить историю курсов, сделки, журнал действий или портфели в CSV/NDJSON")
+    export_parser.add_argument("dataset", type=str, choices=DATASETS, help="Что выгружать")
+    export_parser.add_argument("--format", type=str, choices=FORMATS, default="csv",
+                               help="Формат строк")
+    export_parser.add_argument("--output", type=str,
+                               help="Файл выгрузки (по умолчанию data/export/<набор>.<формат>)")
+    export_parser.add_argument("--from", dest="date_from", type=str, help="Начало периода (ISO)")
+    export_parser.add_argument("--to", dest="date_to", type=str, help="Конец периода (ISO)")
+    export_parser.add_argument("--pair", type=str, action="append",
+                               help="Пара вида BTC_USD; можно повторять")
+    export_parser.add_argument("--gzip", action="store_true", help="Сжать gzip")
+
+    rate_stats_parser = subparsers.add_parser(
+        "rate-stats", help="Скользящие статистики пары за 1ч/24ч/7д")
+    rate_stats_parser.add_argument("pair", type=str, nargs="?", help="Пара вида BTC_USD")
+    rate_stats_parser.add_argument("--rebuild", action="store_true",
+                                   help="Пересчитать статистики по всей истории")
+
+    analytics_parser = subparsers.add_parser(
+        "market-analytics", help="Доходности, корреляция и ковариация пар за окно")
+    analytics_parser.add_argument("--window", type=str, default=DEFAULT_WINDOW,
+                                  help="Окно: 24h, 7d, 30d или секунды")
+    analytics_parser.add_argument("--step", type=str, help="Шаг общей сетки: 5m, 1h, ...")
+    analytics_parser.add_argument("--pair", type=str, action="append",
+                                  help="Пара вида BTC_USD; можно повторять")
+    analytics_parser.add_argument("--covariance", action="store_true",
+                                  help="Показать матрицу ковариации")
 
     show_rates_parser = subparsers.add_parser(
         "show-rates", help="Показать курсы из кеша")
     show_rates_parser.add_argument(
-        "--currency", type=str, help="Фильтр по валюте")
+        "--currency", type=str, help="Коды валют через запятую")
     show_rates_parser.add_argument("--top", type=int, help="Топ N криптовалют")
     show_rates_parser.add_argument(
         "--base", type=str, default="USD", help="Базовая валюта")
+    show_rates_parser.add_argument(
+        "--sort", type=str, choices=SORT_KEYS,
+        help="Порядок: код, цена, изменение за 24ч, давность обновления, капитализация")
 
     try:
         args = parser.parse_args()
@@ -91,20 +193,58 @@ def interface():
             auth_use_case.register(args.username, args.password)
 
         elif args.command == "login":
-            auth_use_case.login(args.username, args.password)
+            new_session = auth_use_case.login(args.username, args.password)
+            if new_session is not None:
+                if session is not None:
+                    auth_use_case.unwatch(session)
+                session = new_session
+                auth_use_case.watch(session, print)
 
         elif args.command == "buy":
-            result = auth_use_case.buy(args.currency, args.amount)
+            result = auth_use_case.buy(session, args.currency, args.amount)
             if not result:
                 print("Покупка не выполнена.")
 
         elif args.command == "sell":
-            result = auth_use_case.sell(args.currency, args.amount)
+            result = auth_use_case.sell(session, args.currency, args.amount)
             if not result:
                 print("Продажа не выполнена.")
 
         elif args.command == "show-portfolio":
-            auth_use_case.show_portfolio(args.base)
+            if args.date_from or args.date_to:
+                if not (args.date_from and args.date_to):
+                    print("❌ Для ряда нужны оба параметра: --from и --to")
+                else:
+                    auth_use_case.show_portfolio_history(
+                        session, args.date_from, args.date_to, args.base)
+            elif args.at:
+                auth_use_case.show_portfolio_at(session, args.at, args.base)
+            else:
+                auth_use_case.show_portfolio(session, args.base)
+
+        elif args.command == "trades":
+            auth_use_case.show_trades(session, args.limit, args.page)
+
+        elif args.command == "cache-stats":
+            auth_use_case.show_cache_stats()
+
+        elif args.command == "add-alert":
+            auth_use_case.add_alert(session, args.pair, args.direction, args.threshold)
+
+        elif args.command == "alerts":
+            auth_use_case.show_alerts(session)
+
+        elif args.command == "remove-alert":
+            auth_use_case.remove_alert(session, args.alert_id)
+
+        elif args.command == "place-order":
+            auth_use_case.place_order(session, args.side, args.currency, args.amount, args.price)
+
+        elif args.command == "cancel-order":
+            auth_use_case.cancel_order(session, args.order_id)
+
+        elif args.command == "orders":
+            auth_use_case.show_orders(session)
 
         elif args.command == "get-rate":
             result = auth_use_case.get_rate(args.currency, args.tocurrency)
@@ -114,15 +254,34 @@ def interface():
         elif args.command == "update-rates":
             _handle_update_rates(args.source)
 
+        elif args.command == "source-stats":
+            _handle_source_stats()
+
+        elif args.command == "compact-history":
+            _handle_compact_history(args.raw_days, args.minute_days, args.hour_days)
+
+        elif args.command == "archive-history":
+            _handle_archive_history(args.codec)
+
+        elif args.command == "export":
+            _handle_export(args.dataset, args.format, args.output, args.date_from,
+                           args.date_to, args.pair, args.gzip)
+
+        elif args.command == "rate-stats":
+            _handle_rate_stats(args.pair, args.rebuild)
+
+        elif args.command == "market-analytics":
+            _handle_market_analytics(args.window, args.step, args.pair, args.covariance)
+
         elif args.command == "show-rates":
-            _handle_show_rates(args.currency, args.top, args.base)
+            _handle_show_rates(args.currency, args.top, args.base, args.sort)
 
     except InsufficientFundsError as e:
         print(f"❌ {e}")
         print("   Проверьте баланс.")
     except CurrencyNotFoundError as e:
         print(f"❌ {e}")
-        print("   Доступные валюты: USD, EUR, RUB, BTC, ETH")
+        print(f"   Доступные валюты: {', '.join(get_registry().codes())}")
     except ApiRequestError as e:
         print(f"❌ {e}")
         print("   Сервис курсов недоступен.")
@@ -134,10 +293,9 @@ def interface():
 def _handle_update_rates(source=None):
     print("INFO: Starting rates update...")
     try:
-        config = ParserConfig()
-        if not config.EXCHANGERATE_API_KEY:
-            config.EXCHANGERATE_API_KEY = "71ccd029b9f44cf21cdf6fe7"
-        updater = RatesUpdater(config)
+        # Общий загрузчик: его подписчики (оповещения, кеш оценок)
+        # получают опубликованные курсы
+        updater = auth_use_case.rates_updater
         result = updater.run_update(source)  # type: ignore
         if result["success"]:
             print(
@@ -154,51 +312,288 @@ def _handle_update_rates(source=None):
                 print("Errors:")
                 for error in result["errors"]:
                     print(f"  - {error}")
+        if result["stale_pairs"]:
+            print(f"Kept last known rates for {result['stale_pairs']} pairs")
+        _print_source_stats(result["sources"], result["breakers"])
     except ApiRequestError as e:
         print(f"ERROR: Failed to update rates: {e}")
     except Exception as e:
         print(f"ERROR: Unexpected error: {e}")
 
 
-def _handle_show_rates(currency=None, top=None, base="USD"):
+def _print_source_stats(sources, breakers):
+    print("Sources:")
+    for name, stats in sources.items():
+        status = stats["last_status"]
+        breaker = breakers.get(name, {"state": "closed"})
+        line = (f"  - {name}: {status}, {stats['pairs']} pairs, {stats['last_ms']:.0f} ms, "
+                f"outliers {stats['outliers']}, failures {stats['failures']}/{stats['requests']}, "
+                f"breaker {breaker['state']}")
+        if breaker["state"] == "open":
+            line += f" (retry in {breaker['retry_in_s']:.0f} s)"
+        print(line)
+
+
+def _handle_source_stats():
+    config = auth_use_case.rates_updater.config
+    sources = auth_use_case.rates_updater.latency.load()
+    if not sources:
+        print("📭 Замеров пока нет: выполните update-rates")
+        return
+
+    print("⏱️  Задержки источников курсов, мс (p50 / p95 / p99 по всем запросам):")
+    print("=" * 100)
+    print(f"{'Источник':<14} {'Запросов':<9} {'Ошибок':<7} {'p50':<8} {'p95':<8} {'p99':<8} "
+          f"{'DNS p95':<9} {'Соед. p95':<10} {'TTFB p95':<9} {'Ср. ответ':<10}")
+    print("-" * 100)
+    for name, latency in sorted(sources.items()):
+        total = latency.histograms["total"]
+        average_kb = latency.bytes / latency.requests / 1024 if latency.requests else 0.0
+        print(f"{name:<14} {latency.requests:<9} {latency.failures:<7} "
+              f"{total.percentile(50):<8.0f} {total.percentile(95):<8.0f} "
+              f"{total.percentile(99):<8.0f} {latency.histograms['dns'].percentile(95):<9.0f} "
+              f"{latency.histograms['connect'].percentile(95):<10.0f} "
+              f"{latency.histograms['ttfb'].percentile(95):<9.0f} {average_kb:<7.1f} КБ")
+    print("=" * 100)
+    print(f"Текущий таймаут запроса: {config.REQUEST_TIMEOUT} с; "
+          f"процентили — верхние границы корзин гистограммы")
+
+
+def _handle_compact_history(raw_days=None, minute_days=None, hour_days=None):
+    config = auth_use_case.rates_updater.config
+    policy = RetentionPolicy(
+        raw_days if raw_days is not None else config.HISTORY_RAW_DAYS,
+        minute_days if minute_days is not None else config.HISTORY_MINUTE_DAYS,
+        hour_days if hour_days is not None else config.HISTORY_HOUR_DAYS)
+    if not policy.raw_days <= policy.minute_days <= policy.hour_days:
+        print("❌ Сроки хранения должны возрастать: raw <= minute <= hour")
+        return
+
+    stats = auth_use_case.rates_updater.storage.compact_history(policy)
+    bars = ", ".join(f"{label}: {count}" for label, count in stats["bars"].items())
+    print(f"🗜️  История сжата за {stats['seconds']:.2f} с")
+    print(f"   Записей: {stats['records_in']} → {stats['records_out']} "
+          f"(повторов курса убрано: {stats['duplicates']})")
+    print(f"   Свечи: {bars}")
+    print(f"   Размер: {stats['bytes_before'] / 1024:,.1f} КБ → {stats['bytes_after'] / 1024:,.1f} КБ")
+    print(f"   Политика: сырые {policy.raw_days:g} дн., 1m до {policy.minute_days:g} дн., "
+          f"1h до {policy.hour_days:g} дн., далее 1d")
+
+
+def _handle_archive_history(codec=None):
+    config = auth_use_case.rates_updater.config
+    storage = auth_use_case.rates_updater.storage
+    stats = storage.seal_history(codec or config.HISTORY_ARCHIVE_CODEC)
+    if not stats["sealed"]:
+        print("📦 Закрытых месяцев в истории нет, архив не изменился")
+    else:
+        print(f"📦 В архив перенесено {stats['sealed']} записей за {stats['seconds']:.2f} с")
+        for segment in stats["segments"]:
+            print(f"   {segment['name']}: {segment['records']} записей, "
+                  f"{segment['raw_bytes'] / 1024:,.1f} КБ → {segment['bytes'] / 1024:,.1f} КБ "
+                  f"({segment['codec']})")
+        print(f"   Файл истории: {stats['bytes_before'] / 1024:,.1f} КБ → "
+              f"{stats['bytes_after'] / 1024:,.1f} КБ, осталось записей: {stats['kept']}")
+    segments = storage.archive.segments()
+    if segments:
+        print(f"   Архив {storage.archive.directory}: сегментов {len(segments)}, "
+              f"записей {sum(segment['records'] for segment in segments)}, "
+              f"{stats['archive_bytes'] / 1024:,.1f} КБ")
+
+
+def _handle_export(dataset, fmt="csv", output=None, date_from=None, date_to=None,
+                   pairs=None, compress=False):
     try:
-        config = ParserConfig()
-        storage = RatesStorage(config.RATES_FILE_PATH,
-                               config.HISTORY_FILE_PATH)
-        data = storage.get_current_rates()
-        pairs = data.get("pairs", {})
-        last_refresh = data.get("last_refresh", "Never")
-        if not pairs:
+        start = parse_timestamp(date_from) if date_from else None
+        end = parse_timestamp(date_to) if date_to else None
+    except ValueError:
+        print("❌ Даты периода — в формате ISO, например 2025-12-01 или 2025-12-01T10:00:00")
+        return
+    pairs = [pair_key.upper() for pair_key in pairs] if pairs else None
+
+    if dataset == "rates":
+        rows = rate_rows(auth_use_case.rates_updater.storage, start, end, pairs)
+    elif dataset == "trades":
+        rows = trade_rows(auth_use_case.ledger, start, end, pairs)
+    elif dataset == "audit":
+        if not Path(AUDIT_LOG).exists():
+            print(f"📭 Журнал действий {AUDIT_LOG} не найден: он пишется, когда "
+                  f"журналирование настроено через logging_config.setup_logging")
+            return
+        rows = audit_rows(AUDIT_LOG, start, end, pairs)
+    else:
+        if start is not None or end is not None:
+            print("ℹ️  Портфели выгружаются на текущий момент, период не учитывается")
+        rows = portfolio_rows(auth_use_case.file_manager, pairs)
+
+    if output is None:
+        output = f"data/export/{dataset}.{fmt}" + (".gz" if compress else "")
+    stats = write_rows(rows, COLUMNS[dataset], output, fmt, compress or None)
+    print(f"📤 Выгружено строк: {stats['rows']} → {stats['path']}")
+    print(f"   {stats['seconds']:.2f} с, {stats['rows_per_second']:,.0f} строк/с, "
+          f"{stats['bytes'] / 1024:,.1f} КБ{' (gzip)' if stats['compressed'] else ''}")
+
+
+def _print_matrix(labels, matrix, cell):
+    print(f"{'':<8}" + "".join(f"{label:>10}" for label in labels))
+    for label, row in zip(labels, matrix):
+        print(f"{label:<8}" + "".join(f"{cell(value):>10}" for value in row))
+
+
+def _handle_market_analytics(window=DEFAULT_WINDOW, step=None, pairs=None, covariance=False):
+    try:
+        window = parse_duration(window)
+        step = parse_duration(step) if step else None
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    pairs = [pair_key.upper().replace("/", "_") for pair_key in pairs] if pairs else None
+
+    analytics = auth_use_case.rates_updater.storage.get_market_analytics(window, step, pairs)
+    if analytics.skipped:
+        print(f"ℹ️  Мало наблюдений за окно: {', '.join(analytics.skipped)}")
+    if len(analytics.pairs) < 1 or analytics.points < 2:
+        print("📭 Недостаточно истории за окно: выполните update-rates или увеличьте --window")
+        return
+
+    # Общая котируемая валюта в подписях не повторяется
+    quotes = {pair_key.partition('_')[2] for pair_key in analytics.pairs}
+    labels = ([pair_key.partition('_')[0] for pair_key in analytics.pairs]
+              if len(quotes) == 1 else analytics.pairs)
+    print(f"📊 Аналитика за {window / 3600:g} ч до {format_timestamp(analytics.end)}: "
+          f"пар {len(analytics.pairs)}, шаг {analytics.step / 60:g} мин, "
+          f"доходностей {analytics.points}")
+    print("=" * 60)
+    print(f"{'Пара':<12} {'Наблюдений':<12} {'Ср. доходн.':<14} {'Волатильность':<14}")
+    print("-" * 60)
+    for i, pair_key in enumerate(analytics.pairs):
+        volatility = analytics.volatility[i]
+        print(f"{pair_key:<12} {analytics.observations[pair_key]:<12} "
+              f"{f'{analytics.mean_returns[i] * 100:+.4f}%':<14} "
+              f"{'n/a' if volatility != volatility else f'{volatility * 100:.4f}%':<14}")
+    print("=" * 60)
+
+    def correlation_cell(value):
+        return "n/a" if value != value else f"{value:+.2f}"
+
+    if len(analytics.pairs) <= _MATRIX_LIMIT:
+        print("Корреляция лог-доходностей:")
+        _print_matrix(labels, analytics.correlation, correlation_cell)
+    else:
+        # Большая матрица не помещается в терминал — самые связанные пары
+        strongest = sorted(
+            ((analytics.correlation[i][j], labels[i], labels[j])
+             for i in range(len(labels)) for j in range(i + 1, len(labels))
+             if analytics.correlation[i][j] == analytics.correlation[i][j]),
+            key=lambda item: -abs(item[0]))[:_MATRIX_LIMIT]
+        print(f"Сильнейшие корреляции (матрица {len(labels)}×{len(labels)}, --pair сужает выбор):")
+        for value, first, second in strongest:
+            print(f"  {first} / {second}: {value:+.3f}")
+    if covariance:
+        print("Ковариация лог-доходностей:")
+        _print_matrix(labels[:_MATRIX_LIMIT], [row[:_MATRIX_LIMIT] for row in
+                                              analytics.covariance[:_MATRIX_LIMIT]],
+                      lambda value: "n/a" if value != value else f"{value:.2e}")
+    print(f"Доходности и волатильность — между узлами сетки с наблюдениями; "
+          f"расчёт {analytics.seconds:.3f} с ({'NumPy' if analytics.vectorized else 'без NumPy'})")
+
+
+def _format_price(price: float) -> str:
+    if price >= 1 or price <= 0:
+        return f"{price:,.4f}"
+    # Малые кросс-курсы — около шести значащих цифр без экспоненты
+    decimals = min(12, 5 - math.floor(math.log10(price)))
+    return f"{price:.{decimals}f}"
+
+
+def _handle_rate_stats(pair=None, rebuild=False):
+    storage = auth_use_case.rates_updater.storage
+    if rebuild:
+        count = storage.rebuild_rate_stats()
+        print(f"📈 Статистики пересчитаны по {count} записям истории, "
+              f"пар: {len(storage.rolling.pairs())}")
+    if not pair:
+        if not rebuild:
+            print("❌ Укажите пару, например: rate-stats BTC_USD")
+        return
+
+    pair_key = pair.upper().replace("/", "_")
+    stats = storage.rolling.get(pair_key)
+    if stats is None:
+        print(f"📭 Статистик для '{pair_key}' нет")
+        available = storage.rolling.pairs()
+        if available:
+            print(f"   Доступные пары: {', '.join(available)}")
+        else:
+            print("   Выполните update-rates или rate-stats --rebuild")
+        return
+
+    print(f"📈 {pair_key}: {_format_price(stats['rate'])} (обновлено {stats['updated_at']})")
+    print("=" * 100)
+    print(f"{'Окно':<6} {'Точек':<7} {'SMA':<16} {'EWMA':<16} {'Мин.':<16} {'Макс.':<16} "
+          f"{'Изм.':<9} {'Волат.':<8}")
+    print("-" * 100)
+    for label, window in stats["windows"].items():
+        if not window["points"]:
+            print(f"{label:<6} {0:<7} нет данных")
+            continue
+        change = f"{window['change_pct']:+.2f}%" if window["change_pct"] is not None else "n/a"
+        volatility = (f"{window['volatility_pct']:.3f}%"
+                      if window["volatility_pct"] is not None else "n/a")
+        print(f"{label:<6} {window['points']:<7} {_format_price(window['sma']):<16} "
+              f"{_format_price(window['ewma']):<16} {_format_price(window['min']):<16} "
+              f"{_format_price(window['max']):<16} {change:<9} {volatility:<8}")
+    print("=" * 100)
+    print("Волатильность — ст. отклонение лог-доходностей между обновлениями; "
+          "окна с точностью до 1/30 длины")
+
+
+def _handle_show_rates(currency=None, top=None, base="USD", sort=None):
+    try:
+        base = base.upper()
+        storage = auth_use_case.rates_updater.storage
+        view = storage.get_rates_view(base)
+        last_refresh = view.last_refresh or "Never"
+        if not view.rows:
+            if storage.get_snapshot().pairs():
+                print(f"Нет курсов с базовой валютой '{base}'.")
+                return
             print("Локальный кеш курсов пуст.")
             print("Выполните 'update-rates', чтобы загрузить данные.")
             return
-        print(f"Rates from cache (updated at {last_refresh}):")
-        print("-" * 40)
-        filtered_pairs = {}
+
+        # --currency — точные коды через запятую, не подстрока пары
+        currencies = None
         if currency:
-            currency = currency.upper()
-            for pair_key, rate_data in pairs.items():
-                if currency in pair_key:
-                    filtered_pairs[pair_key] = rate_data
-            if not filtered_pairs:
-                print(f"Курс для '{currency}' не найден в кеше.")
-                return
-        else:
-            filtered_pairs = pairs
-        sorted_items = sorted(filtered_pairs.items(), key=lambda x: x[0])
-        if top:
-            crypto_items = [(k, v) for k, v in sorted_items if any(
-                crypto in k for crypto in ["BTC", "ETH", "SOL"])]
-            crypto_items.sort(key=lambda x: x[1]["rate"], reverse=True)
-            sorted_items = crypto_items[:top]
-        for pair_key, rate_data in sorted_items:
-            rate = rate_data["rate"]
-            source = rate_data["source"]
-            updated = rate_data["updated_at"]
-            print(
-                f"- {pair_key}: {rate:,.4f}  (source: {source}, updated: {updated})")
+            currencies = [code.strip().upper() for code in currency.split(",") if code.strip()]
+            missing = view.missing(currencies)
+            if missing:
+                print(f"Курс для '{', '.join(missing)}' не найден в кеше.")
+                if len(missing) == len(currencies):
+                    return
+
+        # Без --sort топ ранжируется по капитализации, как раньше
+        sort = sort or ("mcap" if top else "code")
+        rows = view.select(sort, currencies, top)
+        if not rows and sort == "mcap":
+            print("ℹ️  Капитализация в кеше не загружена, топ по цене")
+            sort = "price"
+            rows = view.select(sort, currencies, top)
+
+        print(f"Rates from cache (updated at {last_refresh}), base {base}, sorted by {sort}:")
+        print("-" * 40)
+        for row in rows:
+            change = f"{row.change_pct:+.2f}% 24h" if row.change_pct is not None else "n/a 24h"
+            details = [change]
+            if row.market_cap > 0 and sort == "mcap":
+                details.append(f"mcap: {row.market_cap:,.0f}")
+            if row.path.startswith("via"):
+                details.append(row.path)
+            details.append(f"source: {row.source}")
+            details.append(f"updated: {row.updated_at}")
+            print(f"- {row.code}_{base}: {_format_price(row.price)}  ({', '.join(details)})")
         print("-" * 40)
-        print(f"Total pairs: {len(sorted_items)}")
+        print(f"Total pairs: {len(rows)}")
     except Exception as e:
         print(f"Ошибка при получении курсов: {e}")
         print("Выполните 'update-rates' для обновления данных.")
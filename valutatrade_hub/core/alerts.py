@@ -0,0 +1,268 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from ..infra.locking import FileLock
+from ..infra.serialization import dump
+
+logger = logging.getLogger("valutatrade")
+
+ABOVE = "above"
+BELOW = "below"
+
+
+class Alert:
+    """Одноразовое оповещение: пара пересекла порог в заданную сторону"""
+
+    __slots__ = ('alert_id', 'user_id', 'pair', 'direction', 'threshold', 'created_at')
+
+    def __init__(self, alert_id: int, user_id: int, pair: str, direction: str,
+                 threshold: float, created_at: str):
+        self.alert_id = alert_id
+        self.user_id = user_id
+        self.pair = pair
+        self.direction = direction
+        self.threshold = threshold
+        self.created_at = created_at
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Alert":
+        return cls(data["alert_id"], data["user_id"], data["pair"],
+                   data["direction"], data["threshold"], data["created_at"])
+
+    def to_dict(self) -> Dict:
+        return {
+            "alert_id": self.alert_id,
+            "user_id": self.user_id,
+            "pair": self.pair,
+            "direction": self.direction,
+            "threshold": self.threshold,
+            "created_at": self.created_at
+        }
+
+    def describe(self) -> str:
+        sign = ">" if self.direction == ABOVE else "<"
+        return f"{self.pair} {sign} {self.threshold:g}"
+
+
+class AlertSink(ABC):
+    """Получатель сработавших оповещений"""
+
+    @abstractmethod
+    def emit(self, alert: Alert, previous: float, current: float):
+        pass
+
+
+class LogAlertSink(AlertSink):
+
+    def emit(self, alert: Alert, previous: float, current: float):
+        logger.info(f"ALERT #{alert.alert_id} user_id={alert.user_id} "
+                    f"{alert.describe()}: {previous} -> {current}")
+
+
+class FileAlertSink(AlertSink):
+    """Дописывает сработавшие оповещения в NDJSON-файл"""
+
+    def __init__(self, path="data/alerts_fired.ndjson"):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+    def emit(self, alert: Alert, previous: float, current: float):
+        record = alert.to_dict()
+        record.update({
+            "previous_rate": previous,
+            "rate": current,
+            "fired_at": datetime.utcnow().isoformat() + "Z"
+        })
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class CallbackAlertSink(AlertSink):
+
+    def __init__(self, callback: Callable[[Alert, float, float], None]):
+        self.callback = callback
+
+    def emit(self, alert: Alert, previous: float, current: float):
+        self.callback(alert, previous, current)
+
+
+class _PairBook:
+    """Пороги одной пары: два списка (порог, id), отсортированные по возрастанию.
+
+    При движении курса old -> new срабатывают только пороги внутри
+    отрезка [old, new], их границы находятся двумя бинарными поисками.
+    """
+
+    __slots__ = ('above', 'below')
+
+    def __init__(self):
+        self.above = []
+        self.below = []
+
+    def add(self, alert: Alert):
+        insort(self.above if alert.direction == ABOVE else self.below,
+               (alert.threshold, alert.alert_id))
+
+    def remove(self, alert: Alert) -> bool:
+        keys = self.above if alert.direction == ABOVE else self.below
+        key = (alert.threshold, alert.alert_id)
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+            return True
+        return False
+
+    def crossed(self, previous: float, current: float) -> List[int]:
+        if current > previous:
+            # Рост: previous <= порог < current
+            keys = self.above
+            lo = bisect_left(keys, (previous, float('-inf')))
+            hi = bisect_left(keys, (current, float('-inf')))
+        elif current < previous:
+            # Падение: current < порог <= previous
+            keys = self.below
+            lo = bisect_right(keys, (current, float('inf')))
+            hi = bisect_right(keys, (previous, float('inf')))
+        else:
+            return []
+        fired = [alert_id for _, alert_id in keys[lo:hi]]
+        del keys[lo:hi]
+        return fired
+
+    def __len__(self):
+        return len(self.above) + len(self.below)
+
+
+class AlertEngine:
+    """Реестр оповещений с проверкой только пересечённых порогов.
+
+    Активные оповещения хранятся в data/alerts.json; файл перечитывается,
+    если его изменил другой процесс.
+    """
+
+    def __init__(self, path="data/alerts.json", sinks: Optional[List[AlertSink]] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.sinks = list(sinks or [])
+        self._alerts: Dict[int, Alert] = {}
+        self._books: Dict[str, _PairBook] = {}
+        self._next_id = 1
+        self._mtime = None
+        self._lock = FileLock(self.path)
+
+    def add_sink(self, sink: AlertSink):
+        self.sinks.append(sink)
+
+    def _file_mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+
+        alerts = [Alert.from_dict(item) for item in data.get("alerts", [])]
+        self._alerts = {alert.alert_id: alert for alert in alerts}
+        self._next_id = data.get("next_id", max(self._alerts, default=0) + 1)
+
+        # Сортировка один раз на пару вместо вставки по одному
+        books: Dict[str, _PairBook] = {}
+        for alert in alerts:
+            book = books.get(alert.pair)
+            if book is None:
+                book = books[alert.pair] = _PairBook()
+            keys = book.above if alert.direction == ABOVE else book.below
+            keys.append((alert.threshold, alert.alert_id))
+        for book in books.values():
+            book.above.sort()
+            book.below.sort()
+        self._books = books
+        self._mtime = mtime
+
+    def _save(self):
+        data = {
+            "next_id": self._next_id,
+            "alerts": [alert.to_dict() for alert in self._alerts.values()]
+        }
+        temp_file = self.path.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            dump(data, f)
+        temp_file.replace(self.path)
+        self._mtime = self._file_mtime()
+
+    def add(self, user_id: int, pair: str, direction: str, threshold: float) -> Alert:
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f"Направление должно быть '{ABOVE}' или '{BELOW}'")
+        if threshold <= 0:
+            raise ValueError("Порог должен быть положительным числом")
+        with self._lock:
+            self._refresh()
+            alert = Alert(self._next_id, user_id, pair, direction, float(threshold),
+                          datetime.utcnow().isoformat() + "Z")
+            self._next_id += 1
+            self._alerts[alert.alert_id] = alert
+            book = self._books.get(pair)
+            if book is None:
+                book = self._books[pair] = _PairBook()
+            book.add(alert)
+            self._save()
+        return alert
+
+    def remove(self, user_id: int, alert_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            alert = self._alerts.get(alert_id)
+            if alert is None or alert.user_id != user_id:
+                return False
+            self._books[alert.pair].remove(alert)
+            del self._alerts[alert_id]
+            self._save()
+        return True
+
+    def user_alerts(self, user_id: int) -> List[Alert]:
+        with self._lock:
+            self._refresh()
+            alerts = [alert for alert in self._alerts.values() if alert.user_id == user_id]
+        return sorted(alerts, key=lambda alert: alert.alert_id)
+
+    def evaluate(self, previous: Dict[str, float], current: Dict[str, float]) -> List[Alert]:
+        """Находит и отправляет получателям оповещения, пересечённые при
+        переходе курсов previous -> current; сработавшие удаляются"""
+        fired = []
+        with self._lock:
+            self._refresh()
+            for pair, rate in current.items():
+                old = previous.get(pair)
+                book = self._books.get(pair)
+                if old is None or book is None or not book:
+                    continue
+                for alert_id in book.crossed(old, rate):
+                    fired.append((self._alerts.pop(alert_id), old, rate))
+            if fired:
+                self._save()
+
+        # Получатели вызываются вне блокировки: медленный sink не держит реестр
+        for alert, old, rate in fired:
+            for sink in self.sinks:
+                try:
+                    sink.emit(alert, old, rate)
+                except Exception as e:
+                    logger.error(f"Ошибка отправки оповещения #{alert.alert_id}: {e}")
+        return [alert for alert, _, _ in fired]
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._alerts)
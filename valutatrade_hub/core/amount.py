@@ -0,0 +1,120 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+
+# Суммы хранятся целым числом минимальных единиц валюты (центы, сатоши),
+# точность берётся из реестра валют. Курсы для целочисленных расчётов
+# переводятся в фиксированную точку с 18 знаками после запятой.
+RATE_DIGITS = 18
+RATE_SCALE = 10 ** RATE_DIGITS
+
+_POW10 = tuple(10 ** digits for digits in range(RATE_DIGITS + 1))
+
+
+def to_units(value, precision: int, strict: bool = False) -> int:
+    """Переводит число в минимальные единицы без потерь двоичной записи"""
+    if isinstance(value, int):
+        return value * _POW10[precision]
+    # repr даёт кратчайшую десятичную запись float, поэтому 0.1 остаётся 0.1,
+    # а накопленный дрейф вида 0.19999999999999998 округляется до точности валюты
+    decimal_value = Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
+    scaled = decimal_value.scaleb(precision)
+    units = int(scaled.quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+    if strict and units != scaled:
+        raise ValueError(f'Сумма {value} точнее {precision} знаков после запятой!')
+    return units
+
+
+def from_units(units: int, precision: int) -> float:
+    return units / _POW10[precision]
+
+
+def format_units(units: int, precision: int) -> str:
+    sign = '-' if units < 0 else ''
+    whole, frac = divmod(abs(units), _POW10[precision])
+    if not precision:
+        return f"{sign}{whole}"
+    return f"{sign}{whole}.{frac:0{precision}d}"
+
+
+def rate_to_fixed(rate: float) -> int:
+    return to_units(rate, RATE_DIGITS)
+
+
+def _div_half_even(numerator: int, denominator: int) -> int:
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient & 1):
+        quotient += 1
+    return quotient
+
+
+def convert_units(units: int, from_precision: int, rate_fixed: int, to_precision: int) -> int:
+    """Целочисленная конвертация суммы по курсу в фиксированной точке"""
+    return _div_half_even(units * rate_fixed * _POW10[to_precision],
+                          _POW10[from_precision] * RATE_SCALE)
+
+
+def sum_units(amounts) -> int:
+    # Точная сумма: целые складываются без накопления ошибки
+    return sum(amounts, 0)
+
+
+class Amount:
+    __slots__ = ('_units', '_precision')
+
+    def __init__(self, units: int, precision: int):
+        if not isinstance(units, int):
+            raise TypeError('Сумма должна храниться целым числом единиц!')
+        self._units = units
+        self._precision = precision
+
+    @classmethod
+    def from_number(cls, value, precision: int) -> "Amount":
+        return cls(to_units(value, precision), precision)
+
+    @property
+    def units(self) -> int:
+        return self._units
+
+    @property
+    def precision(self) -> int:
+        return self._precision
+
+    def to_float(self) -> float:
+        return from_units(self._units, self._precision)
+
+    def convert(self, rate: float, to_precision: int) -> "Amount":
+        return Amount(convert_units(self._units, self._precision,
+                                    rate_to_fixed(rate), to_precision), to_precision)
+
+    def _check(self, other: "Amount"):
+        if self._precision != other._precision:
+            raise ValueError('Нельзя складывать суммы с разной точностью!')
+
+    def __add__(self, other: "Amount") -> "Amount":
+        self._check(other)
+        return Amount(self._units + other._units, self._precision)
+
+    def __sub__(self, other: "Amount") -> "Amount":
+        self._check(other)
+        return Amount(self._units - other._units, self._precision)
+
+    def __eq__(self, other):
+        if not isinstance(other, Amount):
+            return NotImplemented
+        return self._units == other._units and self._precision == other._precision
+
+    def __lt__(self, other: "Amount"):
+        self._check(other)
+        return self._units < other._units
+
+    def __hash__(self):
+        return hash((self._units, self._precision))
+
+    def __float__(self):
+        return self.to_float()
+
+    def __str__(self):
+        return format_units(self._units, self._precision)
+
+    def __repr__(self):
+        return f"Amount('{self}')"
@@ -1,12 +1,21 @@
+import json
+import threading
+from pathlib import Path
 from .exceptions import CurrencyNotFoundError
 from abc import ABC, abstractmethod
 
 
 class Currency(ABC):
-    def __init__(self, name: str, code: str):
+    __slots__ = ('_name', '_code', '_currency_id', '_precision')
+
+    def __init__(self, name: str, code: str, precision: int = 2):
         self._validate_code(code)
         self._validate_name(name)
         self._name = name
+        # Число знаков после запятой для сумм в минимальных единицах
+        self._precision = precision
+        # Индекс валюты в реестре, назначается при регистрации
+        self._currency_id = -1
 
     def _validate_code(self, code: str):
         code_c = code.replace(' ', '').upper()
@@ -33,14 +42,33 @@ class Currency(ABC):
     def code(self):
         return self._code
 
+    @property
+    def currency_id(self) -> int:
+        return self._currency_id
+
+    @property
+    def precision(self) -> int:
+        return self._precision
+
+    @property
+    @abstractmethod
+    def kind(self) -> str:
+        pass
+
     @abstractmethod
     def get_display_info(self) -> str:
         pass
 
+    def __repr__(self):
+        return f"{type(self).__name__}('{self._code}')"
+
 
 class FiatCurrency(Currency):
-    def __init__(self, name: str, code: str, issuing_country: str):
-        super().__init__(name, code)
+    __slots__ = ('_issuing_country',)
+    kind = 'fiat'
+
+    def __init__(self, name: str, code: str, issuing_country: str, precision: int = 2):
+        super().__init__(name, code, precision)
         self._issuing_country = issuing_country
 
     @property
@@ -52,10 +80,19 @@ class FiatCurrency(Currency):
 
 
 class CryptoCurrency(Currency):
-    def __init__(self, name: str, code: str, algorithm: str, market_cap: float = 0.0):
-        super().__init__(name, code)
+    __slots__ = ('_algorithm', '_market_cap', '_coingecko_id')
+    kind = 'crypto'
+
+    def __init__(self, name: str, code: str, algorithm: str, market_cap: float = 0.0,
+                 precision: int = 8, coingecko_id: str = None):
+        super().__init__(name, code, precision)
         self._algorithm = algorithm
         self._market_cap = market_cap
+        self._coingecko_id = coingecko_id
+
+    @property
+    def coingecko_id(self):
+        return self._coingecko_id
 
     @property
     def algorithm(self):
@@ -65,22 +102,146 @@ class CryptoCurrency(Currency):
     def market_cap(self):
         return self._market_cap
 
+    @market_cap.setter
+    def market_cap(self, value: float):
+        if value < 0:
+            raise ValueError("Капитализация не может быть отрицательной")
+        self._market_cap = float(value)
+
     def get_display_info(self) -> str:
         return f"[CRYPTO] {self.code} — {self.name} (Algo: {self.algorithm}, MCAP: {self.market_cap:,.2f})"
 
 
-KNOWN_CURRENCIES = {
-    "USD": FiatCurrency("US Dollar", "USD", "United States"),
-    "EUR": FiatCurrency("Euro", "EUR", "Eurozone"),
-    "RUB": FiatCurrency("Russian Ruble", "RUB", "Russia",),
-    "BTC": CryptoCurrency("Bitcoin", "BTC", "SHA-256", 1120000000000),
-    "ETH": CryptoCurrency("Ethereum", "ETH", "Ethash", 372000000000),
-    "SCR": FiatCurrency("Сейшельская рупия", 'SCR', 'Сейшелы')
-}
+class CurrencyRegistry:
+    """Единый реестр валют: id, точность, вид и таблица псевдонимов"""
+
+    __slots__ = ('_by_id', '_by_code', '_aliases', '_fallback_rates', '_lock')
+
+    def __init__(self):
+        self._by_id = []
+        self._by_code = {}
+        # Псевдоним в любом написании -> объект валюты, заполняется
+        # заранее, чтобы поиск был одним обращением к словарю
+        self._aliases = {}
+        self._fallback_rates = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path) -> "CurrencyRegistry":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        registry = cls()
+        for entry in data.get('currencies', []):
+            registry.register(_currency_from_entry(entry), entry.get('aliases', ()),
+                              entry.get('fallback_rate'))
+        return registry
+
+    def register(self, currency: Currency, aliases=(), fallback_rate=None) -> Currency:
+        with self._lock:
+            existing = self._by_code.get(currency.code)
+            if existing is not None:
+                return existing
+            currency._currency_id = len(self._by_id)
+            self._by_id.append(currency)
+            self._by_code[currency.code] = currency
+            for alias in (currency.code, *aliases):
+                for variant in (alias, alias.lower(), alias.capitalize(),
+                                _normalize(alias)):
+                    self._aliases.setdefault(variant, currency)
+            if fallback_rate is not None:
+                self._fallback_rates[currency.code] = fallback_rate
+            return currency
+
+    def ensure(self, code: str, kind: str = 'fiat', name: str = None) -> Currency:
+        """Возвращает валюту из реестра, при отсутствии регистрирует её"""
+        currency = self._by_code.get(code)
+        if currency is not None:
+            return currency
+        if kind == 'crypto':
+            currency = CryptoCurrency(name or code, code, '—')
+        else:
+            currency = FiatCurrency(name or code, code, '—')
+        return self.register(currency)
+
+    def get(self, code: str) -> Currency:
+        currency = self._aliases.get(code)
+        if currency is None and isinstance(code, str):
+            # Нормализация только для редких написаний вне таблицы
+            currency = self._aliases.get(_normalize(code))
+        if currency is None:
+            raise CurrencyNotFoundError(code)
+        return currency
+
+    def find(self, code: str):
+        try:
+            return self.get(code)
+        except CurrencyNotFoundError:
+            return None
+
+    def by_id(self, currency_id: int) -> Currency:
+        return self._by_id[currency_id]
+
+    def codes(self, kind: str = None) -> tuple:
+        return tuple(currency.code for currency in self._by_id
+                     if kind is None or currency.kind == kind)
+
+    def fallback_rates(self) -> dict:
+        return dict(self._fallback_rates)
+
+    @property
+    def by_code(self) -> dict:
+        return self._by_code
+
+    def __contains__(self, code):
+        return self.find(code) is not None
+
+    def __iter__(self):
+        return iter(tuple(self._by_id))
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+def _normalize(code: str) -> str:
+    return code.replace(' ', '').upper()
+
+
+def _currency_from_entry(entry: dict) -> Currency:
+    precision = entry.get('precision', 2)
+    if entry.get('kind') == 'crypto':
+        return CryptoCurrency(entry['name'], entry['code'], entry.get('algorithm', '—'),
+                              entry.get('market_cap', 0.0), precision,
+                              entry.get('coingecko_id'))
+    return FiatCurrency(entry['name'], entry['code'],
+                        entry.get('issuing_country', '—'), precision)
+
+
+REGISTRY_FILE_PATH = Path(__file__).with_name('currencies.json')
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> CurrencyRegistry:
+    # Реестр читается из файла при первом обращении
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CurrencyRegistry.from_file(REGISTRY_FILE_PATH)
+    return _registry
+
+
+def __getattr__(name):
+    # Совместимость со старым словарём KNOWN_CURRENCIES
+    if name == 'KNOWN_CURRENCIES':
+        return get_registry().by_code
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_currency(code: str) -> Currency:
-    code_clean = code.replace(' ', '').upper()
-    if code_clean in KNOWN_CURRENCIES:
-        return KNOWN_CURRENCIES[code_clean]
-    raise CurrencyNotFoundError(code)
+    return get_registry().get(code)
+
+
+def get_currency_by_id(currency_id: int) -> Currency:
+    return get_registry().by_id(currency_id)
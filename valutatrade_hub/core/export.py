@@ -0,0 +1,151 @@
+"""Выгрузка истории курсов, журнала сделок, журнала действий и портфелей
+в CSV или NDJSON.
+
+Строки идут генераторами от хранилища до файла: история читается через
+RatesStorage.iter_history (сегменты архива вне диапазона и без нужных пар
+не распаковываются), журналы сделок и действий — построчно, портфели —
+поэлементно из portfolios.json. Память не зависит от объёма данных.
+"""
+import csv
+import gzip
+import json
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+from ..parser_service.history import parse_timestamp
+from ..infra.serialization import COMPACT_SEPARATORS
+
+FORMATS = ("csv", "ndjson")
+
+COLUMNS = {
+    "rates": ("timestamp", "from_currency", "to_currency", "rate", "source",
+              "interval", "open", "high", "low", "close", "count"),
+    "trades": ("user_id", "trade_id", "timestamp", "side", "currency", "amount",
+               "rate", "value", "base"),
+    "portfolios": ("user_id", "currency", "balance", "version"),
+    "audit": ("timestamp", "action", "user", "currency", "amount", "result",
+              "error_type", "error_message"),
+}
+
+AUDIT_LOG = "logs/actions.log"
+
+# Строка log_action, с префиксом форматтера logging_config или без него
+_AUDIT_LINE = re.compile(
+    r"(?P<timestamp>\d{4}-\d\d-\d\dT[\d:.]+) (?P<action>[A-Z_]+) "
+    r"user='(?P<user>[^']*)' currency='(?P<currency>[^']*)' amount=(?P<amount>\S+) "
+    r"result=(?P<result>[A-Z]+)"
+    r"(?: error_type=(?P<error_type>\S+) error_message=(?P<error_message>.*))?$")
+
+DATASETS = tuple(COLUMNS)
+
+
+def rate_rows(storage, start: Optional[float] = None, end: Optional[float] = None,
+              pairs: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+    return storage.iter_history(start, end, pairs)
+
+
+def trade_rows(ledger, start: Optional[float] = None, end: Optional[float] = None,
+               pairs: Optional[Sequence[str]] = None,
+               user_ids: Optional[Iterable[int]] = None) -> Iterator[Dict]:
+    pairs = None if pairs is None else set(pairs)
+    for user_id in (ledger.user_ids() if user_ids is None else user_ids):
+        for trade in ledger.iter_trades(user_id):
+            if pairs is not None and f"{trade['currency']}_{trade['base']}" not in pairs:
+                continue
+            if start is not None or end is not None:
+                moment = parse_timestamp(trade["timestamp"])
+                if start is not None and moment < start:
+                    continue
+                # Журнал дописывается по времени: дальше только более новые
+                if end is not None and moment > end:
+                    break
+            row = {"user_id": user_id}
+            row.update(trade)
+            yield row
+
+
+def portfolio_rows(file_manager, pairs: Optional[Sequence[str]] = None,
+                   user_ids: Optional[Iterable[int]] = None) -> Iterator[Dict]:
+    # Для портфелей фильтр пар — фильтр по валюте кошелька
+    currencies = None if pairs is None else {pair_key.split('_')[0] for pair_key in pairs}
+    user_ids = None if user_ids is None else set(user_ids)
+    for portfolio in file_manager.iter_json('portfolios.json'):
+        if user_ids is not None and portfolio['user_id'] not in user_ids:
+            continue
+        for code, balance in (portfolio.get('wallets') or {}).items():
+            if currencies is not None and code not in currencies:
+                continue
+            yield {"user_id": portfolio['user_id'], "currency": code,
+                   "balance": balance, "version": portfolio.get('version', 0)}
+
+
+def audit_rows(path=AUDIT_LOG, start: Optional[float] = None, end: Optional[float] = None,
+               pairs: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+    """Действия пользователей из журнала log_action (REGISTER, LOGIN, BUY, ...).
+
+    Прочие сообщения журнала пропускаются. Время в журнале — локальное
+    время процесса без зоны, для --from/--to оно считается UTC. Фильтр пар —
+    по валюте действия; действия без валюты при нём не выгружаются.
+    """
+    currencies = None if pairs is None else {pair_key.split('_')[0] for pair_key in pairs}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = _AUDIT_LINE.search(line.rstrip("\n"))
+            if match is None:
+                continue
+            row = match.groupdict()
+            if currencies is not None and row["currency"] not in currencies:
+                continue
+            if start is not None or end is not None:
+                # Процессы пишут журнал вперемешку: без раннего выхода
+                moment = parse_timestamp(row["timestamp"])
+                if (start is not None and moment < start) or (end is not None and moment > end):
+                    continue
+            yield row
+
+
+def _open_output(path: Path, compress: bool):
+    path.parent.mkdir(exist_ok=True, parents=True)
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_rows(rows: Iterable[Dict], columns: Sequence[str], path, fmt: str = "csv",
+               compress: Optional[bool] = None) -> Dict:
+    """Пишет строки в файл; compress по умолчанию — по расширению .gz.
+
+    Во временный файл, затем os.replace: прерванная выгрузка не оставляет
+    обрезанного файла на месте предыдущей.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    path = Path(path)
+    compress = path.suffix == ".gz" if compress is None else compress
+    temp_file = path.with_name(path.name + ".tmp")
+    started = time.perf_counter()
+    count = 0
+    try:
+        with _open_output(temp_file, compress) as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    f.write(json.dumps({column: row.get(column) for column in columns
+                                        if column in row},
+                                       separators=COMPACT_SEPARATORS, ensure_ascii=False))
+                    f.write("\n")
+                    count += 1
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+    temp_file.replace(path)
+    seconds = time.perf_counter() - started
+    return {"rows": count, "seconds": seconds, "bytes": path.stat().st_size,
+            "rows_per_second": count / seconds if seconds > 0 else 0.0,
+            "path": str(path), "compressed": compress}
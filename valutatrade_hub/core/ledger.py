@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+from .amount import convert_units, rate_to_fixed, from_units, format_units, to_units
+from .currencies import get_currency
+from ..parser_service.history import parse_timestamp
+from ..infra.locking import FileLock
+from ..infra.serialization import dump
+
+_TAIL_BLOCK = 8192
+
+
+class Position:
+    """Накопленные показатели по одной валюте пользователя.
+
+    Количество хранится в минимальных единицах валюты, стоимость покупки
+    и реализованный P&L — в минимальных единицах базовой валюты (USD),
+    поэтому обновление после сделки точное и занимает O(1).
+    """
+
+    __slots__ = ('currency', 'quantity', 'cost', 'realized')
+
+    def __init__(self, currency: str, quantity: int = 0, cost: int = 0, realized: int = 0):
+        self.currency = currency
+        self.quantity = quantity
+        self.cost = cost
+        self.realized = realized
+
+    def apply_buy(self, quantity: int, cost: int):
+        self.quantity += quantity
+        self.cost += cost
+
+    def apply_sell(self, quantity: int, proceeds: int):
+        # Списываемая себестоимость пропорциональна проданной доле позиции.
+        # Остаток, купленный до появления журнала, не имеет цены покупки
+        # и в P&L не учитывается.
+        sold = min(quantity, self.quantity)
+        if sold <= 0:
+            return
+        released = self.cost * sold // self.quantity
+        self.quantity -= sold
+        self.cost -= released
+        self.realized += proceeds * sold // quantity - released
+
+    def average_cost(self, precision: int, base_precision: int) -> float:
+        if not self.quantity:
+            return 0.0
+        return (from_units(self.cost, base_precision)
+                / from_units(self.quantity, precision))
+
+    def to_list(self) -> list:
+        return [self.quantity, self.cost, self.realized]
+
+
+class TradeLedger:
+    """Журнал сделок: по файлу на пользователя, только дозапись.
+
+    data/ledger/<user_id>.trades.ndjson — по сделке на строку;
+    data/ledger/<user_id>.positions.json — агрегаты по валютам и счётчик сделок.
+    """
+
+    def __init__(self, base_dir="data/ledger", base_currency: str = "USD"):
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(exist_ok=True, parents=True)
+        self.base_currency = base_currency
+        self._locks: Dict[int, FileLock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _user_lock(self, user_id: int) -> FileLock:
+        with self._locks_guard:
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = self._locks[user_id] = FileLock(self._positions_path(user_id))
+            return lock
+
+    def _trades_path(self, user_id: int) -> Path:
+        return self.base_dir / f"{user_id}.trades.ndjson"
+
+    def _positions_path(self, user_id: int) -> Path:
+        return self.base_dir / f"{user_id}.positions.json"
+
+    def _load_state(self, user_id: int) -> dict:
+        try:
+            with open(self._positions_path(user_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"trades_count": 0, "positions": {}}
+
+    def _save_state(self, user_id: int, state: dict):
+        path = self._positions_path(user_id)
+        temp_file = path.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            dump(state, f)
+        temp_file.replace(path)
+
+    def get_positions(self, user_id: int) -> Dict[str, Position]:
+        state = self._load_state(user_id)
+        return {code: Position(code, *values)
+                for code, values in state["positions"].items()}
+
+    def trades_count(self, user_id: int) -> int:
+        return self._load_state(user_id)["trades_count"]
+
+    def record(self, user_id: int, side: str, currency: str, quantity: int, rate: float) -> dict:
+        """Дописывает сделку в журнал и обновляет агрегат позиции"""
+        traded = get_currency(currency)
+        base = get_currency(self.base_currency)
+        value = convert_units(quantity, traded.precision, rate_to_fixed(rate), base.precision)
+
+        with self._user_lock(user_id):
+            state = self._load_state(user_id)
+            position = Position(traded.code, *state["positions"].get(traded.code, ()))
+            if side == "buy":
+                position.apply_buy(quantity, value)
+            else:
+                position.apply_sell(quantity, value)
+
+            state["trades_count"] += 1
+            trade = {
+                "trade_id": state["trades_count"],
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "side": side,
+                "currency": traded.code,
+                "amount": format_units(quantity, traded.precision),
+                "rate": rate,
+                "value": format_units(value, base.precision),
+                "base": base.code
+            }
+
+            with open(self._trades_path(user_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(trade, ensure_ascii=False) + "\n")
+
+            state["positions"][traded.code] = position.to_list()
+            self._save_state(user_id, state)
+        return trade
+
+    def user_ids(self) -> List[int]:
+        """Пользователи, у которых есть журнал сделок"""
+        user_ids = []
+        for path in self.base_dir.glob("*.trades.ndjson"):
+            prefix = path.name.split(".", 1)[0]
+            if prefix.isdigit():
+                user_ids.append(int(prefix))
+        return sorted(user_ids)
+
+    def iter_trades(self, user_id: int) -> Iterator[dict]:
+        """Сделки от старых к новым, по строке журнала"""
+        try:
+            f = open(self._trades_path(user_id), 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_reverse(self, user_id: int) -> Iterator[dict]:
+        """Сделки от новых к старым; файл читается блоками с конца"""
+        try:
+            f = open(self._trades_path(user_id), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            position = f.seek(0, os.SEEK_END)
+            remainder = b""
+            while position > 0:
+                step = min(_TAIL_BLOCK, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + remainder).split(b"\n")
+                remainder = lines[0]
+                for line in reversed(lines[1:]):
+                    if line.strip():
+                        yield json.loads(line)
+            if remainder.strip():
+                yield json.loads(remainder)
+
+    def holdings_at(self, user_id: int, current: Dict[str, int],
+                    moments: Sequence[float]) -> List[Dict[str, int]]:
+        """Остатки на каждый из отсортированных моментов.
+
+        От текущих балансов откатываются сделки новее момента, журнал
+        читается с конца и только до самого раннего запрошенного момента.
+        """
+        result = [None] * len(moments)
+        holdings = dict(current)
+        i = len(moments) - 1
+        for trade in self.iter_reverse(user_id):
+            executed_at = parse_timestamp(trade["timestamp"])
+            while i >= 0 and moments[i] >= executed_at:
+                result[i] = dict(holdings)
+                i -= 1
+            if i < 0:
+                break
+            code = trade["currency"]
+            units = to_units(trade["amount"], get_currency(code).precision)
+            change = -units if trade["side"] == "buy" else units
+            holdings[code] = holdings.get(code, 0) + change
+        while i >= 0:
+            result[i] = dict(holdings)
+            i -= 1
+        return result
+
+    def tail(self, user_id: int, limit: int = 20, offset: int = 0) -> List[dict]:
+        trades = []
+        for i, trade in enumerate(self.iter_reverse(user_id)):
+            if i < offset:
+                continue
+            if len(trades) >= limit:
+                break
+            trades.append(trade)
+        return trades
@@ -1,9 +1,16 @@
 import secrets
 import hashlib
+from array import array
 from datetime import datetime
+from .amount import Amount, to_units, from_units, format_units
+from .currencies import get_currency, get_currency_by_id
+from .exceptions import InsufficientFundsError
 
 
 class User:
+    __slots__ = ('_user_id', '_username', '_salt',
+                 '_hashed_password', '_registration_date')
+
     def __init__(self, user_id: int, username: str, password: str):
         self._user_id = user_id
         self._username = username
@@ -11,6 +18,19 @@ class User:
         self._hashed_password = self._hash_password(password)
         self._registration_date = datetime.now()
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "User":
+        # Восстановление из users.json без повторного хеширования пароля
+        user = cls.__new__(cls)
+        user._user_id = data['user_id']
+        user._username = data['username']
+        user._salt = data['salt']
+        user._hashed_password = data['hashed_password']
+        registration_date = data.get('registration_date')
+        user._registration_date = (datetime.fromisoformat(registration_date)
+                                   if registration_date else datetime.now())
+        return user
+
     def _generate_salt(self):
         return secrets.token_hex(8)
 
@@ -73,13 +93,31 @@ class User:
 
 
 class Wallet:
+    # Кошелёк хранит не число, а ссылку на ячейку массива балансов
+    # в минимальных единицах валюты (array('q')). Отдельный кошелёк владеет
+    # массивом из одного элемента, кошелёк из портфеля смотрит прямо в
+    # массив портфеля.
+    __slots__ = ('currency_code', '_store', '_idx', '_precision')
+
     def __init__(self, code: str, balance: float = 0.0):
-        self._balance = balance
         self.currency_code = code
+        self._store = array('q', [0])
+        self._idx = 0
+        self._precision = get_currency(code).precision
+        self.balance = balance
+
+    @classmethod
+    def _bound(cls, currency, store: array) -> "Wallet":
+        wallet = cls.__new__(cls)
+        wallet.currency_code = currency.code
+        wallet._store = store
+        wallet._idx = currency.currency_id
+        wallet._precision = currency.precision
+        return wallet
 
     @property
     def balance(self):
-        return self._balance
+        return from_units(self._store[self._idx], self._precision)
 
     @balance.setter
     def balance(self, value: float):
@@ -88,58 +126,144 @@ class Wallet:
 
         if value < 0:
             raise ValueError('Баланс не может быть отрицальным!')
-        self._balance = float(value)
+        self._store[self._idx] = to_units(value, self._precision)
+
+    @property
+    def units(self) -> int:
+        return self._store[self._idx]
+
+    @property
+    def amount(self) -> Amount:
+        return Amount(self._store[self._idx], self._precision)
 
     def deposit(self, a: float):
         if not isinstance(a, (float, int)):
             raise TypeError('Депозит должен быть числом!')
         if a <= 0:
             raise ValueError('Депозит не может быть отрицальным!')
-        self._balance += a
+        self.deposit_units(to_units(a, self._precision, strict=True))
 
     def withdraw(self, a: float):
         if not isinstance(a, (float, int)):
             raise TypeError('Сумма снятия должена быть числом!')
         if a <= 0:
             raise ValueError('Сумма снятия должна быть положительная!')
-        self._balance -= a
-        if a > self._balance:
-            raise ValueError('Недостаточно средств!')
+        self.withdraw_units(to_units(a, self._precision, strict=True))
+
+    def deposit_units(self, units: int):
+        self._store[self._idx] += units
+
+    def withdraw_units(self, units: int):
+        balance = self._store[self._idx]
+        if units > balance:
+            raise InsufficientFundsError(
+                self.currency_code, format_units(balance, self._precision),
+                format_units(units, self._precision))
+        self._store[self._idx] = balance - units
 
     def get_balance_info(self):
-        return f'{self.currency_code}:{self._balance}'
+        return f'{self.currency_code}:{format_units(self.units, self._precision)}'
 
     def __repr__(self):
         return f"Wallet('{self.currency_code}', {self.balance})"
 
 
 class Portfolio:
+    # Балансы лежат в array('q') минимальных единиц, индекс ячейки — id
+    # валюты в реестре. Ширина массива равна максимальному id среди
+    # открытых кошельков + 1, набор открытых кошельков — битовая маска
+    # по тем же id.
+    __slots__ = ('_user_id', '_balances', '_held', '_version')
 
-    def __init__(self, user_id: int, wallets):
+    def __init__(self, user_id: int, wallets=None, version: int = 0):
         self._user_id = user_id
-        self._wallets = wallets or {}
+        self._held = 0
+        # Номер изменения портфеля, растёт с каждой сделкой
+        self._version = version
+        opened = []
+        for code, wallet in (wallets or {}).items():
+            currency = get_currency(code)
+            if isinstance(wallet, Wallet):
+                units = wallet.units
+            else:
+                # Миграция float-балансов из portfolios.json: значение берётся
+                # по кратчайшей десятичной записи и округляется до точности валюты
+                units = to_units(wallet, currency.precision)
+            opened.append((currency.currency_id, units))
+        # Массив выделяется сразу нужной ширины, без запаса на рост
+        width = max((currency_id for currency_id, _ in opened), default=-1) + 1
+        self._balances = array('q', bytes(8 * width))
+        for currency_id, units in opened:
+            self._open(currency_id, units)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Portfolio":
+        return cls(data['user_id'], data.get('wallets'), data.get('version', 0))
+
+    def _open(self, currency_id: int, units: int = 0):
+        missing = currency_id + 1 - len(self._balances)
+        if missing > 0:
+            self._balances.extend([0] * missing)
+        self._balances[currency_id] = units
+        self._held |= 1 << currency_id
+
+    def _held_ids(self):
+        held = self._held
+        currency_id = 0
+        while held:
+            if held & 1:
+                yield currency_id
+            held >>= 1
+            currency_id += 1
 
     @property
     def user_id(self):
         return self._user_id
 
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump_version(self):
+        self._version += 1
+
     @property
     def wallets(self):
-        return self._wallets.copy()
+        return {currency.code: Wallet._bound(currency, self._balances)
+                for currency in self.currencies()}
+
+    def currencies(self):
+        return [get_currency_by_id(currency_id) for currency_id in self._held_ids()]
+
+    def has_wallet(self, currency_code: str) -> bool:
+        currency_id = get_currency(currency_code).currency_id
+        return bool(self._held >> currency_id & 1)
 
     def add_currency(self, currency_code: str):
-        if currency_code in self._wallets:
+        currency = get_currency(currency_code)
+        if self._held >> currency.currency_id & 1:
             raise ValueError('Валюта уже есть!')
-        new_wallet = Wallet(currency_code, 0.0)
-        self._wallets[currency_code] = new_wallet
+        self._open(currency.currency_id)
+        return Wallet._bound(currency, self._balances)
 
     def get_wallet(self, currency_code: str):
-        if currency_code in self._wallets:
-            return self._wallets[currency_code]
+        currency = get_currency(currency_code)
+        if self._held >> currency.currency_id & 1:
+            return Wallet._bound(currency, self._balances)
         else:
             raise ValueError(f'Ошибка,{currency_code} не найдена!')
 
-    def get_porfolio_data(self):
+    def get_balance(self, currency_code: str) -> float:
+        return self.get_wallet(currency_code).balance
 
+    def get_units(self, currency_code: str) -> int:
+        return self.get_wallet(currency_code).units
+
+    def get_porfolio_data(self):
+        # В JSON баланс пишется числом; units / 10**precision обратимо
+        # переводится в те же минимальные единицы при следующей загрузке
         return {'user_id': self.user_id,
-                'wallets': self.wallets}
+                'wallets': {currency.code: from_units(self._balances[currency.currency_id],
+                                                      currency.precision)
+                            for currency in self.currencies()},
+                'version': self._version}
@@ -0,0 +1,227 @@
+import heapq
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+from ..infra.locking import FileLock
+from ..infra.serialization import dump
+
+BUY = "buy"
+SELL = "sell"
+
+
+class LimitOrder:
+    """Лимитная заявка к USD.
+
+    Количество и резерв хранятся в минимальных единицах: покупка резервирует
+    USD по лимитной цене, продажа — саму продаваемую валюту.
+    """
+
+    __slots__ = ('order_id', 'user_id', 'side', 'currency', 'quantity',
+                 'limit_price', 'reserved', 'created_at')
+
+    def __init__(self, order_id: int, user_id: int, side: str, currency: str,
+                 quantity: int, limit_price: float, reserved: int, created_at: str):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.side = side
+        self.currency = currency
+        self.quantity = quantity
+        self.limit_price = limit_price
+        self.reserved = reserved
+        self.created_at = created_at
+
+    @property
+    def reserve_currency(self) -> str:
+        return "USD" if self.side == BUY else self.currency
+
+    def is_eligible(self, rate: float) -> bool:
+        return rate <= self.limit_price if self.side == BUY else rate >= self.limit_price
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LimitOrder":
+        return cls(data["order_id"], data["user_id"], data["side"], data["currency"],
+                   data["quantity"], data["limit_price"], data["reserved"],
+                   data["created_at"])
+
+    def to_dict(self) -> Dict:
+        return {
+            "order_id": self.order_id,
+            "user_id": self.user_id,
+            "side": self.side,
+            "currency": self.currency,
+            "quantity": self.quantity,
+            "limit_price": self.limit_price,
+            "reserved": self.reserved,
+            "created_at": self.created_at
+        }
+
+
+class OrderBook:
+    """Открытые лимитные заявки с кучами по каждой валюте.
+
+    Покупки лежат в max-куче по лимиту, продажи — в min-куче, поэтому при
+    новом курсе снимаются только исполнимые заявки с вершины: стоимость
+    сопоставления O(k log n) для k исполненных. Отменённые заявки удаляются
+    из кучи лениво, когда оказываются на вершине.
+
+    data/orders.json — открытые заявки;
+    data/orders_history.ndjson — исполненные и отменённые.
+    """
+
+    def __init__(self, path="data/orders.json", history_path="data/orders_history.ndjson"):
+        self.path = Path(path)
+        self.history_path = Path(history_path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._orders: Dict[int, LimitOrder] = {}
+        self._bids: Dict[str, list] = {}
+        self._asks: Dict[str, list] = {}
+        self._next_id = 1
+        self._mtime = None
+        # Захватывается и снаружи: use-case держит её вместе с блокировкой
+        # портфелей, пока применяет исполнения
+        self.lock = FileLock(self.path)
+
+    def _file_mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+
+        self._orders = {}
+        self._bids, self._asks = {}, {}
+        for item in data.get("orders", []):
+            order = LimitOrder.from_dict(item)
+            self._orders[order.order_id] = order
+            self._heap_entry(order)
+        for heap in (*self._bids.values(), *self._asks.values()):
+            heapq.heapify(heap)
+        self._next_id = data.get("next_id", max(self._orders, default=0) + 1)
+        self._mtime = mtime
+
+    def _heap_entry(self, order: LimitOrder, push=False):
+        if order.side == BUY:
+            heap = self._bids.setdefault(order.currency, [])
+            entry = (-order.limit_price, order.order_id)
+        else:
+            heap = self._asks.setdefault(order.currency, [])
+            entry = (order.limit_price, order.order_id)
+        if push:
+            heapq.heappush(heap, entry)
+        else:
+            heap.append(entry)
+
+    def save(self):
+        data = {
+            "next_id": self._next_id,
+            "orders": [order.to_dict() for order in self._orders.values()]
+        }
+        temp_file = self.path.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            dump(data, f)
+        temp_file.replace(self.path)
+        self._mtime = self._file_mtime()
+
+    def _archive(self, order: LimitOrder, status: str, **details):
+        record = order.to_dict()
+        record.update(status=status, closed_at=datetime.utcnow().isoformat() + "Z", **details)
+        with open(self.history_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def place(self, user_id: int, side: str, currency: str, quantity: int,
+              limit_price: float, reserved: int) -> LimitOrder:
+        with self.lock:
+            self._refresh()
+            order = LimitOrder(self._next_id, user_id, side, currency, quantity,
+                               limit_price, reserved, datetime.utcnow().isoformat() + "Z")
+            self._next_id += 1
+            self._orders[order.order_id] = order
+            self._heap_entry(order, push=True)
+            self.save()
+        return order
+
+    def cancel(self, user_id: int, order_id: int):
+        """Снимает заявку; возвращает её для возврата резерва или None"""
+        with self.lock:
+            self._refresh()
+            order = self._orders.get(order_id)
+            if order is None or order.user_id != user_id:
+                return None
+            del self._orders[order_id]
+            self.save()
+            self._archive(order, "cancelled")
+        return order
+
+    def user_orders(self, user_id: int) -> List[LimitOrder]:
+        with self.lock:
+            self._refresh()
+            orders = [order for order in self._orders.values() if order.user_id == user_id]
+        return sorted(orders, key=lambda order: order.order_id)
+
+    def _pop_eligible(self, heap: list, rate: float) -> List[LimitOrder]:
+        matched = []
+        while heap:
+            order_id = heap[0][1]
+            order = self._orders.get(order_id)
+            if order is None:
+                heapq.heappop(heap)
+                continue
+            if not order.is_eligible(rate):
+                break
+            heapq.heappop(heap)
+            matched.append(order)
+        return matched
+
+    def match(self, rates: Dict[str, float]) -> List[Tuple[LimitOrder, float]]:
+        """Снимает из книги все заявки, исполнимые по курсам {валюта: курс к USD}.
+
+        Книга не сохраняется: вызывающий сначала применяет исполнения к
+        портфелям, затем фиксирует их через commit().
+        """
+        with self.lock:
+            self._refresh()
+            fills = []
+            for code, rate in rates.items():
+                for heap in (self._bids.get(code), self._asks.get(code)):
+                    if not heap:
+                        continue
+                    for order in self._pop_eligible(heap, rate):
+                        del self._orders[order.order_id]
+                        fills.append((order, rate))
+        return fills
+
+    def commit(self, fills: List[Tuple[LimitOrder, float]]):
+        with self.lock:
+            self.save()
+            for order, rate in fills:
+                self._archive(order, "filled", fill_rate=rate)
+
+    def restore(self, orders: List[LimitOrder]):
+        """Возвращает в книгу заявки, снятые match(), но не исполненные;
+        сохраняется вместе с остальными при commit()"""
+        with self.lock:
+            for order in orders:
+                self._orders[order.order_id] = order
+                self._heap_entry(order, push=True)
+
+    def rollback(self):
+        # Снятые match() заявки возвращаются перечитыванием файла; -1 не
+        # совпадает ни с каким mtime, в том числе с None, когда файла ещё нет
+        with self.lock:
+            self._mtime = -1
+            self._refresh()
+
+    def __len__(self):
+        with self.lock:
+            self._refresh()
+            return len(self._orders)
@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+from .models import User
+
+
+@dataclass(frozen=True)
+class Session:
+    """Контекст вызова use-case'а: кто выполняет операцию.
+
+    Неизменяемый и передаётся в каждый вызов, поэтому один экземпляр
+    AuthUseCase обслуживает многих пользователей из разных потоков.
+    """
+
+    user_id: int
+    username: str
+
+    @classmethod
+    def for_user(cls, user: User) -> "Session":
+        return cls(user.user_id, user.username)
@@ -0,0 +1,131 @@
+"""Проверка потокобезопасности use-case'ов: много пользователей, один процесс.
+
+Запуск: python -m valutatrade_hub.core.stress --users 20 --trades 50 --threads 16
+
+Прогон идёт во временном каталоге с копией текущих курсов. Пользователи
+регистрируются, торгуют, выставляют и отменяют заявки параллельно через
+ThreadPoolExecutor, одновременно публикуются снимки курсов и читаются
+оценки портфелей. В конце сверяются балансы, журнал сделок и позиции;
+при расхождении код возврата 1.
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[2]
+
+_BTC = 0.001
+_USD = 100.0
+
+
+def _user_workload(use_case, session, trades: int, seed: int):
+    """Случайная последовательность операций; возвращает ожидаемые итоги"""
+    rng = random.Random(seed)
+    expected_btc, trades_done = 0, 0
+    use_case.execute_trade(session, "buy", "USD", _USD * trades)
+    trades_done += 1
+    for _ in range(trades):
+        action = rng.random()
+        if action < 0.6 or expected_btc == 0:
+            use_case.execute_trade(session, "buy", "BTC", _BTC)
+            expected_btc += 1
+        elif action < 0.9:
+            use_case.execute_trade(session, "sell", "BTC", _BTC)
+            expected_btc -= 1
+        else:
+            use_case.place_order(session, "buy", "BTC", _BTC, 1000.0)
+            order = use_case.orders.user_orders(session.user_id)[-1]
+            use_case.cancel_order(session, order.order_id)
+            continue
+        trades_done += 1
+        use_case.portfolio_valuation(session, "USD")
+    return expected_btc, trades_done
+
+
+def run(users: int, trades: int, threads: int) -> bool:
+    from .amount import to_units
+    from .usecases import AuthUseCase
+
+    auth = AuthUseCase()
+    storage = auth.rates_updater.storage
+    names = [f"stress{i}" for i in range(users)]
+
+    started = time.perf_counter()
+    # Сообщения use-case'ов для терминала здесь не нужны
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda name: auth.create_user(name, "pass"), names))
+        sessions = [auth.login(name, "pass") for name in names]
+
+        snapshot = storage.get_snapshot()
+        rates = {pair_key: snapshot.get_rate(pair_key) for pair_key in snapshot.pairs()}
+        publishers = [pool.submit(storage.save_current_rates, rates, "Stress")
+                      for _ in range(5)]
+        workloads = [pool.submit(_user_workload, auth, session, trades, i)
+                     for i, session in enumerate(sessions)]
+        results = [future.result() for future in workloads]
+        for future in publishers:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    user_ids = [user["user_id"] for user in auth.file_manager.iter_json('users.json')]
+    if len(set(user_ids)) != len(user_ids):
+        problems.append(f"повторяющиеся user_id: {sorted(user_ids)}")
+
+    btc_unit = to_units(_BTC, 8)
+    usd_units = to_units(_USD * trades, 2)
+    for session, (expected_btc, trades_done) in zip(sessions, results):
+        portfolio = auth._load_user_portfolio(session.user_id)
+        btc = portfolio.get_units("BTC") if portfolio.has_wallet("BTC") else 0
+        if btc != expected_btc * btc_unit:
+            problems.append(f"{session.username}: BTC {btc} != {expected_btc * btc_unit}")
+        if portfolio.get_units("USD") != usd_units:
+            problems.append(f"{session.username}: резерв заявок не вернулся в USD")
+        count = auth.ledger.trades_count(session.user_id)
+        if count != trades_done:
+            problems.append(f"{session.username}: в журнале {count} сделок из {trades_done}")
+        position = auth.ledger.get_positions(session.user_id).get("BTC")
+        if position is not None and position.quantity != expected_btc * btc_unit:
+            problems.append(f"{session.username}: позиция BTC {position.quantity}")
+        if auth.orders.user_orders(session.user_id):
+            problems.append(f"{session.username}: остались открытые заявки")
+
+    total = sum(done for _, done in results)
+    print(f"Пользователей: {users}, потоков: {threads}, сделок: {total}, "
+          f"{elapsed:.2f} с ({total / elapsed:,.0f} сделок/с)")
+    if problems:
+        print(f"❌ Найдено расхождений: {len(problems)}")
+        for problem in problems[:20]:
+            print(f"   {problem}")
+        return False
+    print("✅ Балансы, журнал сделок и позиции согласованы")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельная нагрузка на use-case'ы")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--trades", type=int, default=50, help="Операций на пользователя")
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="valutatrade-stress-") as workdir:
+        (Path(workdir) / "data").mkdir()
+        for name in ("rates.json", "rates.bin"):
+            if (_ROOT / "data" / name).exists():
+                shutil.copy(_ROOT / "data" / name, Path(workdir) / "data" / name)
+        os.chdir(workdir)
+        ok = run(args.users, args.trades, args.threads)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
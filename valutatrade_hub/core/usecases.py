@@ -1,71 +1,101 @@
 # valutatrade_hub/core/usecases.py
+import threading
+from typing import Callable, Dict, Optional
 from .models import User, Portfolio
 from .utils import FileManager
 from .exceptions import InsufficientFundsError
-from .currencies import get_currency
+from .currencies import get_currency, get_registry, FiatCurrency, CryptoCurrency
+from .amount import convert_units, rate_to_fixed, from_units, format_units, to_units, sum_units
+from .ledger import TradeLedger
+from .valuation_cache import ValuationCache
+from .orders import OrderBook, BUY
+from .alerts import AlertEngine, CallbackAlertSink, FileAlertSink, LogAlertSink, ABOVE, BELOW
 from .exceptions import CurrencyNotFoundError
+from .session import Session
 from ..decorators import log_action
 from ..infra.settings import SettingsLoader
 from ..infra.database import DatabaseManager
+from ..infra.locking import FileLock
 from ..parser_service.updater import RatesUpdater
 from ..parser_service.config import ParserConfig
+from ..parser_service.history import parse_timestamp, format_timestamp
 
 
 class AuthUseCase:
     def __init__(self):
         self.file_manager = FileManager()
-        self.current_user = None
         self.settings = SettingsLoader()
         self.database = DatabaseManager()
 
+        # Use-case'ы не хранят текущего пользователя: он приходит в Session
+        # каждого вызова. Общие файлы меняются под блокировками, порядок
+        # захвата: пользователи -> заявки -> портфели.
+        self._users_lock = FileLock(self.file_manager.base_dir / 'users.json')
+        self._portfolios_lock = FileLock(self.file_manager.base_dir / 'portfolios.json')
+        self._watchers: Dict[int, Callable[[str], None]] = {}
+        self._watchers_lock = threading.Lock()
+
+        self.ledger = TradeLedger()
+        self.valuation_cache = ValuationCache(
+            self.settings.get("valuation_cache_size", 1024))
+
         self.rates_config = ParserConfig()
         self.rates_updater = RatesUpdater(self.rates_config)
+        self.rates_updater.storage.add_publish_listener(
+            self.valuation_cache.invalidate_rates)
 
-        self.static_rates = {
-            'USD': 1.0,
-            'EUR': 0.93,
-            'BTC': 45000.0,
-            'RUB': 0.011,
-            'ETH': 2500.0,
-            'SOL': 100.0,
-            'SCR': 0.075
-        }
+        self.alerts = AlertEngine(sinks=[LogAlertSink(), FileAlertSink(),
+                                         CallbackAlertSink(self._on_alert)])
+        self.rates_updater.add_listener(self.alerts.evaluate)
+
+        self.orders = OrderBook()
+        self.rates_updater.add_listener(self._execute_orders)
+
+        # Базовые курсы к USD на случай пустого кеша берутся из реестра валют
+        self.static_rates = get_registry().fallback_rates()
 
         print("✅ Загрузчик курсов инициализирован")
 
     def _gen_user_id(self) -> int:
-        users = self.file_manager.read_json(filename='users.json', default=[])
-        if not users:
-            return 1
-        return max(user.get('user_id', 0) for user in users) + 1
+        users = self.file_manager.iter_json('users.json')
+        return max((user.get('user_id', 0) for user in users), default=0) + 1
 
     def _user_exists(self, username: str):
-        users = self.file_manager.read_json('users.json',  [])
-        for user in users:  # type: ignore
+        for user in self.file_manager.iter_json('users.json'):
             if user['username'] == username:
                 return True
         return False
 
+    def create_user(self, username: str, password: str) -> User:
+        """Создаёт пользователя и пустой портфель; ValueError, если имя занято"""
+        with self._users_lock, self._portfolios_lock:
+            if self._user_exists(username):
+                raise ValueError("Пользователь c таким именем уже сущесвует!")
+            user_id = self._gen_user_id()
+            user = User(user_id, username, password)
+            port = Portfolio(user_id, {})
+            self.file_manager.write_json(filename='users.json', data=user.get_user())
+            self.file_manager.write_json(
+                filename='portfolios.json', data=port.get_porfolio_data())
+        return user
+
+    def authenticate(self, username: str, password: str) -> Optional[User]:
+        for user_data in self.file_manager.iter_json('users.json'):
+            if user_data['username'] == username:
+                user = User.from_dict(user_data)
+                return user if user.verify_password(password) else None
+        return None
+
     @log_action(action_name="REGISTER")
     def register(self, username: str, password: str):
         try:
             print('user')
-            if not self._user_exists(username):
-                user_id = self._gen_user_id()
-                user = User(user_id, username, password)
-                port = Portfolio(user_id, {})
-                user_data = user.get_user()
-                portfolio_data = port.get_porfolio_data()
-                self.file_manager.write_json(
-                    filename='users.json', data=user_data)
-                self.file_manager.write_json(
-                    filename='portfolios.json', data=portfolio_data)
-                print(f"✅ Пользователь {username} успешно зарегистрирован!")
-                return True
-
-            else:
-                print("❌ Пользователь c таким именем уже сущесвует!")
-                return False
+            self.create_user(username, password)
+            print(f"✅ Пользователь {username} успешно зарегистрирован!")
+            return True
+        except ValueError as e:
+            print(f"❌ {e}")
+            return False
         except FileNotFoundError:
             print("❌ Файл с пользователями не найден")
             return False
@@ -77,22 +107,30 @@ class AuthUseCase:
             return False
 
     @log_action(action_name="LOGIN")
-    def login(self, username: str, password: str):
-        users = self.file_manager.read_json('users.json', [])
-        for user_data in users:  # type: ignore
-            if user_data['username'] == username:
+    def login(self, username: str, password: str) -> Optional[Session]:
+        """Проверяет пароль и возвращает сессию для последующих вызовов"""
+        user = self.authenticate(username, password)
+        if user is None:
+            print('❌ Неверный логин или пароль!')
+            return None
+        print(f'✅ Добро пожаловать {username}!')
+        return Session.for_user(user)
 
-                user = User(user_data['user_id'], username, '')
-                user._salt = user_data['salt']
-                user._hashed_password = user_data['hashed_password']
-                if user.verify_password(password):
-                    self.current_user = user
-                    print(f'✅ Добро пожаловать {username}!')
-                    return True
+    def watch(self, session: Session, callback: Callable[[str], None]):
+        """Подписка клиента на уведомления своего пользователя
+        (сработавшие оповещения, исполненные заявки)"""
+        with self._watchers_lock:
+            self._watchers[session.user_id] = callback
 
-                else:
-                    print('❌ Неверный логин или пароль!')
-                    return False
+    def unwatch(self, session: Session):
+        with self._watchers_lock:
+            self._watchers.pop(session.user_id, None)
+
+    def _notify_user(self, user_id: int, message: str):
+        with self._watchers_lock:
+            callback = self._watchers.get(user_id)
+        if callback is not None:
+            callback(message)
 
     def _get_dynamic_rate(self, from_currency: str, to_currency: str = "USD"):
 
@@ -101,30 +139,18 @@ class AuthUseCase:
             to_currency = to_currency.upper()
 
             storage = self.rates_updater.storage
-            data = storage.get_current_rates()
-
-            if not data or "pairs" not in data:
-
-                return None
 
-            pairs = data.get("pairs", {})
+            binary = storage.get_binary_snapshot()
+            if binary is not None:
+                rate = binary.get_pair_rate(from_currency, to_currency)
+                if rate is not None:
+                    return rate
 
-            pair_key = f"{from_currency}_{to_currency}"
-
-            if pair_key in pairs:
-                rate = pairs[pair_key].get("rate")
-
-                return rate
-
-            reverse_key = f"{to_currency}_{from_currency}"
-
-            if reverse_key in pairs:
-                rate = pairs[reverse_key].get("rate")
-
-                if rate and rate != 0:
-                    return 1 / rate
-
-            return None
+            # Прямая, обратная пара или кросс-курс через USD — тот же путь,
+            # что у show-rates, чтобы get-rate и оценка портфеля в EUR
+            # показывали ту же цену, а не статический курс
+            row = storage.get_rates_view(to_currency).rows.get(from_currency)
+            return row.price if row is not None else None
 
         except Exception as e:
             print(f"DEBUG: Ошибка в _get_dynamic_rate: {e}")
@@ -164,81 +190,217 @@ class AuthUseCase:
         print(f"⚠️  Нет статического курса для {from_currency}→{to_currency}")
         return 1.0
 
-    def show_portfolio(self, base_currency: str = "USD"):
-        if self.current_user is None:
+    def _load_user_portfolio(self, user_id: int):
+        for portfolio_data in self.file_manager.iter_json('portfolios.json'):
+            if portfolio_data['user_id'] == user_id:
+                return Portfolio.from_dict(portfolio_data)
+        return None
+
+    def _load_portfolios(self):
+        return [Portfolio.from_dict(portfolio_data)
+                for portfolio_data in self.file_manager.iter_json('portfolios.json')]
+
+    def _save_portfolios(self, portfolios):
+        self.file_manager.update_json(
+            'portfolios.json', [portfolio.get_porfolio_data() for portfolio in portfolios])
+
+    def _restore_wallet(self, portfolios, portfolio: Portfolio, wallet, units: int):
+        """Компенсация: кошелёк возвращается к units и портфели сохраняются,
+        если вторая запись операции (журнал, заявки) не удалась"""
+        delta = wallet.units - units
+        if delta > 0:
+            wallet.withdraw_units(delta)
+        elif delta < 0:
+            wallet.deposit_units(-delta)
+        portfolio.bump_version()
+        self._save_portfolios(portfolios)
+        self.valuation_cache.invalidate_user(portfolio.user_id)
+
+    @staticmethod
+    def _find_or_create_portfolio(portfolios, user_id: int) -> Portfolio:
+        for portfolio in portfolios:
+            if portfolio.user_id == user_id:
+                return portfolio
+        portfolio = Portfolio(user_id)
+        portfolios.append(portfolio)
+        return portfolio
+
+    @staticmethod
+    def _balance_digits(currency) -> int:
+        # Знаки после запятой — точность валюты из реестра (BTC - 8, JPY - 0)
+        return currency.precision
+
+    def _value_portfolio(self, portfolio: Portfolio, base_currency: str):
+        """Оценивает кошельки портфеля в базовой валюте: фиат, затем крипта"""
+        base = get_currency(base_currency)
+        rows = []
+        value_units = []
+        currencies = portfolio.currencies()
+        ordered = ([c for c in currencies if isinstance(c, FiatCurrency)]
+                   + [c for c in currencies if not isinstance(c, FiatCurrency)])
+        for currency in ordered:
+            units = portfolio.get_units(currency.code)
+            rate = self._get_current_rate(currency.code, base.code)
+            # Стоимость считается в минимальных единицах базовой валюты,
+            # итог — точная сумма целых без накопления ошибки float
+            value = convert_units(units, currency.precision,
+                                  rate_to_fixed(rate), base.precision)
+            value_units.append(value)
+            rows.append((currency, from_units(units, currency.precision),
+                         rate, from_units(value, base.precision)))
+        return rows, from_units(sum_units(value_units), base.precision)
+
+    def _portfolio_pnl(self, portfolio: Portfolio):
+        """P&L по агрегатам журнала сделок, без повторного прохода по истории"""
+        base = get_currency(self.ledger.base_currency)
+        rows = []
+        for code, position in self.ledger.get_positions(portfolio.user_id).items():
+            currency = get_currency(code)
+            rate = self._get_current_rate(code, base.code)
+            market_value = convert_units(position.quantity, currency.precision,
+                                         rate_to_fixed(rate), base.precision)
+            rows.append((currency,
+                         position.average_cost(currency.precision, base.precision),
+                         from_units(market_value - position.cost, base.precision),
+                         from_units(position.realized, base.precision)))
+        return rows
+
+    def _show_pnl(self, rows):
+        if not rows:
+            return
+        base = self.ledger.base_currency
+        print(f"\n📈 Прибыль/убыток ({base}):")
+        print(f"{'Валюта':<8} {'Ср. цена':<15} {'Нереализ.':<15} {'Реализ.':<15}")
+        print("-" * 70)
+        for currency, average_cost, unrealized, realized in rows:
+            print(f"{currency.code:<8} {average_cost:<15,.4f} {unrealized:<+15,.2f} {realized:<+15,.2f}")
+
+    def _cached_valuation(self, portfolio: Portfolio, base_currency: str):
+        """Оценка портфеля и P&L из кеша; пересчёт только при новой версии
+        портфеля или новом снимке курсов"""
+        rates_version = self.rates_updater.storage.snapshot_version()
+        cached = self.valuation_cache.get(
+            portfolio.user_id, portfolio.version, rates_version, base_currency)
+        if cached is not None:
+            return cached
+
+        rows, total_value = self._value_portfolio(portfolio, base_currency)
+        valuation = (rows, total_value, self._portfolio_pnl(portfolio))
+        self.valuation_cache.put(
+            portfolio.user_id, portfolio.version, rates_version, base_currency, valuation)
+        return valuation
+
+    def portfolio_valuation(self, session: Session, base_currency: str = "USD"):
+        """(строки, итог, P&L) или None, если портфеля нет"""
+        portfolio = self._load_user_portfolio(session.user_id)
+        if portfolio is None:
+            return None
+        return self._cached_valuation(portfolio, base_currency)
+
+    def show_cache_stats(self):
+        stats = self.valuation_cache.stats()
+        print("🗃️  Кеш оценок портфелей:")
+        print(f"   Записей: {stats['size']} из {stats['max_size']}")
+        print(f"   Попаданий: {stats['hits']}, промахов: {stats['misses']} "
+              f"(hit rate {stats['hit_rate']:.0%})")
+        print(f"   Инвалидировано: {stats['invalidations']}")
+        return stats
+
+    def show_portfolio(self, session: Optional[Session], base_currency: str = "USD"):
+        if session is None:
             print("❌ Сначала выполните login")
             return
 
-        user_id = self.current_user._user_id
-        port = self.file_manager.read_json('portfolios.json', [])
-        user_portfolio = None
-
-        for portfolios_data in port:
-            if portfolios_data['user_id'] == user_id:
-                user_portfolio = portfolios_data
-                break
+        portfolio = self._load_user_portfolio(session.user_id)
 
-        if user_portfolio is None:
+        if portfolio is None:
             print("ℹ️  У вас пока нет портфеля")
             return
 
-        wallets_data = user_portfolio.get('wallets', {})
-        if not wallets_data:
+        if not portfolio.currencies():
             print('ℹ️  У вас пока нет кошельков')
             return
 
-        crypto_currencies = ['BTC', 'ETH', 'SOL']
-        fiat_currencies = ['USD', 'EUR', 'RUB',
-                           'SCR', 'JPY', 'GBP', 'CAD', 'AUD']
-
         print(
-            f"📊 Портфель пользователя '{self.current_user.username}' (база: {base_currency}):")
+            f"📊 Портфель пользователя '{session.username}' (база: {base_currency}):")
         print("=" * 70)
 
-        total_value = 0
         print(f"{'Валюта':<8} {'Баланс':<20} {'Курс':<15} {'Стоимость':<20}")
         print("-" * 70)
 
-        for currency, balance in wallets_data.items():
-            if currency in fiat_currencies:
-                balance = float(balance)
-                rate = self._get_current_rate(currency, base_currency)
-                value = balance * rate
-                total_value += value
-
-                print(
-                    f"{currency:<8} {balance:<20.2f} {rate:<15.4f} {value:<20.2f} {base_currency}")
-
-        for currency, balance in wallets_data.items():
-            if currency in crypto_currencies:
-                balance = float(balance)
-                rate = self._get_current_rate(currency, base_currency)
-                value = balance * rate
-                total_value += value
-
-                # Для криптовалют - 8 знаков после запятой
+        rows, total_value, pnl_rows = self._cached_valuation(portfolio, base_currency)
+        for currency, balance, rate, value in rows:
+            digits = self._balance_digits(currency)
+            if isinstance(currency, CryptoCurrency):
                 print(
-                    f"{currency:<8} {balance:<20.8f} {rate:<15.2f} {value:<20.2f} {base_currency}")
-
-        for currency, balance in wallets_data.items():
-            if currency not in fiat_currencies and currency not in crypto_currencies:
-                balance = float(balance)
-                rate = self._get_current_rate(currency, base_currency)
-                value = balance * rate
-                total_value += value
-
+                    f"{currency.code:<8} {balance:<20.{digits}f} {rate:<15.2f} {value:<20.2f} {base_currency}")
+            else:
                 print(
-                    f"{currency:<8} {balance:<20.2f} {rate:<15.4f} {value:<20.2f} {base_currency}")
+                    f"{currency.code:<8} {balance:<20.{digits}f} {rate:<15.4f} {value:<20.2f} {base_currency}")
 
         print("=" * 70)
         print(f"💰 ИТОГО: {total_value:,.2f} {base_currency}")
 
+        self._show_pnl(pnl_rows)
+
         cache_info = self.rates_updater.get_cache_info()
         print(f"\n🕐 Курсы обновлены: {cache_info['last_refresh']}")
 
+    def execute_trade(self, session: Session, side: str, currency: str, amount: float) -> Dict:
+        """Рыночная сделка к USD: меняет портфель и дописывает журнал.
+
+        Ошибки — исключениями (ValueError, CurrencyNotFoundError,
+        InsufficientFundsError), результат — словарь для вывода или API.
+        """
+        if amount <= 0:
+            raise ValueError("Количество должно быть положительным числом")
+
+        currency_obj = get_currency(currency)
+        currency = currency_obj.code
+        user_id = session.user_id
+        current_rate = self._get_current_rate(currency, "USD")
+
+        # Портфели лежат в одном файле: чтение, изменение и запись вместе
+        # с журналом сделок идут под одной блокировкой
+        with self._portfolios_lock:
+            portfolios = self._load_portfolios()
+            portfolio = self._find_or_create_portfolio(portfolios, user_id)
+
+            if side == "buy":
+                wallet = self._wallet(portfolio, currency)
+                old_balance, old_units = wallet.balance, wallet.units
+                wallet.deposit(amount)
+            else:
+                if not portfolio.has_wallet(currency):
+                    raise ValueError(f'У вас нет кошелька {currency}.')
+                wallet = portfolio.get_wallet(currency)
+                old_balance, old_units = wallet.balance, wallet.units
+                wallet.withdraw(amount)
+
+            portfolio.bump_version()
+            self._save_portfolios(portfolios)
+            self.valuation_cache.invalidate_user(user_id)
+            try:
+                trade = self.ledger.record(
+                    user_id, side, currency, to_units(amount, currency_obj.precision), current_rate)
+            except Exception:
+                # Без записи в журнале сделки нет: баланс возвращается, иначе
+                # позиции и P&L разойдутся с портфелем
+                self._restore_wallet(portfolios, portfolio, wallet, old_units)
+                raise
+
+        return {
+            "trade": trade,
+            "currency": currency,
+            "rate": current_rate,
+            "old_balance": old_balance,
+            "new_balance": wallet.balance,
+            "digits": self._balance_digits(currency_obj)
+        }
+
     @log_action(action_name="BUY", verbose=True)
-    def buy(self, currency: str, amount: float):
-        if self.current_user is None:
+    def buy(self, session: Optional[Session], currency: str, amount: float):
+        if session is None:
             print("❌ Сначала выполните login")
             return False
 
@@ -247,50 +409,18 @@ class AuthUseCase:
                 print("❌ 'amount' должен быть положительным числом")
                 return False
 
-            get_currency(currency)
-            currency = currency.upper()
-            user_id = self.current_user._user_id
-
-            current_rate = self._get_current_rate(currency, "USD")
-
-            portfolios = self.file_manager.read_json('portfolios.json', [])
-            user_portfolio_data = None
-
-            for portfolio_data in portfolios:
-                if portfolio_data['user_id'] == user_id:
-                    user_portfolio_data = portfolio_data
-                    break
-
-            if user_portfolio_data is None:
-                user_portfolio_data = {'user_id': user_id, 'wallets': {}}
-                portfolios.append(user_portfolio_data)
-
-            wallets_data = user_portfolio_data.get('wallets', {})
-            if currency not in wallets_data:
-                wallets_data[currency] = 0.0
-
-            old_balance = wallets_data[currency]
-            wallets_data[currency] += amount
-            user_portfolio_data['wallets'] = wallets_data
-
-            cost = amount * current_rate
-
-            self.file_manager.update_json('portfolios.json', portfolios)
+            result = self.execute_trade(session, "buy", currency, amount)
+            currency, digits = result["currency"], result["digits"]
 
             print("\n✅ Покупка выполнена успешно!")
             print(f"   📈 Куплено: {amount} {currency}")
-            print(f"   💱 Курс: {current_rate:,.4f} USD/{currency}")
-            print(f"   💰 Стоимость: {cost:,.2f} USD")
+            print(f"   💱 Курс: {result['rate']:,.4f} USD/{currency}")
+            print(f"   💰 Стоимость: {float(result['trade']['value']):,.2f} USD")
+            print(
+                f"   📊 Баланс {currency}: {result['old_balance']:.{digits}f} → "
+                f"{result['new_balance']:.{digits}f}")
 
-            if currency in ['BTC', 'ETH', 'SOL']:
-                print(
-                    f"   📊 Баланс {currency}: {old_balance:.8f} → {wallets_data[currency]:.8f}")
-            else:
-
-                print(
-                    f"   📊 Баланс {currency}: {old_balance:.2f} → {wallets_data[currency]:.2f}")
-
-            return True
+            return result
 
         except CurrencyNotFoundError as e:
             print(f"❌ Ошибка: {e}")
@@ -300,8 +430,8 @@ class AuthUseCase:
             return False
 
     @log_action(action_name="SELL", verbose=True)
-    def sell(self, currency: str, amount: float):
-        if self.current_user is None:
+    def sell(self, session: Optional[Session], currency: str, amount: float):
+        if session is None:
             print("❌ Сначала выполните login")
             return False
 
@@ -310,63 +440,186 @@ class AuthUseCase:
                 print('❌ Сумма должна быть положительной!')
                 return False
 
-            get_currency(currency)
-            currency = currency.upper()
-            user_id = self.current_user._user_id
-
-            current_rate = self._get_current_rate(currency, "USD")
+            result = self.execute_trade(session, "sell", currency, amount)
+            currency, digits = result["currency"], result["digits"]
 
-            port = self.file_manager.read_json('portfolios.json', [])
-            user_port = None
+            print("\n✅ Продажа выполнена успешно!")
+            print(f"   📉 Продано: {amount} {currency}")
+            print(f"   💱 Курс: {result['rate']:,.4f} USD/{currency}")
+            print(f"   💰 Сумма: {float(result['trade']['value']):,.2f} USD")
+            print(
+                f"   📊 Баланс {currency}: {result['old_balance']:.{digits}f} → "
+                f"{result['new_balance']:.{digits}f}")
+            return result
 
-            for portfolio_data in port:
-                if portfolio_data['user_id'] == user_id:
-                    user_port = portfolio_data
-                    break
+        except CurrencyNotFoundError as e:
+            print(f"❌ Ошибка: {e}")
+            return False
+        except (InsufficientFundsError, ValueError) as e:
+            print(f"❌ {e}")
+            return False
+        except Exception as e:
+            print(f"❌ Ошибка при продаже: {e}")
+            return False
 
-            if user_port is None:
-                user_port = {'user_id': user_id, 'wallets': {}}
-                port.append(user_port)
+    def _holdings_now(self, user_id: int) -> Optional[Dict[str, int]]:
+        """Текущие остатки вместе с резервами открытых заявок; None без портфеля.
 
-            wallets = user_port.get('wallets', {})
-            if currency not in wallets:
-                print(f'❌ У вас нет кошелька {currency}.')
-                return False
+        Резерв списан с кошелька, но в журнал сделок не попадает, поэтому
+        без него откат сделок занижал бы остатки в прошлом на сумму
+        открытых заявок.
+        """
+        with self.orders.lock, self._portfolios_lock:
+            portfolio = self._load_user_portfolio(user_id)
+            if portfolio is None:
+                return None
+            current = {currency.code: portfolio.get_units(currency.code)
+                       for currency in portfolio.currencies()}
+            for order in self.orders.user_orders(user_id):
+                code = order.reserve_currency
+                current[code] = current.get(code, 0) + order.reserved
+        return current
+
+    def _value_series(self, user_id: int, current: Dict[str, int], base_currency: str, moments):
+        """Стоимость портфеля на отсортированные моменты времени.
+
+        Остатки берутся из журнала сделок, курсы — из индекса истории
+        (бинарный поиск / слияние по каждой паре), расчёт идёт столбцами:
+        одна валюта — все даты сразу.
+        """
+        base = get_currency(base_currency)
+        holdings = self.ledger.holdings_at(user_id, current, moments)
+        index = self.rates_updater.storage.get_history_index()
+
+        codes = sorted({code for snapshot in holdings for code, units in snapshot.items() if units})
+        rates = {code: index.cross_rates_at(code, base.code, "USD", moments) for code in codes}
+
+        # Стоимость каждой валюты — в минимальных единицах базовой валюты,
+        # итог — сумма тех же целых, поэтому строки сходятся с итогом
+        amounts = {code: [None] * len(moments) for code in codes}
+        totals = [0] * len(moments)
+        missing = set()
+        for code in codes:
+            precision = get_currency(code).precision
+            for i, rate in enumerate(rates[code]):
+                units = holdings[i].get(code, 0)
+                if not units:
+                    continue
+                if rate is None:
+                    missing.add(code)
+                    continue
+                amounts[code][i] = convert_units(units, precision, rate_to_fixed(rate), base.precision)
+                totals[i] += amounts[code][i]
+
+        values = [from_units(total, base.precision) for total in totals]
+        return holdings, rates, amounts, values, missing
+
+    def show_portfolio_at(self, session: Optional[Session], moment: str, base_currency: str = "USD"):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return
 
-            old_balance = wallets[currency]
+        current = self._holdings_now(session.user_id)
+        if current is None:
+            print("ℹ️  У вас пока нет портфеля")
+            return
 
-            if old_balance < amount:
-                raise InsufficientFundsError(currency, old_balance, amount)
+        try:
+            at = parse_timestamp(moment)
+        except ValueError:
+            print(f"❌ Неверная дата '{moment}': ожидается ISO, например "
+                  f"2025-12-01 или 2025-12-01T10:00:00")
+            return
+        base = get_currency(base_currency)
+        holdings, rates, amounts, values, missing = self._value_series(
+            session.user_id, current, base_currency, [at])
 
-            new_balance = old_balance - amount
-            wallets[currency] = new_balance
+        print(f"📊 Портфель '{session.username}' на {format_timestamp(at)} "
+              f"(база: {base_currency}):")
+        print("=" * 70)
+        print(f"{'Валюта':<8} {'Баланс':<20} {'Курс':<15} {'Стоимость':<20}")
+        print("-" * 70)
+        for code, units in sorted(holdings[0].items()):
+            if not units:
+                continue
+            currency = get_currency(code)
+            balance = from_units(units, currency.precision)
+            rate = rates[code][0]
+            if rate is None:
+                print(f"{code:<8} {balance:<20.{currency.precision}f} {'—':<15} {'нет курса':<20}")
+                continue
+            value = from_units(amounts[code][0], base.precision)
+            print(f"{code:<8} {balance:<20.{currency.precision}f} {rate:<15.4f} "
+                  f"{value:<20.2f} {base_currency}")
+        print("=" * 70)
+        print(f"💰 ИТОГО: {values[0]:,.2f} {base_currency}")
+        if missing:
+            print(f"⚠️  Нет истории курсов на этот момент: {', '.join(sorted(missing))}")
 
-            cost = amount * current_rate
+    def show_portfolio_history(self, session: Optional[Session], start: str, end: str, base_currency: str = "USD"):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return
 
-            self.file_manager.update_json('portfolios.json', port)
+        current = self._holdings_now(session.user_id)
+        if current is None:
+            print("ℹ️  У вас пока нет портфеля")
+            return
 
-            print("\n✅ Продажа выполнена успешно!")
-            print(f"   📉 Продано: {amount} {currency}")
-            print(f"   💱 Курс: {current_rate:,.4f} USD/{currency}")
-            print(f"   💰 Сумма: {cost:,.2f} USD")
-            if currency in ['BTC', 'ETH', 'SOL']:
-                print(
-                    f"   📊 Баланс {currency}: {old_balance:.8f} → {new_balance:.8f}")
-            else:
-                print(
-                    f"   📊 Баланс {currency}: {old_balance:.2f} → {new_balance:.2f}")
-            return True
+        try:
+            first, last = parse_timestamp(start), parse_timestamp(end)
+        except ValueError:
+            print("❌ Даты --from/--to — в формате ISO, например 2025-12-01 "
+                  "или 2025-12-01T10:00:00")
+            return
+        if last < first:
+            print("❌ --to должен быть не раньше --from")
+            return
 
-        except CurrencyNotFoundError as e:
-            print(f"❌ Ошибка: {e}")
-            return False
-        except InsufficientFundsError as e:
-            print(f"❌ {e}")
+        moments = []
+        moment = first
+        while moment <= last:
+            moments.append(moment)
+            moment += 86400
+
+        _, _, _, values, missing = self._value_series(
+            session.user_id, current, base_currency, moments)
+
+        print(f"📅 Стоимость портфеля '{session.username}' по дням (база: {base_currency}):")
+        print(f"{'Дата':<28} {'Стоимость':<20}")
+        print("-" * 50)
+        for moment, value in zip(moments, values):
+            print(f"{format_timestamp(moment):<28} {value:<20,.2f}")
+        if missing:
+            print(f"⚠️  Для части дат нет истории курсов: {', '.join(sorted(missing))}")
+
+    def show_trades(self, session: Optional[Session], limit: int = 20, page: int = 1):
+        if session is None:
+            print("❌ Сначала выполните login")
             return False
-        except Exception as e:
-            print(f"❌ Ошибка при продаже: {e}")
+
+        if limit <= 0 or page <= 0:
+            print("❌ --limit и --page должны быть положительными")
             return False
 
+        user_id = session.user_id
+        total = self.ledger.trades_count(user_id)
+        if not total:
+            print("ℹ️  У вас пока нет сделок")
+            return True
+
+        pages = (total + limit - 1) // limit
+        trades = self.ledger.tail(user_id, limit, (page - 1) * limit)
+
+        print(f"🧾 Сделки '{session.username}' (стр. {page}/{pages}, всего {total}):")
+        print(f"{'#':<6} {'Время':<28} {'Тип':<6} {'Валюта':<8} {'Кол-во':<20} {'Курс':<15} {'Сумма':<15}")
+        print("-" * 100)
+        for trade in trades:
+            print(f"{trade['trade_id']:<6} {trade['timestamp']:<28} {trade['side']:<6} "
+                  f"{trade['currency']:<8} {trade['amount']:<20} {trade['rate']:<15,.4f} "
+                  f"{trade['value']} {trade['base']}")
+        return True
+
     @log_action(action_name="GET_RATE")
     def get_rate(self, currency: str, tocurrency: str):
         try:
@@ -402,3 +655,308 @@ class AuthUseCase:
     def _is_cache_expired(self, ttl: int) -> bool:
         """Проверяет устарел ли кеш курсов"""
         return False
+
+    def _on_alert(self, alert, previous: float, current: float):
+        self._notify_user(alert.user_id,
+                          f"🔔 Оповещение #{alert.alert_id}: {alert.describe()} "
+                          f"(курс {previous:,.8g} → {current:,.8g})")
+
+    @staticmethod
+    def _alert_pair(pair: str):
+        """'BTC', 'BTC_USD' или 'USD_BTC' -> (ключ пары в кеше, перевёрнута ли).
+
+        Курсы публикуются к USD, поэтому оповещение по обратной паре
+        хранится как оповещение по прямой с обратным порогом.
+        """
+        parts = pair.upper().replace('/', '_').split('_')
+        if len(parts) == 1:
+            parts.append("USD")
+        if len(parts) != 2:
+            raise ValueError(f"Неверный формат пары '{pair}', ожидается BTC_USD")
+        from_currency = get_currency(parts[0]).code
+        to_currency = get_currency(parts[1]).code
+        if from_currency == to_currency:
+            raise ValueError("Валюты пары должны различаться")
+        if to_currency == "USD":
+            return f"{from_currency}_USD", False
+        if from_currency == "USD":
+            return f"{to_currency}_USD", True
+        raise ValueError("Оповещения поддерживаются только для пар к USD")
+
+    @log_action(action_name="ADD_ALERT")
+    def add_alert(self, session: Optional[Session], pair: str, direction: str, threshold: float):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        try:
+            if threshold <= 0:
+                print("❌ Порог должен быть положительным числом")
+                return False
+            pair_key, inverted = self._alert_pair(pair)
+            if inverted:
+                direction = BELOW if direction == ABOVE else ABOVE
+                threshold = 1 / threshold
+
+            alert = self.alerts.add(session.user_id, pair_key, direction, threshold)
+            print(f"✅ Оповещение #{alert.alert_id} создано: {alert.describe()}")
+
+            current = self._get_dynamic_rate(*pair_key.split('_'))
+            if current is not None and ((direction == ABOVE and current > threshold)
+                                        or (direction == BELOW and current < threshold)):
+                print(f"⚠️  Текущий курс {current:,.8g} уже за порогом: оповещение "
+                      f"сработает при следующем пересечении")
+            return True
+
+        except (CurrencyNotFoundError, ValueError) as e:
+            print(f"❌ Ошибка: {e}")
+            return False
+
+    def show_alerts(self, session: Optional[Session]):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        alerts = self.alerts.user_alerts(session.user_id)
+        if not alerts:
+            print("ℹ️  У вас нет активных оповещений")
+            return True
+
+        print(f"🔔 Активные оповещения '{session.username}':")
+        print(f"{'#':<6} {'Условие':<30} {'Создано':<28}")
+        print("-" * 70)
+        for alert in alerts:
+            print(f"{alert.alert_id:<6} {alert.describe():<30} {alert.created_at:<28}")
+        return True
+
+    @log_action(action_name="REMOVE_ALERT")
+    def remove_alert(self, session: Optional[Session], alert_id: int):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        if self.alerts.remove(session.user_id, alert_id):
+            print(f"✅ Оповещение #{alert_id} удалено")
+            return True
+        print(f"❌ Оповещение #{alert_id} не найдено")
+        return False
+
+    @staticmethod
+    def _wallet(portfolio: Portfolio, currency_code: str):
+        if portfolio.has_wallet(currency_code):
+            return portfolio.get_wallet(currency_code)
+        return portfolio.add_currency(currency_code)
+
+    @log_action(action_name="PLACE_ORDER", verbose=True)
+    def place_order(self, session: Optional[Session], side: str, currency: str,
+                    amount: float, limit_price: float):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        try:
+            if amount <= 0 or limit_price <= 0:
+                print("❌ Количество и цена должны быть положительными")
+                return False
+
+            currency_obj = get_currency(currency)
+            currency = currency_obj.code
+            if currency == "USD":
+                print("❌ Заявки выставляются к USD, выберите другую валюту")
+                return False
+            usd = get_currency("USD")
+            user_id = session.user_id
+
+            quantity = to_units(amount, currency_obj.precision, strict=True)
+            with self.orders.lock, self._portfolios_lock:
+                portfolios = self._load_portfolios()
+                portfolio = self._find_or_create_portfolio(portfolios, user_id)
+
+                # Резерв списывается с кошелька сразу и возвращается при отмене
+                if side == BUY:
+                    reserved = convert_units(quantity, currency_obj.precision,
+                                             rate_to_fixed(limit_price), usd.precision)
+                    wallet = self._wallet(portfolio, "USD")
+                    reserved_text = f"{from_units(reserved, usd.precision):,.2f} USD"
+                else:
+                    if not portfolio.has_wallet(currency):
+                        print(f'❌ У вас нет кошелька {currency}.')
+                        return False
+                    reserved = quantity
+                    wallet = portfolio.get_wallet(currency)
+                    reserved_text = f"{amount} {currency}"
+                old_units = wallet.units
+                wallet.withdraw_units(reserved)
+
+                portfolio.bump_version()
+                self._save_portfolios(portfolios)
+                self.valuation_cache.invalidate_user(user_id)
+                try:
+                    order = self.orders.place(
+                        user_id, side, currency, quantity, limit_price, reserved)
+                except Exception:
+                    # Заявка не записалась — резерв возвращается на кошелёк
+                    self.orders.rollback()
+                    self._restore_wallet(portfolios, portfolio, wallet, old_units)
+                    raise
+
+            action = "покупку" if side == BUY else "продажу"
+            print(f"\n✅ Заявка #{order.order_id} на {action} выставлена")
+            print(f"   📈 {amount} {currency} по {limit_price:,.4f} USD/{currency}")
+            print(f"   🔒 Зарезервировано: {reserved_text}")
+            return True
+
+        except CurrencyNotFoundError as e:
+            print(f"❌ Ошибка: {e}")
+            return False
+        except InsufficientFundsError as e:
+            print(f"❌ {e}")
+            return False
+        except ValueError as e:
+            print(f"❌ Ошибка: {e}")
+            return False
+        except OSError as e:
+            print(f"❌ Не удалось сохранить заявку: {e}")
+            return False
+
+    @log_action(action_name="CANCEL_ORDER")
+    def cancel_order(self, session: Optional[Session], order_id: int):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        user_id = session.user_id
+        try:
+            with self.orders.lock, self._portfolios_lock:
+                order = next((order for order in self.orders.user_orders(user_id)
+                              if order.order_id == order_id), None)
+                if order is None:
+                    print(f"❌ Открытая заявка #{order_id} не найдена")
+                    return False
+
+                # Сначала возврат резерва, затем снятие заявки; если снять
+                # не удалось, возврат отменяется
+                portfolios = self._load_portfolios()
+                portfolio = self._find_or_create_portfolio(portfolios, user_id)
+                wallet = self._wallet(portfolio, order.reserve_currency)
+                old_units = wallet.units
+                wallet.deposit_units(order.reserved)
+                portfolio.bump_version()
+                self._save_portfolios(portfolios)
+                self.valuation_cache.invalidate_user(user_id)
+                try:
+                    self.orders.cancel(user_id, order_id)
+                except Exception:
+                    # Возврат отменяется, только если заявка осталась открытой
+                    self.orders.rollback()
+                    if any(open_order.order_id == order_id
+                           for open_order in self.orders.user_orders(user_id)):
+                        self._restore_wallet(portfolios, portfolio, wallet, old_units)
+                    raise
+        except OSError as e:
+            print(f"❌ Не удалось отменить заявку: {e}")
+            return False
+
+        reserve = get_currency(order.reserve_currency)
+        print(f"✅ Заявка #{order_id} отменена, возвращено "
+              f"{format_units(order.reserved, reserve.precision)} {reserve.code}")
+        return True
+
+    def show_orders(self, session: Optional[Session]):
+        if session is None:
+            print("❌ Сначала выполните login")
+            return False
+
+        orders = self.orders.user_orders(session.user_id)
+        if not orders:
+            print("ℹ️  У вас нет открытых заявок")
+            return True
+
+        print(f"📋 Открытые заявки '{session.username}':")
+        print(f"{'#':<6} {'Тип':<6} {'Валюта':<8} {'Кол-во':<20} {'Лимит':<15} {'Резерв':<20}")
+        print("-" * 80)
+        for order in orders:
+            currency = get_currency(order.currency)
+            reserve = get_currency(order.reserve_currency)
+            print(f"{order.order_id:<6} {order.side:<6} {order.currency:<8} "
+                  f"{format_units(order.quantity, currency.precision):<20} "
+                  f"{order.limit_price:<15,.4f} "
+                  f"{format_units(order.reserved, reserve.precision)} {reserve.code}")
+        return True
+
+    def _execute_orders(self, previous, current):
+        """Исполняет все заявки, ставшие исполнимыми после обновления курсов.
+
+        Исполнения применяются к портфелям пачкой и сохраняются одной
+        записью portfolios.json.
+        """
+        rates = {pair_key[:-4]: rate for pair_key, rate in current.items()
+                 if pair_key.endswith("_USD")}
+        usd = get_currency("USD")
+
+        with self.orders.lock, self._portfolios_lock:
+            fills = self.orders.match(rates)
+            if not fills:
+                return []
+
+            try:
+                portfolios = self._load_portfolios()
+                touched = {}
+                # Зачисления каждого исполнения: [(портфель, валюта, единицы)]
+                applied = []
+                for order, rate in fills:
+                    currency = get_currency(order.currency)
+                    portfolio = self._find_or_create_portfolio(portfolios, order.user_id)
+                    value = convert_units(order.quantity, currency.precision,
+                                          rate_to_fixed(rate), usd.precision)
+                    if order.side == BUY:
+                        # Исполнение по рыночному курсу не хуже лимита,
+                        # разница с резервом возвращается в USD
+                        credits = [(portfolio, currency.code, order.quantity)]
+                        refund = order.reserved - value
+                        if refund > 0:
+                            credits.append((portfolio, "USD", refund))
+                    else:
+                        credits = [(portfolio, "USD", value)]
+                    for _, code, units in credits:
+                        self._wallet(portfolio, code).deposit_units(units)
+                    applied.append(credits)
+                    touched[portfolio.user_id] = portfolio
+
+                for portfolio in touched.values():
+                    portfolio.bump_version()
+                self._save_portfolios(portfolios)
+            except Exception:
+                self.orders.rollback()
+                raise
+
+            # Сделки пишутся в журнал до фиксации книги: если запись не
+            # удалась, зачисления незаписанных исполнений отменяются, а их
+            # заявки остаются открытыми
+            recorded = 0
+            try:
+                for order, rate in fills:
+                    self.ledger.record(order.user_id, order.side, order.currency,
+                                       order.quantity, rate)
+                    recorded += 1
+            except Exception:
+                for credits in applied[recorded:]:
+                    for portfolio, code, units in credits:
+                        portfolio.get_wallet(code).withdraw_units(units)
+                        portfolio.bump_version()
+                self._save_portfolios(portfolios)
+                self.orders.restore([order for order, _ in fills[recorded:]])
+                self.orders.commit(fills[:recorded])
+                raise
+            finally:
+                for user_id in touched:
+                    self.valuation_cache.invalidate_user(user_id)
+            self.orders.commit(fills)
+
+        for order, rate in fills:
+            currency = get_currency(order.currency)
+            self._notify_user(order.user_id,
+                              f"✅ Исполнена заявка #{order.order_id}: {order.side} "
+                              f"{format_units(order.quantity, currency.precision)} "
+                              f"{order.currency} по {rate:,.4f} USD")
+        return fills
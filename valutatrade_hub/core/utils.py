@@ -1,5 +1,7 @@
 import json
 from pathlib import Path
+from typing import Iterator
+from ..infra.serialization import iter_array, write_array, write_file
 
 
 class FileManager:
@@ -19,17 +21,30 @@ class FileManager:
         except FileNotFoundError:
             return default
 
+    def iter_json(self, filename: str) -> Iterator[dict]:
+        """Элементы массива из файла по одному; нет файла — пусто"""
+        try:
+            yield from iter_array(self._get_file_path(filename))
+        except FileNotFoundError:
+            return
+
+    def _replace_json(self, filename: str, data):
+        # Запись во временный файл и os.replace: параллельный читатель
+        # видит либо старую, либо новую версию, но не обрезанный файл
+        write_file(self._get_file_path(filename), data)
+        return True
+
     def write_json(self, filename: str, data: dict):
-        file_path = self._get_file_path(filename)
-        file_json = self.read_json(filename, [])
-        file_json.append(data)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(file_json, f, indent=2, ensure_ascii=False)
+        # Старые элементы переписываются в новый файл потоком, без загрузки
+        # всего массива в память
+        items = self.iter_json(filename)
+        write_array(self._get_file_path(filename), _appended(items, data))
         return True
 
     def update_json(self, filename: str, data: list):
-        file_path = self._get_file_path(filename)
+        return self._replace_json(filename, data)
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        return True
+
+def _appended(items: Iterator[dict], item: dict) -> Iterator[dict]:
+    yield from items
+    yield item
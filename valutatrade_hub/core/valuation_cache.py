@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ValuationCache:
+    """LRU-кеш оценок портфелей.
+
+    Ключ — (user_id, версия портфеля, поколение снимка курсов, база),
+    поэтому устаревшая запись не может быть выдана даже без явной
+    инвалидации; инвалидация лишь освобождает место раньше вытеснения.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int, portfolio_version: int, rates_version: int,
+            base_currency: str) -> Optional[Any]:
+        key = (user_id, portfolio_version, rates_version, base_currency)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, user_id: int, portfolio_version: int, rates_version: int,
+            base_currency: str, value: Any):
+        key = (user_id, portfolio_version, rates_version, base_currency)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        # Сделка меняет версию портфеля: старые оценки пользователя не нужны
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def invalidate_rates(self, rates_version: int = None):
+        # Новый снимок курсов: остаются только записи нового поколения
+        with self._lock:
+            stale = [key for key in self._entries
+                     if rates_version is None or key[2] != rates_version]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
@@ -20,8 +20,10 @@ def log_action(action_name=None, verbose=False):
 
             try:
 
-                if args and hasattr(args[0], 'current_user') and args[0].current_user:
-                    username = args[0].current_user.username
+                # Контекст вызова — Session вторым аргументом use-case'а
+                session = kwargs.get('session', args[1] if len(args) > 1 else None)
+                if session is not None and hasattr(session, 'username'):
+                    username = session.username
 
                 currency_code = kwargs.get('currency', '')
                 amount = kwargs.get('amount', 0)
@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 from .settings import SettingsLoader
+from .serialization import write_file
 
 
 class DatabaseManager:
@@ -38,8 +39,7 @@ class DatabaseManager:
     def write_json(self, filename: str, data):
         file_path = self._get_file_path(filename)
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            write_file(file_path, data)
             return True
         except Exception as e:
             print(f"Ошибка записи {filename}: {e}")
@@ -0,0 +1,54 @@
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка между потоками
+    fcntl = None
+
+# Запись общих файлов из нескольких процессов безопасна только с flock
+CROSS_PROCESS = fcntl is not None
+
+
+class FileLock:
+    """Блокировка read-modify-write для файла данных.
+
+    Внутри процесса — реентерабельный threading.RLock, между процессами
+    (воркеры API) — flock на файле <имя>.lock рядом с данными.
+    """
+
+    def __init__(self, path):
+        self.path = Path(str(path) + ".lock")
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self.path.parent.mkdir(exist_ok=True, parents=True)
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,215 @@
+"""Запись и чтение файлов данных в JSON.
+
+По умолчанию пишется компактный JSON без отступов и пробелов после
+разделителей. Читаемый вид (indent=2) — отладочная настройка pretty_json
+(переменная окружения VALUTATRADE_PRETTY_JSON). Массивы верхнего уровня
+пишутся и читаются поэлементно, без строки на весь файл, поэтому большие
+portfolios.json и exchange_rates.json обрабатываются в постоянной памяти.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+from .settings import SettingsLoader
+
+COMPACT_SEPARATORS = (",", ":")
+
+_WHITESPACE = b" \t\r\n"
+
+
+def _pretty(pretty: Optional[bool]) -> bool:
+    return SettingsLoader().get("pretty_json", False) if pretty is None else pretty
+
+
+def dumps(data: Any, pretty: Optional[bool] = None) -> str:
+    if _pretty(pretty):
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    return json.dumps(data, separators=COMPACT_SEPARATORS, ensure_ascii=False)
+
+
+def _item_text(item: Any, pretty: bool) -> str:
+    # Элемент массива с отступом первого уровня, как в json.dump(indent=2)
+    if pretty:
+        return json.dumps(item, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+    return json.dumps(item, separators=COMPACT_SEPARATORS, ensure_ascii=False)
+
+
+class ArrayWriter:
+    """Пишет JSON-массив в открытый файл по элементу"""
+
+    def __init__(self, f, pretty: Optional[bool] = None):
+        self.f = f
+        self.pretty = _pretty(pretty)
+        self.count = 0
+
+    def write(self, item: Any):
+        if self.pretty:
+            prefix = "[\n  " if self.count == 0 else ",\n  "
+        else:
+            prefix = "[" if self.count == 0 else ","
+        self.f.write(prefix + _item_text(item, self.pretty))
+        self.count += 1
+
+    def close(self):
+        if not self.count:
+            self.f.write("[]")
+        else:
+            self.f.write("\n]" if self.pretty else "]")
+
+
+def dump(data: Any, f, pretty: Optional[bool] = None):
+    # Список пишется по элементу, остальное — одной строкой
+    if isinstance(data, list):
+        writer = ArrayWriter(f, pretty)
+        for item in data:
+            writer.write(item)
+        writer.close()
+    else:
+        f.write(dumps(data, pretty))
+
+
+def _temp_path(path: Path) -> Path:
+    return path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+
+
+def write_file(path, data: Any, pretty: Optional[bool] = None):
+    """Запись во временный файл и os.replace: читатель видит либо старую,
+    либо новую версию, но не обрезанный файл"""
+    path = Path(path)
+    temp_file = _temp_path(path)
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        dump(data, f, pretty)
+    temp_file.replace(path)
+
+
+def write_array(path, items: Iterable[Any], pretty: Optional[bool] = None) -> int:
+    """Атомарная запись массива из итератора; возвращает число элементов"""
+    path = Path(path)
+    temp_file = _temp_path(path)
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            writer = ArrayWriter(f, pretty)
+            for item in items:
+                writer.write(item)
+            writer.close()
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+    temp_file.replace(path)
+    return writer.count
+
+
+def iter_array(path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Элементы JSON-массива из файла по одному, без чтения файла целиком"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos = "", 0
+        started = False
+        eof = False
+        while True:
+            # Пропуск пробелов, '[' и запятых между элементами
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+            if pos >= len(buffer):
+                if started:
+                    raise ValueError(f"{path}: JSON-массив оборван, нет ']'")
+                return
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{path}: ожидался JSON-массив")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # Число, оборванное на границе блока ("123" | "45", "1e" | "-7"),
+                # тоже разбирается без ошибки: элемент принимается, только
+                # когда за ним в буфере уже видна ',' или ']'
+                after = end
+                while after < len(buffer) and buffer[after] in " \t\r\n":
+                    after += 1
+                complete = eof or (after < len(buffer) and buffer[after] in ",]")
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                # Элемент не поместился в буфер: дочитываем
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield item
+            pos = end
+
+
+def _array_end(f, path, size: int):
+    """Позиция сразу после последнего элемента (или '[') перед закрывающей
+    ']' и пуст ли массив"""
+    closing = False
+    pos = size
+    while pos > 0:
+        start = max(0, pos - 4096)
+        f.seek(start)
+        block = f.read(pos - start)
+        for i in range(len(block) - 1, -1, -1):
+            char = block[i:i + 1]
+            if char in _WHITESPACE:
+                continue
+            if not closing:
+                if char != b"]":
+                    raise ValueError(f"{path}: файл не заканчивается JSON-массивом")
+                closing = True
+                continue
+            return start + i + 1, char == b"["
+        pos = start
+    raise ValueError(f"{path}: файл не заканчивается JSON-массивом")
+
+
+def append_array(path, items: Iterable[Any], pretty: Optional[bool] = None) -> int:
+    """Дописывает элементы в конец JSON-массива на месте, без перезаписи файла.
+
+    Вызывающий держит блокировку файла. При ошибке записи хвост файла
+    восстанавливается; читатель без блокировки может увидеть недописанный
+    хвост, поэтому так пишутся только журналы вроде истории курсов.
+    """
+    path = Path(path)
+    pretty = _pretty(pretty)
+    items = list(items)
+    if not items:
+        return 0
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        size = 0
+    if not size:
+        return write_array(path, items, pretty)
+
+    separator = ",\n  " if pretty else ","
+    with open(path, 'r+b') as f:
+        cut, empty = _array_end(f, path, size)
+        f.seek(cut)
+        tail = f.read()
+        body = separator.join(_item_text(item, pretty) for item in items)
+        if pretty:
+            payload = ("\n  " if empty else separator) + body + "\n]"
+        else:
+            payload = ("" if empty else separator) + body + "]"
+        f.seek(cut)
+        try:
+            f.write(payload.encode('utf-8'))
+            f.truncate()
+        except BaseException:
+            f.seek(cut)
+            f.write(tail)
+            f.truncate()
+            raise
+    return len(items)
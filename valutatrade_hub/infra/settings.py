@@ -1,3 +1,6 @@
+import os
+
+
 class SettingsLoader:
 
     # Реализация через __new__ выбрана по следующим причинам:
@@ -20,7 +23,12 @@ class SettingsLoader:
             "data_directory": "data/",
             "rates_ttl_seconds": 300,
             "default_base_currency": "USD",
-            "log_file_path": "logs/valutatrade.log"
+            "log_file_path": "logs/valutatrade.log",
+            "valuation_cache_size": 1024,
+            "api_session_ttl_seconds": 3600,
+            "api_executor_workers": 8,
+            # Файлы данных с отступами — для отладки; по умолчанию компактный JSON
+            "pretty_json": os.getenv("VALUTATRADE_PRETTY_JSON", "").lower() in ("1", "true", "yes")
         }
 
     def get(self, key: str, default=None):
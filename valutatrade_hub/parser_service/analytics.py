@@ -0,0 +1,244 @@
+"""Кросс-парная аналитика: доходности, ковариация и корреляция пар.
+
+Истории всех пар за окно раскладываются на общую сетку времени: значение
+пары в узле — последний курс не позже узла (as-of). Логарифмические
+доходности считаются только между узлами, где есть реальные наблюдения:
+узлы, заполненные переносом курса, дали бы нулевые доходности и тянули
+корреляцию к нулю. Затем матрицы ковариации и корреляции — одним
+векторным проходом по матрице узлы × пары. Из хранилища читается только
+окно (и один шаг до него для первого узла). Без NumPy тот же расчёт
+выполняется построчно.
+"""
+import math
+import re
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+from .history import parse_timestamp
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy — построчный расчёт
+    np = None
+
+DEFAULT_WINDOW = "7d"
+
+# Шаг сетки по умолчанию — окно / GRID_POINTS, но не меньше MIN_STEP
+GRID_POINTS = 168
+MIN_STEP = 60
+
+# Пара берётся в расчёт, если у неё есть наблюдения хотя бы в такой доле
+# узлов, где наблюдалась любая из пар
+MIN_COVERAGE = 0.5
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$")
+
+
+def parse_duration(text: str) -> float:
+    """"90" (секунды), "15m", "24h", "7d", "2w" -> секунды"""
+    match = _DURATION.match(str(text).lower())
+    if match is None or float(match.group(1)) <= 0:
+        raise ValueError(f"Некорректная длительность: {text} (примеры: 3600, 15m, 24h, 7d)")
+    return float(match.group(1)) * _UNITS[match.group(2) or "s"]
+
+
+def default_step(window: float) -> float:
+    return max(MIN_STEP, window / GRID_POINTS)
+
+
+class MarketAnalytics:
+    """Итог расчёта по окну: пары, волатильности и матрицы N × N"""
+
+    __slots__ = ('start', 'end', 'step', 'pairs', 'skipped', 'points', 'observations',
+                 'mean_returns', 'volatility', 'covariance', 'correlation', 'seconds',
+                 'vectorized')
+
+    def __init__(self, start: float, end: float, step: float):
+        self.start = start
+        self.end = end
+        self.step = step
+        self.pairs: List[str] = []
+        # Пары без данных или с наблюдениями меньше чем в MIN_COVERAGE узлов
+        self.skipped: List[str] = []
+        # Число доходностей между узлами сетки с наблюдениями
+        self.points = 0
+        self.observations: Dict[str, int] = {}
+        self.mean_returns: List[float] = []
+        self.volatility: List[float] = []
+        # NaN в матрицах — пара с нулевой дисперсией
+        self.covariance: List[List[float]] = []
+        self.correlation: List[List[float]] = []
+        self.seconds = 0.0
+        self.vectorized = np is not None
+
+    def to_dict(self) -> Dict:
+        def clean(value):
+            return None if math.isnan(value) else value
+
+        return {
+            "start": self.start, "end": self.end, "step": self.step,
+            "pairs": self.pairs, "skipped": self.skipped, "points": self.points,
+            "observations": self.observations,
+            "mean_returns": [clean(value) for value in self.mean_returns],
+            "volatility": [clean(value) for value in self.volatility],
+            "covariance": [[clean(value) for value in row] for row in self.covariance],
+            "correlation": [[clean(value) for value in row] for row in self.correlation],
+            "seconds": self.seconds,
+        }
+
+
+def compute_analytics(records: Iterable[Dict], start: float, end: float, step: float,
+                      pairs: Optional[Sequence[str]] = None) -> MarketAnalytics:
+    """records — записи истории за [start - step, end]; узлы сетки —
+    start, start + step, ..., end"""
+    started = time.perf_counter()
+    result = MarketAnalytics(start, end, step)
+    cells = int(math.ceil((end - start) / step))
+
+    # Колонки наблюдений: номер пары, момент, курс
+    index: Dict[str, int] = {}
+    names: List[str] = []
+    pair_ids = array('i')
+    moments = array('d')
+    rates = array('d')
+    for record in records:
+        # USD_USD и подобные — курс 1, не рыночная пара
+        if record['from_currency'] == record['to_currency']:
+            continue
+        pair_key = f"{record['from_currency']}_{record['to_currency']}"
+        pair_id = index.get(pair_key)
+        if pair_id is None:
+            pair_id = index[pair_key] = len(names)
+            names.append(pair_key)
+        pair_ids.append(pair_id)
+        moments.append(parse_timestamp(record["timestamp"]))
+        rates.append(float(record["rate"]))
+
+    wanted = list(pairs) if pairs is not None else sorted(names)
+    result.skipped = [pair_key for pair_key in wanted if pair_key not in index]
+    wanted = [pair_key for pair_key in wanted if pair_key in index]
+    if np is not None:
+        _compute_numpy(result, wanted, index, pair_ids, moments, rates, cells)
+    else:
+        _compute_python(result, wanted, index, pair_ids, moments, rates, cells)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _select(observed: List[List[int]], names: List[str], result):
+    """observed — отсортированные узлы с наблюдениями каждой пары.
+
+    Возвращает пары с достаточным покрытием и узлы для доходностей: узлы с
+    наблюдениями этих пар, начиная с узла, где курс есть уже у всех.
+    Поздно появившаяся или редкая пара не набирает покрытия и пропускается,
+    а не укорачивает ряд остальным.
+    """
+    active = set().union(*observed) if observed else set()
+    kept = [i for i, cells in enumerate(observed)
+            if cells and len(cells) >= MIN_COVERAGE * len(active)]
+    result.skipped += [names[i] for i in range(len(names)) if i not in kept]
+    if not kept:
+        return kept, []
+    first_row = max(observed[i][0] for i in kept)
+    rows = sorted(cell for cell in set().union(*(observed[i] for i in kept))
+                  if cell >= first_row)
+    return kept, rows
+
+
+def _compute_numpy(result, wanted, index, pair_ids, moments, rates, cells):
+    columns = np.array([index[pair_key] for pair_key in wanted], dtype=np.int64)
+    position = np.full(len(index), -1, dtype=np.int64)
+    position[columns] = np.arange(len(columns))
+
+    pair_ids = position[np.frombuffer(pair_ids, dtype=np.int32)]
+    moments = np.frombuffer(moments, dtype=np.float64)
+    rates = np.frombuffer(rates, dtype=np.float64)
+    # Узел k собирает наблюдения из (узел k-1, узел k]
+    cell = np.ceil((moments - result.start) / result.step).astype(np.int64)
+    mask = (pair_ids >= 0) & (cell >= 0) & (cell <= cells) & (rates > 0)
+    pair_ids, cell, moments, rates = pair_ids[mask], cell[mask], moments[mask], rates[mask]
+    result.observations = dict(zip(wanted, np.bincount(pair_ids, minlength=len(wanted)).tolist()))
+
+    # Последнее наблюдение в узле: сортировка по (пара, узел, момент)
+    order = np.lexsort((moments, cell, pair_ids))
+    pair_ids, cell, rates = pair_ids[order], cell[order], rates[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (pair_ids[1:] != pair_ids[:-1]) | (cell[1:] != cell[:-1])
+    grid = np.full((cells + 1, len(wanted)), np.nan)
+    grid[cell[last], pair_ids[last]] = rates[last]
+    observed = [np.flatnonzero(~np.isnan(grid[:, column])).tolist()
+                for column in range(len(wanted))]
+
+    # As-of: пустые узлы заполняются последним известным курсом
+    filled = np.where(np.isnan(grid), 0, np.arange(cells + 1)[:, None])
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    grid = grid[filled, np.arange(len(wanted))]
+
+    kept, rows = _select(observed, wanted, result)
+    result.pairs = [wanted[i] for i in kept]
+    returns = np.diff(np.log(grid[np.ix_(rows, kept)]), axis=0)
+    result.points = returns.shape[0]
+    if not result.pairs or result.points < 2:
+        return
+
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    deviation = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(deviation, deviation)
+    correlation[~np.isfinite(correlation)] = np.nan
+    np.fill_diagonal(correlation, np.where(deviation > 0, 1.0, np.nan))
+    result.mean_returns = returns.mean(axis=0).tolist()
+    result.volatility = deviation.tolist()
+    result.covariance = covariance.tolist()
+    result.correlation = correlation.tolist()
+
+
+def _compute_python(result, wanted, index, pair_ids, moments, rates, cells):
+    position = {index[pair_key]: i for i, pair_key in enumerate(wanted)}
+    # Последнее наблюдение в узле по каждой паре: узел -> (момент, курс)
+    latest: List[Dict[int, tuple]] = [{} for _ in wanted]
+    counts = [0] * len(wanted)
+    for pair_id, moment, rate in zip(pair_ids, moments, rates):
+        column = position.get(pair_id)
+        cell = math.ceil((moment - result.start) / result.step)
+        if column is None or not 0 <= cell <= cells or rate <= 0:
+            continue
+        counts[column] += 1
+        previous = latest[column].get(cell)
+        if previous is None or moment >= previous[0]:
+            latest[column][cell] = (moment, rate)
+    result.observations = dict(zip(wanted, counts))
+
+    observed = [sorted(cells) for cells in latest]
+    kept, rows = _select(observed, wanted, result)
+    result.pairs = [wanted[i] for i in kept]
+    returns = []
+    for i in kept:
+        # As-of: в узле без наблюдения пары — её последний курс
+        values = []
+        current = None
+        cursor = 0
+        for row in rows:
+            while cursor < len(observed[i]) and observed[i][cursor] <= row:
+                current = latest[i][observed[i][cursor]][1]
+                cursor += 1
+            values.append(current)
+        returns.append([math.log(b / a) for a, b in zip(values, values[1:])])
+    result.points = len(returns[0]) if returns else 0
+    if not result.pairs or result.points < 2:
+        return
+
+    n = result.points
+    means = [sum(column) / n for column in returns]
+    centered = [[value - mean for value in column] for column, mean in zip(returns, means)]
+    covariance = [[sum(x * y for x, y in zip(a, b)) / (n - 1) for b in centered]
+                  for a in centered]
+    deviation = [math.sqrt(covariance[i][i]) for i in range(len(kept))]
+    correlation = [[(1.0 if i == j else covariance[i][j] / (deviation[i] * deviation[j]))
+                    if deviation[i] > 0 and deviation[j] > 0 else math.nan
+                    for j in range(len(kept))] for i in range(len(kept))]
+    result.mean_returns = means
+    result.volatility = deviation
+    result.covariance = covariance
+    result.correlation = correlation
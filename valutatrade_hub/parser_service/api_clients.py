@@ -1,136 +1,429 @@
 import requests
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Dict
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Type
+from ..core.currencies import get_registry
 from ..core.exceptions import ApiRequestError
 from .config import ParserConfig
+from .archive import HistoryArchive, iter_history
+from .history import HistoryIndex, format_timestamp
+from .http_timing import RequestTiming, summarize, timed_get, timed_session
+from ..infra.locking import FileLock
 
 logger = logging.getLogger("valutatrade")
 
 
+# Реестр источников курсов: имя -> класс клиента
+_PROVIDERS: Dict[str, Type["BaseApiClient"]] = {}
+
+
+class SourceQuotes:
+    """Ответ одного источника вместе с его метаданными и замерами запросов"""
+
+    __slots__ = ('name', 'display_name', 'rates', 'currency_kinds', 'market_caps',
+                 'timings', 'elapsed_ms', 'error')
+
+    def __init__(self, name: str, display_name: str, rates: Dict[str, float],
+                 currency_kinds: Dict[str, str], market_caps: Dict[str, float],
+                 timings: List[RequestTiming], elapsed_ms: float,
+                 error: Optional[ApiRequestError] = None):
+        self.name = name
+        self.display_name = display_name
+        self.rates = rates
+        self.currency_kinds = currency_kinds
+        self.market_caps = market_caps
+        self.timings = timings
+        self.elapsed_ms = elapsed_ms
+        self.error = error
+
+    def meta(self) -> Dict:
+        return summarize(self.timings, self.elapsed_ms)
+
+
 class BaseApiClient(ABC):
-    """Абстрактный базовый класс для Апи клиентов"""
+    """Абстрактный базовый класс для Апи клиентов.
+
+    Подкласс с атрибутом name регистрируется как источник курсов
+    автоматически; RatesUpdater опрашивает все зарегистрированные.
+    """
+
+    name: str = ""
+    display_name: str = ""
+    # Вес источника при взвешенном сведении курсов
+    weight: float = 1.0
+    # Опрашивается, если ENABLED_SOURCES не задан
+    enabled_by_default: bool = True
+    # Котировки источника дописываются в историю курсов
+    record_history: bool = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__dict__.get("name"):
+            _PROVIDERS[cls.name] = cls
+
+    def __init__(self, config: ParserConfig):
+        self.config = config
+        # Заполняются при каждом fetch_rates: вид новых валют по коду
+        # и капитализация по коду
+        self.currency_kinds: Dict[str, str] = {}
+        self.market_caps: Dict[str, float] = {}
+        # Замеры запросов текущего fetch_rates; клиенты ходят в сеть через
+        # self._get, чтобы замер попал сюда
+        self.timings: List[RequestTiming] = []
+        self.session = timed_session()
+        self._fetch_lock = threading.Lock()
+        # Блокировка файла истории хранилища, её передаёт create_providers:
+        # второй FileLock на тот же файл в одном процессе — второй flock
+        self.history_lock: Optional[FileLock] = None
+
+    @abstractmethod
+    def pairs(self) -> Tuple[str, ...]:
+        """Пары, которые источник обязуется котировать"""
 
     @abstractmethod
     def fetch_rates(self) -> Dict[str, float]:
 
         pass
 
+    def _get(self, url: str, params: Optional[Dict] = None) -> requests.Response:
+        return timed_get(self.session, url, self.timings, params=params,
+                         timeout=self.config.REQUEST_TIMEOUT)
+
+    def fetch(self) -> SourceQuotes:
+        """Запрос курсов; ошибка источника возвращается в SourceQuotes.error"""
+        # Метаданные лежат на экземпляре, поэтому запросы одного клиента
+        # из разных потоков выполняются по очереди
+        with self._fetch_lock:
+            self.currency_kinds = {}
+            self.market_caps = {}
+            self.timings = []
+            rates, error = {}, None
+            started = time.perf_counter()
+            try:
+                rates = self.fetch_rates()
+            except ApiRequestError as e:
+                error = e
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            return SourceQuotes(self.name, self.display_name or self.name, rates,
+                                dict(self.currency_kinds), dict(self.market_caps),
+                                list(self.timings), elapsed_ms, error)
+
+
+def provider_names() -> List[str]:
+    return list(_PROVIDERS)
+
+
+def create_providers(config: ParserConfig,
+                     history_lock: Optional[FileLock] = None) -> List[BaseApiClient]:
+    """Экземпляры включённых в конфиге источников (по умолчанию всех живых)"""
+    enabled = config.ENABLED_SOURCES or tuple(
+        name for name, cls in _PROVIDERS.items() if cls.enabled_by_default)
+    unknown = [name for name in enabled if name not in _PROVIDERS]
+    if unknown:
+        raise ValueError(f"Неизвестные источники курсов: {', '.join(unknown)}")
+    providers = [_PROVIDERS[name](config) for name in enabled]
+    for client in providers:
+        client.history_lock = history_lock
+    return providers
+
 
 class CoinGeckoClient(BaseApiClient):
 
+    name = "coingecko"
+    display_name = "CoinGecko"
+
     def __init__(self, config: ParserConfig):
-        self.config = config
+        super().__init__(config)
         self.base_url = config.COINGECKO_URL
+        self.markets_url = config.COINGECKO_MARKETS_URL
+
+    def pairs(self) -> Tuple[str, ...]:
+        # В режиме топ-N приходят и монеты сверх реестра
+        return tuple(f"{code}_{self.config.BASE_CURRENCY}"
+                     for code in self.config.CRYPTO_CURRENCIES)
 
     def fetch_rates(self) -> Dict[str, float]:
 
         try:
-            crypto_ids = [self.config.CRYPTO_ID_MAP[code]
-                          for code in self.config.CRYPTO_CURRENCIES]
-            ids_param = ",".join(crypto_ids)
-
-            params = {
-                'ids': ids_param,
-                'vs_currencies': 'usd'
-            }
-
-            logger.info("Запрос к CoinGecko")
-            response = requests.get(
-                self.base_url,
-                params=params,
-                timeout=self.config.REQUEST_TIMEOUT
-            )
-
-            if response.status_code != 200:
-                raise ApiRequestError(
-                    f"CoinGecko вернул статус {response.status_code}")
-
-            data = response.json()
-            rates = {}
-            for crypto_code in self.config.CRYPTO_CURRENCIES:
-                crypto_id = self.config.CRYPTO_ID_MAP[crypto_code]
-                if crypto_id in data and 'usd' in data[crypto_id]:
-                    rate = data[crypto_id]['usd']
-                    pair_key = f"{crypto_code}_{self.config.BASE_CURRENCY}"
-                    rates[pair_key] = rate
-                    logger.debug(f"Получен курс {pair_key}: {rate}")
-
-            logger.info(f"Получено {len(rates)} крипто-курсов от CoinGecko")
-            return rates
+            if self.config.COINGECKO_TOP_N > 0:
+                return self._fetch_markets()
+            return self._fetch_simple_prices()
 
+        except ApiRequestError:
+            raise
         except requests.exceptions.RequestException as e:
             raise ApiRequestError(f"Ошибка сети при запросе к CoinGecko: {e}")
         except Exception as e:
             raise ApiRequestError(
                 f"Ошибка при обработке ответа CoinGecko: {e}")
 
+    def _get_json(self, url: str, params: Dict):
+        response = self._get(url, params)
+
+        if response.status_code != 200:
+            raise ApiRequestError(
+                f"CoinGecko вернул статус {response.status_code}")
+
+        return response.json()
+
+    def _fetch_simple_prices(self) -> Dict[str, float]:
+        crypto_ids = [self.config.CRYPTO_ID_MAP[code]
+                      for code in self.config.CRYPTO_CURRENCIES]
+
+        params = {
+            'ids': ",".join(crypto_ids),
+            'vs_currencies': 'usd'
+        }
+
+        logger.info("Запрос к CoinGecko")
+        data = self._get_json(self.base_url, params)
+
+        rates = {}
+        for crypto_code in self.config.CRYPTO_CURRENCIES:
+            crypto_id = self.config.CRYPTO_ID_MAP[crypto_code]
+            if crypto_id in data and 'usd' in data[crypto_id]:
+                rate = data[crypto_id]['usd']
+                pair_key = f"{crypto_code}_{self.config.BASE_CURRENCY}"
+                rates[pair_key] = rate
+                logger.debug(f"Получен курс {pair_key}: {rate}")
+
+        logger.info(f"Получено {len(rates)} крипто-курсов от CoinGecko")
+        return rates
+
+    def _markets_params(self, page: int = 1, ids=None) -> Dict:
+        params = {
+            'vs_currency': 'usd',
+            'order': 'market_cap_desc',
+            'per_page': self.config.COINGECKO_PER_PAGE,
+            'page': page
+        }
+        if ids:
+            params['ids'] = ",".join(ids)
+        return params
+
+    def _fetch_markets(self) -> Dict[str, float]:
+        top_n = self.config.COINGECKO_TOP_N
+        per_page = self.config.COINGECKO_PER_PAGE
+        pages = (top_n + per_page - 1) // per_page
+
+        logger.info(f"Запрос топ-{top_n} монет CoinGecko ({pages} стр.)")
+        # Страницы независимы, поэтому запрашиваются параллельно;
+        # порядок страниц сохраняется, чтобы не сломать ранжирование
+        workers = max(1, min(pages, self.config.COINGECKO_MAX_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            page_results = list(executor.map(
+                lambda page: self._get_json(self.markets_url, self._markets_params(page)),
+                range(1, pages + 1)))
+
+        coins = [coin for page in page_results for coin in page][:top_n]
+
+        # Монеты реестра, не вошедшие в топ, дозапрашиваются по id
+        seen_ids = {coin.get('id') for coin in coins}
+        missing = [crypto_id for crypto_id in self.config.CRYPTO_ID_MAP.values()
+                   if crypto_id not in seen_ids]
+        if missing:
+            coins.extend(self._get_json(self.markets_url,
+                                        self._markets_params(ids=missing)))
+
+        return self._parse_markets(coins)
+
+    def _parse_markets(self, coins) -> Dict[str, float]:
+        registry = get_registry()
+        code_by_id = {crypto_id: code for code, crypto_id in self.config.CRYPTO_ID_MAP.items()}
+
+        rates = {}
+        for coin in coins:
+            price = coin.get('current_price')
+            if not price or price <= 0:
+                continue
+
+            code = code_by_id.get(coin.get('id'))
+            if code is None:
+                code = (coin.get('symbol') or '').upper()
+                if not code.isalpha() or len(code) > 5:
+                    continue
+                known = registry.find(code)
+                if known is not None and (known.kind != 'crypto'
+                                          or known.coingecko_id != coin.get('id')):
+                    # Символ занят фиатной валютой или другой монетой реестра
+                    continue
+
+            pair_key = f"{code}_{self.config.BASE_CURRENCY}"
+            if pair_key in rates:
+                # Одинаковые символы: остаётся монета с большей капитализацией
+                continue
+
+            rates[pair_key] = price
+            self.market_caps[code] = float(coin.get('market_cap') or 0.0)
+            if code not in registry:
+                self.currency_kinds[code] = 'crypto'
+
+        logger.info(f"Получено {len(rates)} крипто-курсов от CoinGecko")
+        return rates
+
 
 class ExchangeRateApiClient(BaseApiClient):
 
+    name = "exchangerate"
+    display_name = "ExchangeRate-API"
+
     def __init__(self, config: ParserConfig):
-        self.config = config
+        super().__init__(config)
         self.api_key = config.EXCHANGERATE_API_KEY
+        self.base_url = (f"{config.EXCHANGERATE_API_URL.rstrip('/')}/{self.api_key}"
+                         f"/latest/{config.BASE_CURRENCY}")
 
-        if not self.api_key:
-            self.api_key = "71ccd029b9f44cf21cdf6fe7"
-
-        self.base_url = f"https://v6.exchangerate-api.com/v6/{self.api_key}/latest/USD"
+    def pairs(self) -> Tuple[str, ...]:
+        return tuple(f"{code}_USD" for code in self.config.FIAT_CURRENCIES)
 
     def fetch_rates(self) -> Dict[str, float]:
 
+        if not self.api_key:
+            raise ApiRequestError("Не задан EXCHANGERATE_API_KEY")
+
         try:
             logger.info("Запрос к ExchangeRate-API")
 
-            response = requests.get(
-                self.base_url,
-                timeout=self.config.REQUEST_TIMEOUT
-            )
-
-            print(f"DEBUG: Status Code: {response.status_code}")
+            response = self._get(self.base_url)
 
             if response.status_code != 200:
                 raise ApiRequestError(
                     f"ExchangeRate-API вернул статус {response.status_code}")
 
             data = response.json()
-            print(f"DEBUG: API result: {data.get('result')}")
-            print(f"DEBUG: Base currency: {data.get('base_code')}")
 
             if data.get('result') != 'success':
                 error_type = data.get('error-type', 'unknown')
-                print(f"DEBUG: API Error type: {error_type}")
                 raise ApiRequestError(f"API вернул ошибку: {error_type}")
 
             rates_data = data.get('conversion_rates', {})
+            logger.debug(f"ExchangeRate-API вернул {len(rates_data)} валют")
 
-            available_currencies = list(rates_data.keys())
-            print(f"DEBUG: Всего валют: {len(available_currencies)}")
-            print(f"DEBUG: Первые 5: {available_currencies[:5]}")
+            if self.config.EXCHANGERATE_KEEP_ALL:
+                # Сохраняем всю вселенную валют из ответа, кроме самой базы
+                wanted = [code for code in rates_data
+                          if code != self.config.BASE_CURRENCY and code.isalpha()]
+            else:
+                wanted = self.config.FIAT_CURRENCIES
 
             rates = {}
-            for fiat_code in self.config.FIAT_CURRENCIES:
-                if fiat_code in rates_data:
-
-                    rate_from_api = rates_data[fiat_code]
-                    if rate_from_api > 0:
-                        rate = 1 / rate_from_api
-                        pair_key = f"{fiat_code}_USD"
-                        rates[pair_key] = rate
-                        print(
-                            f"DEBUG: {pair_key}: 1 USD = {rate_from_api} {fiat_code}, значит 1 {fiat_code} = {rate:.4f} USD")
-                        logger.debug(f"Получен курс {pair_key}: {rate}")
-                else:
-                    print(f"WARN: Валюта {fiat_code} отсутствует в ответе API")
+            for fiat_code in wanted:
+                rate_from_api = rates_data.get(fiat_code)
+                if rate_from_api is None:
                     logger.warning(f"Курс для {fiat_code} не найден в ответе")
+                elif rate_from_api > 0:
+                    rates[f"{fiat_code}_USD"] = 1 / rate_from_api
+                    self.currency_kinds[fiat_code] = "fiat"
 
             logger.info(
                 f"Получено {len(rates)} фиатных курсов от ExchangeRate-API")
             return rates
 
+        except ApiRequestError:
+            raise
         except requests.exceptions.RequestException as e:
-            print(f"ERROR: Network error: {e}")
+            logger.warning(f"Ошибка сети при запросе к ExchangeRate-API: {e}")
             raise ApiRequestError(f"Ошибка сети: {e}")
         except Exception as e:
-            print(f"ERROR: Unexpected error: {e}")
+            logger.warning(f"Ошибка при обработке ответа ExchangeRate-API: {e}")
             raise ApiRequestError(f"Ошибка обработки: {e}")
+
+
+class ReplayApiClient(BaseApiClient):
+    """Воспроизводит записанную историю курсов как поток обновлений.
+
+    Каждый запрос возвращает последний курс каждой пары на виртуальный
+    момент. При REPLAY_SPEED > 0 виртуальное время идёт в speed раз быстрее
+    реального; при 0 каждый запрос переходит к следующей точке истории,
+    так прогон детерминирован и не зависит от частоты обновлений.
+    """
+
+    name = "replay"
+    display_name = "Replay"
+    enabled_by_default = False
+    # История не дописывается сама в себя
+    record_history = False
+
+    def __init__(self, config: ParserConfig):
+        super().__init__(config)
+        self.path = Path(config.REPLAY_HISTORY_PATH or config.HISTORY_FILE_PATH)
+        # Своя история проигрывается вместе с архивом закрытых месяцев
+        self.archive = None if config.REPLAY_HISTORY_PATH else HistoryArchive(
+            config.HISTORY_ARCHIVE_DIR)
+        # Файл могут дописывать другие процессы: читается под его блокировкой.
+        # Для истории хранилища это history_lock, для внешнего файла — своя
+        own_history = self.path.resolve() == Path(config.HISTORY_FILE_PATH).resolve()
+        self._file_lock = None if own_history else FileLock(self.path)
+        self.speed = config.REPLAY_SPEED
+        self.loop = config.REPLAY_LOOP
+        self._index = None
+        self._moments = []
+        self._first = 0
+        self._position = 0
+        self._start = 0.0
+        self._started = None
+        # Виртуальный момент последнего ответа, секунды эпохи
+        self.replay_time = None
+
+    def _load(self):
+        try:
+            self._index = HistoryIndex.from_records(
+                iter_history(self.path, self.archive,
+                             lock=self._file_lock or self.history_lock))
+        except (OSError, ValueError) as e:
+            raise ApiRequestError(f"Не удалось прочитать историю {self.path}: {e}")
+        self._moments = sorted({moment for pair_key in self._index.pairs()
+                                for moment in self._index.series(pair_key).times})
+        if not self._moments:
+            raise ApiRequestError(f"В истории {self.path} нет курсов для воспроизведения")
+        self._start = self._moments[0] + self.config.REPLAY_START_OFFSET
+        self._first = max(0, bisect_right(self._moments, self._start) - 1)
+        self._position = self._first
+
+    def pairs(self) -> Tuple[str, ...]:
+        if self._index is None:
+            try:
+                self._load()
+            except ApiRequestError:
+                return ()
+        return self._index.pairs()
+
+    def _next_moment(self) -> float:
+        if self.speed > 0:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            moment = self._start + (now - self._started) * self.speed
+            end = self._moments[-1]
+            if moment > end:
+                if not self.loop:
+                    raise ApiRequestError("История курсов воспроизведена до конца")
+                span = end - self._start
+                moment = self._start + (moment - self._start) % span if span > 0 else end
+            return moment
+
+        if self._position >= len(self._moments):
+            if not self.loop:
+                raise ApiRequestError("История курсов воспроизведена до конца")
+            self._position = self._first
+        moment = self._moments[self._position]
+        self._position += 1
+        return moment
+
+    def fetch_rates(self) -> Dict[str, float]:
+        if self._index is None:
+            self._load()
+        moment = self._next_moment()
+        rates = {}
+        for pair_key in self._index.pairs():
+            rate = self._index.series(pair_key).rate_at(moment)
+            if rate is not None:
+                rates[pair_key] = rate
+        self.replay_time = moment
+        logger.debug(f"Воспроизведение истории: {format_timestamp(moment)}, {len(rates)} пар")
+        return rates
@@ -0,0 +1,403 @@
+"""Архив истории курсов: закрытые месяцы в сжатых сегментах.
+
+Сегмент — записи одного календарного месяца (UTC) в колоночном виде,
+сжатые gzip или lzma:
+  magic, длина заголовка (uint32), заголовок JSON: число записей, границы
+  по времени, таблицы пар, источников и дополнительных полей, масштаб
+  курса по паре;
+  столбцы (little-endian): пара (uint16), источник (uint16), доп. поля
+  (uint32, 0 — нет), время — разность с предыдущей записью в мкс (int64),
+  курс — разность с предыдущим курсом той же пары (int64).
+
+Курс пары хранится целым rate·10^scale, если все её курсы имеют не больше
+12 знаков после запятой, иначе — битами float64; оба способа без потерь.
+В manifest.json — границы каждого сегмента, поэтому чтение диапазона
+распаковывает только пересекающиеся с ним сегменты.
+"""
+import gzip
+import json
+import lzma
+import os
+import struct
+import sys
+import time
+from array import array
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+from .history import format_timestamp, parse_timestamp
+from ..infra.serialization import ArrayWriter, dump, iter_array
+
+MAGIC = b"VTHSEG01"
+_HEADER_SIZE = struct.Struct("<I")
+
+CODECS = {
+    "gzip": (".seg.gz", gzip.compress, gzip.decompress),
+    "lzma": (".seg.xz", lzma.compress, lzma.decompress),
+}
+
+_MAX_SCALE = 12
+# Масштаб пары, курсы которой хранятся битами float64
+_FLOAT_BITS = -1
+_BITS = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+
+_BASE_FIELDS = ("id", "from_currency", "to_currency", "rate", "timestamp", "source")
+
+
+def _month_of(micros: int) -> str:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _default_id(pair_key: str, record: Dict) -> str:
+    if "interval" in record:
+        return f"{pair_key}_{record['interval']}_{record.get('bar_start')}"
+    return f"{pair_key}_{record['timestamp']}"
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _scale_for(rates: Iterable[float]) -> int:
+    """Наименьший масштаб, при котором rate == round(rate·10^s) / 10^s"""
+    rates = list(rates)
+    for scale in range(_MAX_SCALE + 1):
+        factor = 10 ** scale
+        if all(abs(rate) * factor < 2 ** 62 and round(rate * factor) / factor == rate
+               for rate in rates):
+            return scale
+    return _FLOAT_BITS
+
+
+class SegmentBuilder:
+    """Накопитель записей одного сегмента в столбцах"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._pairs: Dict[str, int] = {}
+        self._sources: Dict[str, int] = {}
+        self._extras: Dict[str, int] = {}
+        self.pair_ids = array('H')
+        self.source_ids = array('H')
+        self.extra_ids = array('I')
+        self.times = array('q')
+        self.rates = array('d')
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def pair_keys(self) -> List[str]:
+        return list(self._pairs)
+
+    @staticmethod
+    def _intern(table: Dict[str, int], value: str) -> int:
+        index = table.get(value)
+        if index is None:
+            index = table[value] = len(table)
+        return index
+
+    def add(self, record: Dict, micros: Optional[int] = None):
+        pair_key = f"{record['from_currency']}_{record['to_currency']}"
+        if micros is None:
+            micros = round(parse_timestamp(record["timestamp"]) * 1_000_000)
+        extra = {key: value for key, value in record.items() if key not in _BASE_FIELDS}
+        # Поля, которые не восстанавливаются из столбцов, сохраняются как есть
+        if record.get("id") != _default_id(pair_key, record):
+            extra["id"] = record.get("id")
+        if format_timestamp(micros / 1_000_000) != record["timestamp"]:
+            extra["timestamp"] = record["timestamp"]
+
+        self.pair_ids.append(self._intern(self._pairs, pair_key))
+        self.source_ids.append(self._intern(self._sources, record.get("source", "")))
+        self.extra_ids.append(
+            self._intern(self._extras, json.dumps(extra, ensure_ascii=False)) + 1 if extra else 0)
+        self.times.append(micros)
+        self.rates.append(float(record["rate"]))
+
+    def add_segment(self, path: Path, codec: str):
+        for record in read_segment(path, codec):
+            self.add(record)
+
+    def encode(self) -> bytes:
+        pairs = list(self._pairs)
+        by_pair: List[List[float]] = [[] for _ in pairs]
+        for pair_id, rate in zip(self.pair_ids, self.rates):
+            by_pair[pair_id].append(rate)
+        scales = [_scale_for(rates) for rates in by_pair]
+
+        time_deltas = array('q', (b - a for a, b in zip([0] + list(self.times[:-1]), self.times)))
+        rate_deltas = array('q')
+        previous = [0] * len(pairs)
+        for pair_id, rate in zip(self.pair_ids, self.rates):
+            scale = scales[pair_id]
+            if scale == _FLOAT_BITS:
+                value = _BITS.unpack(_FLOAT.pack(rate))[0]
+            else:
+                value = round(rate * 10 ** scale)
+            rate_deltas.append(value - previous[pair_id])
+            previous[pair_id] = value
+
+        header = json.dumps({
+            "count": len(self),
+            "start": min(self.times, default=0),
+            "end": max(self.times, default=0),
+            "pairs": pairs,
+            "scales": scales,
+            "sources": list(self._sources),
+            "extras": list(self._extras)
+        }, ensure_ascii=False).encode("utf-8")
+        return b"".join((MAGIC, _HEADER_SIZE.pack(len(header)), header,
+                         _little_endian(self.pair_ids), _little_endian(self.source_ids),
+                         _little_endian(self.extra_ids), _little_endian(time_deltas),
+                         _little_endian(rate_deltas)))
+
+
+def decode_segment(payload: bytes, start: Optional[int] = None, end: Optional[int] = None,
+                   pairs: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    """Записи распакованного сегмента; start/end — границы в мкс включительно"""
+    if payload[:len(MAGIC)] != MAGIC:
+        raise ValueError("Неизвестный формат сегмента истории")
+    offset = len(MAGIC)
+    (header_size,) = _HEADER_SIZE.unpack_from(payload, offset)
+    offset += _HEADER_SIZE.size
+    header = json.loads(payload[offset:offset + header_size])
+    offset += header_size
+
+    count = header["count"]
+    columns = {}
+    for name, typecode in (("pair", 'H'), ("source", 'H'), ("extra", 'I'),
+                           ("time", 'q'), ("rate", 'q')):
+        size = array(typecode).itemsize * count
+        columns[name] = _from_little_endian(typecode, payload[offset:offset + size])
+        offset += size
+
+    pair_keys = header["pairs"]
+    currencies = [pair_key.split('_', 1) for pair_key in pair_keys]
+    divisors = [10 ** scale if scale != _FLOAT_BITS else None for scale in header["scales"]]
+    sources = header["sources"]
+    extras = [json.loads(extra) for extra in header["extras"]]
+    wanted = None if pairs is None else {pair_keys.index(pair_key) for pair_key in pairs
+                                         if pair_key in pair_keys}
+
+    values = [0] * len(pair_keys)
+    # Записи одного обновления идут подряд с одним временем
+    last_micros, last_timestamp = None, None
+    for pair_id, source_id, extra_id, micros, delta in zip(
+            columns["pair"], columns["source"], columns["extra"],
+            accumulate(columns["time"]), columns["rate"]):
+        # Курс восстанавливается и для пропускаемых записей: разности по паре
+        values[pair_id] += delta
+        if wanted is not None and pair_id not in wanted:
+            continue
+        if (start is not None and micros < start) or (end is not None and micros > end):
+            continue
+        divisor = divisors[pair_id]
+        if divisor is None:
+            rate = _FLOAT.unpack(_BITS.pack(values[pair_id]))[0]
+        else:
+            rate = values[pair_id] / divisor
+
+        extra = dict(extras[extra_id - 1]) if extra_id else {}
+        if micros != last_micros:
+            last_micros, last_timestamp = micros, format_timestamp(micros / 1_000_000)
+        timestamp = extra.pop("timestamp", None) or last_timestamp
+        from_currency, to_currency = currencies[pair_id]
+        record = {
+            "id": extra.pop("id", None),
+            "from_currency": from_currency,
+            "to_currency": to_currency,
+            "rate": rate,
+            "timestamp": timestamp,
+            "source": sources[source_id]
+        }
+        record.update(extra)
+        if record["id"] is None:
+            record["id"] = _default_id(pair_keys[pair_id], record)
+        yield record
+
+
+def read_segment(path: Path, codec: str, start: Optional[int] = None,
+                 end: Optional[int] = None, pairs: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    decompress = CODECS[codec][2]
+    with open(path, 'rb') as f:
+        payload = decompress(f.read())
+    yield from decode_segment(payload, start, end, pairs)
+
+
+class HistoryArchive:
+    """Каталог сегментов истории и manifest.json с их границами"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / "manifest.json"
+
+    def segments(self) -> List[Dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)["segments"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return []
+
+    def mtime(self) -> Optional[int]:
+        try:
+            return self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _save_manifest(self, segments: List[Dict]):
+        temp_file = self.manifest_path.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            dump({"segments": sorted(segments, key=lambda item: item["name"])}, f)
+        temp_file.replace(self.manifest_path)
+
+    def iter_records(self, start: Optional[float] = None, end: Optional[float] = None,
+                     pairs: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """Записи архива в диапазоне [start, end] (секунды эпохи).
+
+        Генератор: сегменты распаковываются по одному и только те, чьи
+        границы и набор пар пересекаются с запросом.
+        """
+        start_us = None if start is None else round(start * 1_000_000)
+        end_us = None if end is None else round(end * 1_000_000)
+        pairs = None if pairs is None else set(pairs)
+        for segment in self.segments():
+            if start_us is not None and segment["end"] < start_us:
+                continue
+            if end_us is not None and segment["start"] > end_us:
+                continue
+            if pairs is not None and pairs.isdisjoint(segment["pairs"]):
+                continue
+            yield from read_segment(self.directory / segment["file"], segment["codec"],
+                                    start_us, end_us, pairs)
+
+    def seal(self, history_path: Path, codec: str = "gzip", now: Optional[float] = None) -> Dict:
+        """Переносит записи закрытых месяцев из файла истории в сегменты.
+
+        Месяц закрыт, если он раньше текущего (UTC). Записи, пришедшие в уже
+        запечатанный месяц, дописываются в его сегмент с перезаписью. Сначала
+        пишутся сегменты и манифест, затем файл истории без перенесённых
+        записей — каждый файл заменяется атомарно.
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Неизвестный кодек архива: {codec}")
+        history_path = Path(history_path)
+        now = time.time() if now is None else now
+        open_month = _month_of(round(now * 1_000_000))
+        started = time.perf_counter()
+        stats = {"records_in": 0, "sealed": 0, "kept": 0, "segments": [],
+                 "bytes_before": history_path.stat().st_size if history_path.exists() else 0}
+        if not history_path.exists():
+            stats.update(bytes_after=0, archive_bytes=0, raw_bytes=0, seconds=0.0)
+            return stats
+
+        self.directory.mkdir(exist_ok=True, parents=True)
+        builders: Dict[str, SegmentBuilder] = {}
+        temp_history = history_path.with_suffix(f'.seal.{os.getpid()}.tmp')
+        with open(temp_history, 'w', encoding='utf-8') as out:
+            writer = ArrayWriter(out)
+            for record in iter_array(history_path):
+                stats["records_in"] += 1
+                micros = round(parse_timestamp(record["timestamp"]) * 1_000_000)
+                month = _month_of(micros)
+                if month >= open_month:
+                    writer.write(record)
+                    continue
+                builder = builders.get(month)
+                if builder is None:
+                    builder = builders[month] = SegmentBuilder(month)
+                builder.add(record, micros)
+            writer.close()
+            stats["kept"] = writer.count
+
+        segments = {segment["name"]: segment for segment in self.segments()}
+        suffix, compress, _ = CODECS[codec]
+        for month, builder in sorted(builders.items()):
+            stats["sealed"] += len(builder)
+            existing = segments.get(month)
+            if existing is not None:
+                # Старые записи месяца идут первыми, порядок пары сохраняется
+                merged = SegmentBuilder(month)
+                merged.add_segment(self.directory / existing["file"], existing["codec"])
+                for record in decode_segment(builder.encode()):
+                    merged.add(record)
+                builder = merged
+
+            payload = builder.encode()
+            compressed = compress(payload)
+            segment_path = self.directory / f"{month}{suffix}"
+            temp_file = segment_path.with_suffix('.tmp')
+            with open(temp_file, 'wb') as f:
+                f.write(compressed)
+            temp_file.replace(segment_path)
+            if existing is not None and existing["file"] != segment_path.name:
+                (self.directory / existing["file"]).unlink(missing_ok=True)
+
+            segments[month] = {
+                "name": month,
+                "file": segment_path.name,
+                "codec": codec,
+                "start": min(builder.times),
+                "end": max(builder.times),
+                "records": len(builder),
+                "pairs": sorted(builder.pair_keys()),
+                "raw_bytes": len(payload),
+                "bytes": len(compressed)
+            }
+            stats["segments"].append(segments[month])
+
+        if builders:
+            self._save_manifest(list(segments.values()))
+            temp_history.replace(history_path)
+        else:
+            temp_history.unlink()
+
+        stats["bytes_after"] = history_path.stat().st_size
+        stats["archive_bytes"] = sum(segment["bytes"] for segment in segments.values())
+        stats["raw_bytes"] = sum(segment["raw_bytes"] for segment in segments.values())
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+
+def iter_history(history_path: Path, archive: Optional[HistoryArchive] = None,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 pairs: Optional[Iterable[str]] = None, lock=None) -> Iterator[Dict]:
+    """Вся история: сначала архив, затем открытый файл истории.
+
+    lock — блокировка файла истории: открытый файл дописывается на месте,
+    и без неё чтение может застать недописанный хвост, а перенос месяцев в
+    архив — пропустить или повторить записи. Держится до конца перебора.
+    """
+    with lock or nullcontext():
+        yield from _iter_history(Path(history_path), archive, start, end, pairs)
+
+
+def _iter_history(history_path: Path, archive: Optional[HistoryArchive],
+                  start: Optional[float], end: Optional[float],
+                  pairs: Optional[Iterable[str]]) -> Iterator[Dict]:
+    pairs = None if pairs is None else set(pairs)
+    if archive is not None:
+        yield from archive.iter_records(start, end, pairs)
+    if not history_path.exists():
+        return
+    for record in iter_array(history_path):
+        if pairs is not None and f"{record['from_currency']}_{record['to_currency']}" not in pairs:
+            continue
+        if start is not None or end is not None:
+            moment = parse_timestamp(record["timestamp"])
+            if (start is not None and moment < start) or (end is not None and moment > end):
+                continue
+        yield record
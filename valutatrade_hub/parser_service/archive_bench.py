@@ -0,0 +1,118 @@
+"""Размер и скорость чтения архива истории против JSON-файла.
+
+Запуск: python -m valutatrade_hub.parser_service.archive_bench --days 180 --pairs 8
+
+Во временном каталоге строится синтетическая история (случайное блуждание
+курсов, часть пар — с произвольным числом знаков, как у обратных курсов),
+записанная как save_to_history. Для каждого кодека история
+запечатывается в сегменты; печатаются размеры, время запечатывания,
+скорость полного просмотра и чтения недельного диапазона, а также
+проверка, что архив возвращает записи без изменений.
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from .archive import CODECS, HistoryArchive
+from .history import format_timestamp, parse_timestamp
+from ..infra.serialization import ArrayWriter, iter_array
+
+_DAY = 86400
+
+
+def _generate(path: Path, days: int, pairs: int, interval: float, seed: int) -> int:
+    rng = random.Random(seed)
+    codes = [f"C{i:02d}" for i in range(pairs)]
+    prices = {code: rng.uniform(0.01, 50000) for code in codes}
+    end = time.time() - 40 * _DAY
+    moment = end - days * _DAY
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        writer = ArrayWriter(f)
+        while moment < end:
+            timestamp = format_timestamp(moment)
+            meta = {"request_ms": round(rng.uniform(80, 400), 1), "status_code": 200}
+            for i, code in enumerate(codes):
+                prices[code] *= 1 + rng.gauss(0, 0.001)
+                # Каждая четвёртая пара — обратный курс со всеми знаками float
+                rate = 1 / prices[code] if i % 4 == 3 else round(prices[code], 2 + i % 4 * 2)
+                writer.write({
+                    "id": f"{code}_USD_{timestamp}",
+                    "from_currency": code,
+                    "to_currency": "USD",
+                    "rate": rate,
+                    "timestamp": timestamp,
+                    "source": "CoinGecko" if i % 2 else "ExchangeRate-API",
+                    "meta": meta
+                })
+                count += 1
+            moment += interval
+        writer.close()
+    return count
+
+
+def _timed(iterable) -> tuple:
+    started = time.perf_counter()
+    count = sum(1 for _ in iterable)
+    return count, time.perf_counter() - started
+
+
+def run(args, workdir: Path):
+    source = workdir / "history.json"
+    total = _generate(source, args.days, args.pairs, args.interval, args.seed)
+    json_bytes = source.stat().st_size
+
+    started = time.perf_counter()
+    with open(source, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    load_seconds = time.perf_counter() - started
+    _, stream_seconds = _timed(iter_array(source))
+
+    print(f"Записей: {total}, пар: {args.pairs}, дней: {args.days}")
+    print(f"JSON: {json_bytes / 2 ** 20:,.1f} МБ")
+    print(f"   json.load: {load_seconds:.2f} с, {total / load_seconds:,.0f} записей/с")
+    print(f"   потоковое чтение: {stream_seconds:.2f} с, {total / stream_seconds:,.0f} записей/с")
+
+    range_start = parse_timestamp(records[len(records) // 2]["timestamp"])
+    for codec in args.codecs:
+        history = workdir / f"history-{codec}.json"
+        shutil.copy(source, history)
+        archive = HistoryArchive(workdir / f"archive-{codec}")
+        stats = archive.seal(history, codec)
+
+        count, scan_seconds = _timed(archive.iter_records())
+        touched = [segment for segment in archive.segments()
+                   if segment["end"] >= range_start * 1e6
+                   and segment["start"] <= (range_start + 7 * _DAY) * 1e6]
+        range_count, range_seconds = _timed(
+            archive.iter_records(range_start, range_start + 7 * _DAY))
+        lossless = all(a == b for a, b in zip(records, archive.iter_records())) and count == total
+
+        print(f"\n{codec}: {len(stats['segments'])} сегментов, "
+              f"{stats['archive_bytes'] / 2 ** 20:,.2f} МБ — в {json_bytes / stats['archive_bytes']:,.0f} раз "
+              f"меньше JSON (столбцы без сжатия: {stats['raw_bytes'] / 2 ** 20:,.1f} МБ)")
+        print(f"   запечатывание: {stats['seconds']:.2f} с")
+        print(f"   полный просмотр: {scan_seconds:.2f} с, {count / scan_seconds:,.0f} записей/с")
+        print(f"   неделя ({range_count} записей): {range_seconds * 1000:.0f} мс, "
+              f"распаковано сегментов: {len(touched)} из {len(stats['segments'])}")
+        print(f"   без потерь: {'да' if lossless else 'НЕТ'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архив истории курсов против JSON")
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--pairs", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=600, help="Шаг записей, с")
+    parser.add_argument("--codecs", nargs="+", choices=sorted(CODECS), default=sorted(CODECS))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="valutatrade-archive-") as workdir:
+        run(args, Path(workdir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Бинарный снимок курсов фиксированной раскладки для чтения через mmap.
+
+Раскладка (little-endian):
+  заголовок 64 байта: magic, версия формата, число слотов, число
+  заполненных пар, поколение снимка, время last_refresh (мкс),
+  код базовой валюты;
+  таблица кодов: слот -> 8 байт ASCII-кода валюты;
+  курсы: float64 на слот, курс валюты слота к базовой;
+  время: int64 на слот, момент обновления курса (мкс с эпохи, UTC).
+
+Номер слота совпадает с id валюты в реестре, поэтому чтение курса —
+одно вычисление смещения без разбора файла.
+"""
+import math
+import mmap
+import os
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from ..core.currencies import get_registry
+
+MAGIC = b"VTRATES1"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIIQq8s20x")
+CODE_SIZE = 8
+
+_RATE = struct.Struct("<d")
+_TIMESTAMP = struct.Struct("<q")
+
+
+def _to_micros(timestamp: Optional[str]) -> int:
+    if not timestamp:
+        return 0
+    moment = datetime.fromisoformat(timestamp.rstrip('Z')).replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1_000_000)
+
+
+def _from_micros(micros: int) -> Optional[str]:
+    if not micros:
+        return None
+    moment = datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc)
+    return moment.replace(tzinfo=None).isoformat() + "Z"
+
+
+def write_binary_snapshot(path: Path, snapshot, base_currency: str, generation: int):
+    """Атомарно записывает снимок: временный файл и os.replace"""
+    registry = get_registry()
+    suffix = f"_{base_currency}"
+
+    slots = {}
+    for pair_key, record in snapshot.items():
+        if not pair_key.endswith(suffix):
+            continue
+        currency = registry.find(pair_key[:-len(suffix)])
+        if currency is not None:
+            slots[currency.currency_id] = (currency.code, record)
+
+    count = max(slots, default=-1) + 1
+    codes = bytearray(CODE_SIZE * count)
+    rates = bytearray(8 * count)
+    timestamps = bytearray(8 * count)
+    for slot in range(count):
+        if slot in slots:
+            code, record = slots[slot]
+            codes[CODE_SIZE * slot:CODE_SIZE * slot + len(code)] = code.encode('ascii')
+            _RATE.pack_into(rates, 8 * slot, record["rate"])
+            _TIMESTAMP.pack_into(timestamps, 8 * slot, _to_micros(record["updated_at"]))
+        else:
+            _RATE.pack_into(rates, 8 * slot, math.nan)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, count, len(slots), generation,
+                         _to_micros(snapshot.last_refresh),
+                         base_currency.encode('ascii'))
+
+    temp_file = path.with_suffix('.bin.tmp')
+    with open(temp_file, 'wb') as f:
+        f.write(header)
+        f.write(codes)
+        f.write(rates)
+        f.write(timestamps)
+        f.flush()
+        os.fsync(f.fileno())
+    temp_file.replace(path)
+
+
+class BinaryRatesSnapshot:
+    """Открытый через mmap снимок; читается без разбора JSON"""
+
+    __slots__ = ('_mm', '_count', 'pairs_count', 'generation', 'last_refresh',
+                 'base_currency', '_rates_offset', '_timestamps_offset', 'inode')
+
+    def __init__(self, mm: mmap.mmap, inode: int):
+        (magic, version, count, pairs_count, generation,
+         last_refresh, base) = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Неизвестный формат бинарного снимка курсов")
+        self._mm = mm
+        self._count = count
+        self.pairs_count = pairs_count
+        self.generation = generation
+        self.last_refresh = _from_micros(last_refresh)
+        self.base_currency = base.rstrip(b"\0").decode('ascii')
+        self._rates_offset = HEADER.size + CODE_SIZE * count
+        self._timestamps_offset = self._rates_offset + 8 * count
+        self.inode = inode
+
+    @classmethod
+    def open(cls, path: Path) -> "BinaryRatesSnapshot":
+        with open(path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, inode)
+
+    def _slot(self, code: str) -> int:
+        currency = get_registry().find(code)
+        if currency is None:
+            return -1
+        slot = currency.currency_id
+        if slot >= self._count:
+            return -1
+        # Сверка кода защищает от разного порядка id в разных процессах
+        start = HEADER.size + CODE_SIZE * slot
+        if self._mm[start:start + CODE_SIZE].rstrip(b"\0") != currency.code.encode('ascii'):
+            return -1
+        return slot
+
+    def get_rate(self, code: str) -> Optional[float]:
+        """Курс валюты к базовой или None"""
+        if code == self.base_currency:
+            return 1.0
+        slot = self._slot(code)
+        if slot < 0:
+            return None
+        rate = _RATE.unpack_from(self._mm, self._rates_offset + 8 * slot)[0]
+        return None if math.isnan(rate) else rate
+
+    def get_updated_at(self, code: str) -> Optional[str]:
+        slot = self._slot(code)
+        if slot < 0:
+            return None
+        return _from_micros(_TIMESTAMP.unpack_from(self._mm, self._timestamps_offset + 8 * slot)[0])
+
+    def get_pair_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        # Только прямая и обратная пара к базовой валюте, как в rates.json
+        if to_currency == self.base_currency:
+            return self.get_rate(from_currency)
+        if from_currency == self.base_currency:
+            rate = self.get_rate(to_currency)
+            return 1 / rate if rate else None
+        return None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mm.close()
+
+
+def read_generation(path: Path) -> int:
+    try:
+        with open(path, 'rb') as f:
+            magic, _, _, _, generation, _, _ = HEADER.unpack(f.read(HEADER.size))
+        return generation if magic == MAGIC else 0
+    except (FileNotFoundError, struct.error):
+        return 0
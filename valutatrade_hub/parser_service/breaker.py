@@ -0,0 +1,152 @@
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from ..infra.locking import FileLock
+from ..infra.serialization import dump
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BreakerState:
+    """Состояние автомата одного источника"""
+
+    __slots__ = ('state', 'failures', 'trips', 'open_until', 'probe_started_at', 'last_error')
+
+    def __init__(self, state: str = CLOSED, failures: int = 0, trips: int = 0,
+                 open_until: float = 0.0, probe_started_at: float = 0.0,
+                 last_error: Optional[str] = None):
+        self.state = state
+        # Подряд неудачных запросов в закрытом состоянии
+        self.failures = failures
+        # Подряд размыканий: от них растёт пауза до следующей пробы
+        self.trips = trips
+        self.open_until = open_until
+        self.probe_started_at = probe_started_at
+        self.last_error = last_error
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BreakerState":
+        return cls(data.get("state", CLOSED), data.get("failures", 0), data.get("trips", 0),
+                   data.get("open_until", 0.0), data.get("probe_started_at", 0.0),
+                   data.get("last_error"))
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "open_until": self.open_until,
+            "probe_started_at": self.probe_started_at,
+            "last_error": self.last_error
+        }
+
+    def describe(self, now: float) -> Dict:
+        retry_at = None
+        if self.state == OPEN:
+            retry_at = datetime.utcfromtimestamp(self.open_until).isoformat() + "Z"
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "retry_at": retry_at,
+            "retry_in_s": round(max(0.0, self.open_until - now), 1) if self.state == OPEN else 0.0,
+            "last_error": self.last_error
+        }
+
+
+class CircuitBreakers:
+    """Автоматы отключения источников курсов в data/breakers.json.
+
+    После failure_threshold ошибок подряд источник размыкается: запросы к
+    нему не выполняются до истечения паузы base_delay·2^(n-1) со случайным
+    разбросом ±jitter, затем пропускается одна проба (half-open). Успешная
+    проба замыкает автомат, неудачная размыкает снова с удвоенной паузой.
+    Файл общий для всех процессов, поэтому проба идёт только из одного.
+    """
+
+    def __init__(self, path="data/breakers.json", failure_threshold: int = 3,
+                 base_delay: float = 30.0, max_delay: float = 1800.0, jitter: float = 0.2,
+                 probe_timeout: float = 20.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        # Проба, не отчитавшаяся за это время, считается потерянной
+        self.probe_timeout = probe_timeout
+        self._lock = FileLock(self.path)
+
+    def _load(self) -> Dict[str, BreakerState]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        return {name: BreakerState.from_dict(item) for name, item in data.items()}
+
+    def _save(self, states: Dict[str, BreakerState]):
+        data = {name: state.to_dict() for name, state in states.items()}
+        temp_file = self.path.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            dump(data, f)
+        temp_file.replace(self.path)
+
+    def _delay(self, trips: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (trips - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def allow(self, name: str) -> bool:
+        """Можно ли сейчас обращаться к источнику"""
+        return self.admit(name) is None
+
+    def admit(self, name: str) -> Optional[Dict]:
+        """None — запрос разрешён (возможно, как проба); иначе описание
+        состояния, из-за которого источник пропускается, из того же чтения"""
+        with self._lock:
+            states = self._load()
+            state = states.get(name)
+            if state is None or state.state == CLOSED:
+                return None
+            now = time.time()
+            if state.state == OPEN and now < state.open_until:
+                return state.describe(now)
+            if state.state == HALF_OPEN and now - state.probe_started_at < self.probe_timeout:
+                return state.describe(now)
+            state.state = HALF_OPEN
+            state.probe_started_at = now
+            self._save(states)
+            return None
+
+    def record_success(self, name: str):
+        with self._lock:
+            states = self._load()
+            state = states.get(name)
+            if state is None or (state.state == CLOSED and not state.failures):
+                return
+            states[name] = BreakerState()
+            self._save(states)
+
+    def record_failure(self, name: str, error: str):
+        with self._lock:
+            states = self._load()
+            state = states.setdefault(name, BreakerState())
+            state.last_error = error
+            state.failures += 1
+            if state.state == HALF_OPEN or state.failures >= self.failure_threshold:
+                state.trips += 1
+                state.state = OPEN
+                state.open_until = time.time() + self._delay(state.trips)
+                state.failures = 0
+            self._save(states)
+
+    def states(self) -> Dict[str, Dict]:
+        with self._lock:
+            states = self._load()
+        now = time.time()
+        return {name: state.describe(now) for name, state in states.items()}
@@ -1,7 +1,35 @@
-
 import os
 from dataclasses import dataclass, field
 from typing import Dict, Tuple
+from ..core.currencies import get_registry
+
+
+def _fiat_codes() -> Tuple[str, ...]:
+    return tuple(code for code in get_registry().codes("fiat")
+                 if code != ParserConfig.BASE_CURRENCY)
+
+
+def _crypto_codes() -> Tuple[str, ...]:
+    return tuple(currency.code for currency in get_registry()
+                 if currency.kind == "crypto" and currency.coingecko_id)
+
+
+def _env_list(name: str) -> Tuple[str, ...]:
+    return tuple(item.strip() for item in os.getenv(name, "").split(",") if item.strip())
+
+
+def _env_weights(name: str) -> Dict[str, float]:
+    # "coingecko=2,exchangerate=1"
+    weights = {}
+    for item in _env_list(name):
+        source, _, weight = item.partition("=")
+        weights[source.strip()] = float(weight)
+    return weights
+
+
+def _crypto_id_map() -> Dict[str, str]:
+    return {currency.code: currency.coingecko_id for currency in get_registry()
+            if currency.kind == "crypto" and currency.coingecko_id}
 
 
 @dataclass
@@ -9,23 +37,85 @@ class ParserConfig:
 
     EXCHANGERATE_API_KEY: str = os.getenv("EXCHANGERATE_API_KEY", "")
 
-    COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
-    EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
+    COINGECKO_URL: str = os.getenv(
+        "COINGECKO_URL", "https://api.coingecko.com/api/v3/simple/price")
+    COINGECKO_MARKETS_URL: str = os.getenv(
+        "COINGECKO_MARKETS_URL", "https://api.coingecko.com/api/v3/coins/markets")
+    EXCHANGERATE_API_URL: str = os.getenv(
+        "EXCHANGERATE_API_URL", "https://v6.exchangerate-api.com/v6")
 
     BASE_CURRENCY: str = "USD"
 
-    FIAT_CURRENCIES: Tuple[str, ...] = field(
-        default_factory=lambda: ("EUR", "CAD", "JPY", "GBP", "AUD", "SCR", "RUB"))
-    CRYPTO_CURRENCIES: Tuple[str, ...] = field(
-        default_factory=lambda: ("BTC", "ETH", "SOL"))
+    # Списки валют берутся из реестра core/currencies.json
+    FIAT_CURRENCIES: Tuple[str, ...] = field(default_factory=_fiat_codes)
+    CRYPTO_CURRENCIES: Tuple[str, ...] = field(default_factory=_crypto_codes)
 
-    CRYPTO_ID_MAP: Dict[str, str] = field(default_factory=lambda: {
-        "BTC": "bitcoin",
-        "ETH": "ethereum",
-        "SOL": "solana",
-    })
+    CRYPTO_ID_MAP: Dict[str, str] = field(default_factory=_crypto_id_map)
 
     RATES_FILE_PATH: str = "data/rates.json"
     HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    # Гистограммы задержек запросов к источникам
+    LATENCY_FILE_PATH: str = "data/latency.json"
+    # Автоматы отключения источников
+    BREAKERS_FILE_PATH: str = "data/breakers.json"
 
     REQUEST_TIMEOUT: int = 10
+
+    # Сохранять все валюты из ответа ExchangeRate-API (~160), а не только
+    # фиатные валюты реестра; новые коды добавляются в реестр
+    EXCHANGERATE_KEEP_ALL: bool = os.getenv(
+        "EXCHANGERATE_KEEP_ALL", "").lower() in ("1", "true", "yes")
+
+    # Топ-N монет по капитализации из /coins/markets; 0 — только монеты
+    # реестра через /simple/price без капитализации
+    COINGECKO_TOP_N: int = int(os.getenv("COINGECKO_TOP_N", "100"))
+    COINGECKO_PER_PAGE: int = 250
+    COINGECKO_MAX_WORKERS: int = 4
+
+    # Источники курсов из реестра api_clients; пусто — все зарегистрированные
+    ENABLED_SOURCES: Tuple[str, ...] = field(
+        default_factory=lambda: _env_list("RATES_SOURCES"))
+    # Сведение котировок одной пары от нескольких источников:
+    # "median" или "weighted" (веса источников, по умолчанию 1)
+    AGGREGATION_METHOD: str = os.getenv("RATES_AGGREGATION", "median")
+    SOURCE_WEIGHTS: Dict[str, float] = field(
+        default_factory=lambda: _env_weights("RATES_SOURCE_WEIGHTS"))
+    # Порог выброса в оценках σ = 1.4826·MAD от медианы котировок
+    OUTLIER_THRESHOLD: float = 3.5
+
+    # Источник отключается после стольких ошибок подряд; пауза до пробного
+    # запроса удваивается с каждым размыканием (с разбросом ±BREAKER_JITTER)
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+    BREAKER_BASE_DELAY: float = 30.0
+    BREAKER_MAX_DELAY: float = 1800.0
+    BREAKER_JITTER: float = 0.2
+
+    # Воспроизведение записанной истории (источник "replay"): файл истории
+    # (пусто — HISTORY_FILE_PATH), ускорение (0 — точка истории на каждое
+    # обновление), сдвиг старта от первой записи в секундах, повтор по кругу
+    REPLAY_HISTORY_PATH: str = os.getenv("REPLAY_HISTORY_PATH", "")
+    REPLAY_SPEED: float = float(os.getenv("REPLAY_SPEED", "0"))
+    REPLAY_START_OFFSET: float = float(os.getenv("REPLAY_START_OFFSET", "0"))
+    REPLAY_LOOP: bool = os.getenv("REPLAY_LOOP", "").lower() in ("1", "true", "yes")
+
+    @classmethod
+    def for_replay(cls, history_path: str = "", speed: float = 0.0,
+                   start_offset: float = 0.0, loop: bool = False) -> "ParserConfig":
+        """Конфиг, в котором курсы берутся только из записанной истории"""
+        return cls(ENABLED_SOURCES=("replay",), REPLAY_HISTORY_PATH=history_path,
+                   REPLAY_SPEED=speed, REPLAY_START_OFFSET=start_offset, REPLAY_LOOP=loop)
+
+    # Хранение истории (compact-history): сырые точки — HISTORY_RAW_DAYS
+    # дней, затем минутные свечи до HISTORY_MINUTE_DAYS, часовые до
+    # HISTORY_HOUR_DAYS, дальше дневные
+    HISTORY_RAW_DAYS: float = float(os.getenv("HISTORY_RAW_DAYS", "7"))
+    HISTORY_MINUTE_DAYS: float = float(os.getenv("HISTORY_MINUTE_DAYS", "30"))
+    HISTORY_HOUR_DAYS: float = float(os.getenv("HISTORY_HOUR_DAYS", "365"))
+
+    # Архив закрытых месяцев истории (archive-history): каталог сегментов
+    # и кодек сжатия — "gzip" или "lzma"
+    HISTORY_ARCHIVE_DIR: str = "data/history"
+    HISTORY_ARCHIVE_CODEC: str = os.getenv("HISTORY_ARCHIVE_CODEC", "gzip")
+
+    # Скользящие статистики пар (rate-stats) за 1ч/24ч/7д
+    RATE_STATS_FILE_PATH: str = "data/rate_stats.json"
@@ -0,0 +1,114 @@
+"""Сведение котировок нескольких источников в один курс на пару.
+
+Котировки раскладываются в матрицу пары × источники (NaN — источник пару
+не котирует), медиана, MAD и отбор выбросов считаются сразу по всем парам.
+Без NumPy тот же расчёт выполняется построчно.
+"""
+import math
+from statistics import median
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy — построчный расчёт
+    np = None
+
+MEDIAN = "median"
+WEIGHTED = "weighted"
+METHODS = (MEDIAN, WEIGHTED)
+
+# 1.4826 * MAD — оценка σ для нормального распределения
+_MAD_SCALE = 1.4826
+# Нижняя граница разброса: при совпадающем большинстве (MAD = 0)
+# не отбрасывается расхождение в пределах 0.1%
+_MIN_RELATIVE_SPREAD = 1e-3
+# Выбросы ищутся, только когда пару котируют хотя бы три источника
+_MIN_QUOTES = 3
+
+
+class Consensus:
+    """Итог сведения: курс на пару, использованные и отброшенные источники"""
+
+    __slots__ = ('rates', 'contributors', 'rejected')
+
+    def __init__(self):
+        self.rates: Dict[str, float] = {}
+        # пара -> источники, вошедшие в курс
+        self.contributors: Dict[str, List[str]] = {}
+        # источник -> пары, где его котировка признана выбросом
+        self.rejected: Dict[str, List[str]] = {}
+
+
+def aggregate(quotes: Dict[str, Dict[str, float]], weights: Optional[Dict[str, float]] = None,
+              method: str = MEDIAN, threshold: float = 3.5) -> Consensus:
+    """quotes: {источник: {пара: курс}}. Котировка отбрасывается, если
+    отклоняется от медианы больше чем на threshold·σ, где σ = 1.4826·MAD."""
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод сведения курсов: {method}")
+    names = [name for name, rates in quotes.items() if rates]
+    pairs = sorted({pair_key for name in names for pair_key in quotes[name]})
+    weights = [max(0.0, (weights or {}).get(name, 1.0)) for name in names]
+
+    if np is not None:
+        rates, inliers = _aggregate_matrix(quotes, names, pairs, weights, method, threshold)
+    else:
+        rates, inliers = _aggregate_rows(quotes, names, pairs, weights, method, threshold)
+
+    result = Consensus()
+    for i, pair_key in enumerate(pairs):
+        result.rates[pair_key] = rates[i]
+        result.contributors[pair_key] = [name for j, name in enumerate(names) if inliers[i][j]]
+        for j, name in enumerate(names):
+            if pair_key in quotes[name] and not inliers[i][j]:
+                result.rejected.setdefault(name, []).append(pair_key)
+    return result
+
+
+def _aggregate_matrix(quotes, names, pairs, weights, method, threshold):
+    index = {pair_key: i for i, pair_key in enumerate(pairs)}
+    values = np.full((len(pairs), len(names)), np.nan)
+    for j, name in enumerate(names):
+        column = quotes[name]
+        values[[index[pair_key] for pair_key in column], j] = list(column.values())
+
+    present = ~np.isnan(values)
+    center = np.nanmedian(values, axis=1)
+    deviation = np.abs(values - center[:, None])
+    mad = np.nanmedian(deviation, axis=1)
+    spread = np.maximum(_MAD_SCALE * mad, np.abs(center) * _MIN_RELATIVE_SPREAD)
+    inliers = present & (deviation <= threshold * spread[:, None])
+    few = present.sum(axis=1) < _MIN_QUOTES
+    inliers[few] = present[few]
+
+    kept = np.where(inliers, values, np.nan)
+    rates = np.nanmedian(kept, axis=1)
+    if method == WEIGHTED:
+        w = inliers * np.asarray(weights)
+        total = w.sum(axis=1)
+        weighted = (np.where(inliers, values, 0.0) * w).sum(axis=1) / np.where(total > 0, total, 1)
+        rates = np.where(total > 0, weighted, rates)
+    return rates.tolist(), inliers.tolist()
+
+
+def _aggregate_rows(quotes, names, pairs, weights, method, threshold):
+    rates, inliers = [], []
+    for pair_key in pairs:
+        row = [quotes[name].get(pair_key, math.nan) for name in names]
+        present = [not math.isnan(value) for value in row]
+        values = [value for value in row if not math.isnan(value)]
+        keep = present
+        if len(values) >= _MIN_QUOTES:
+            center = median(values)
+            mad = median(abs(value - center) for value in values)
+            spread = max(_MAD_SCALE * mad, abs(center) * _MIN_RELATIVE_SPREAD)
+            keep = [ok and abs(value - center) <= threshold * spread
+                    for ok, value in zip(present, row)]
+
+        rate = median(value for ok, value in zip(keep, row) if ok)
+        if method == WEIGHTED:
+            total = sum(w for ok, w in zip(keep, weights) if ok)
+            if total > 0:
+                rate = sum(value * w for ok, value, w in zip(keep, row, weights) if ok) / total
+        rates.append(rate)
+        inliers.append(keep)
+    return rates, inliers
@@ -0,0 +1,121 @@
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+def parse_timestamp(value: str) -> float:
+    """ISO-время (с 'Z' или без зоны, считается UTC) -> секунды эпохи"""
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def format_timestamp(seconds: float) -> str:
+    moment = datetime.fromtimestamp(seconds, tz=timezone.utc)
+    return moment.replace(tzinfo=None).isoformat() + "Z"
+
+
+class PairSeries:
+    """Отсортированные по времени точки одной пары: два параллельных массива"""
+
+    __slots__ = ('times', 'rates')
+
+    def __init__(self):
+        self.times = array('d')
+        self.rates = array('d')
+
+    def rate_at(self, moment: float) -> Optional[float]:
+        i = bisect_right(self.times, moment) - 1
+        return self.rates[i] if i >= 0 else None
+
+    def rates_at(self, moments: Sequence[float]) -> List[Optional[float]]:
+        # Моменты отсортированы, поэтому хватает одного слияния двух
+        # последовательностей вместо бинарного поиска на каждую дату
+        result = []
+        times, rates = self.times, self.rates
+        i, n = -1, len(times)
+        for moment in moments:
+            while i + 1 < n and times[i + 1] <= moment:
+                i += 1
+            result.append(rates[i] if i >= 0 else None)
+        return result
+
+
+class HistoryIndex:
+    """Индекс истории курсов по парам для запросов «курс на момент T»"""
+
+    def __init__(self):
+        self._series: Dict[str, PairSeries] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "HistoryIndex":
+        index = cls()
+        unsorted = set()
+        for record in records:
+            pair_key = f"{record['from_currency']}_{record['to_currency']}"
+            series = index._series.get(pair_key)
+            if series is None:
+                series = index._series[pair_key] = PairSeries()
+            moment = parse_timestamp(record["timestamp"])
+            if series.times and moment < series.times[-1]:
+                unsorted.add(pair_key)
+            series.times.append(moment)
+            series.rates.append(float(record["rate"]))
+        for pair_key in unsorted:
+            index._sort(pair_key)
+        return index
+
+    def _sort(self, pair_key: str):
+        series = self._series[pair_key]
+        points = sorted(zip(series.times, series.rates))
+        series.times = array('d', (moment for moment, _ in points))
+        series.rates = array('d', (rate for _, rate in points))
+
+    def pairs(self):
+        return tuple(self._series)
+
+    def series(self, pair_key: str) -> Optional[PairSeries]:
+        return self._series.get(pair_key)
+
+    def rate_at(self, from_currency: str, to_currency: str, moment: float) -> Optional[float]:
+        if from_currency == to_currency:
+            return 1.0
+        series = self._series.get(f"{from_currency}_{to_currency}")
+        if series is not None:
+            return series.rate_at(moment)
+        series = self._series.get(f"{to_currency}_{from_currency}")
+        if series is not None:
+            rate = series.rate_at(moment)
+            return 1 / rate if rate else None
+        return None
+
+    def rates_at(self, from_currency: str, to_currency: str,
+                 moments: Sequence[float]) -> List[Optional[float]]:
+        if from_currency == to_currency:
+            return [1.0] * len(moments)
+        result = [None] * len(moments)
+        series = self._series.get(f"{from_currency}_{to_currency}")
+        if series is not None:
+            result = series.rates_at(moments)
+        series = self._series.get(f"{to_currency}_{from_currency}")
+        if series is not None and None in result:
+            # Прямая пара могла появиться позже обратной: пропуски — из обратной
+            inverse = series.rates_at(moments)
+            result = [rate if rate is not None else (1 / back if back else None)
+                      for rate, back in zip(result, inverse)]
+        return result
+
+    def cross_rates_at(self, from_currency: str, to_currency: str, via: str,
+                       moments: Sequence[float]) -> List[Optional[float]]:
+        """Курс через промежуточную валюту (обычно USD) на те моменты,
+        для которых прямой или обратной пары ещё нет"""
+        direct = self.rates_at(from_currency, to_currency, moments)
+        if None not in direct:
+            return direct
+        first = self.rates_at(from_currency, via, moments)
+        second = self.rates_at(via, to_currency, moments)
+        return [rate if rate is not None else
+                (a * b if a is not None and b is not None else None)
+                for rate, a, b in zip(direct, first, second)]
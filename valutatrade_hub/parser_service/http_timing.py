@@ -0,0 +1,168 @@
+"""Замер этапов HTTP-запроса к источникам курсов.
+
+Сессия requests с собственными классами соединений urllib3: при открытии
+нового соединения отдельно засекаются DNS и установка соединения (TCP и
+TLS). Для соединения из пула keep-alive эти этапы равны нулю.
+"""
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+# Замер текущего запроса потока; соединение пишет в него этапы
+_active = threading.local()
+
+
+class RequestTiming:
+    """Этапы одного запроса в миллисекундах и размер ответа в байтах"""
+
+    __slots__ = ('url', 'status_code', 'dns_ms', 'connect_ms', 'ttfb_ms',
+                 'total_ms', 'bytes', 'reused')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.status_code: Optional[int] = None
+        self.dns_ms = 0.0
+        self.connect_ms = 0.0
+        # От начала запроса до разобранных заголовков ответа
+        self.ttfb_ms = 0.0
+        self.total_ms = 0.0
+        self.bytes = 0
+        self.reused = True
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "status_code": self.status_code,
+            "dns_ms": round(self.dns_ms, 1),
+            "connect_ms": round(self.connect_ms, 1),
+            "ttfb_ms": round(self.ttfb_ms, 1),
+            "total_ms": round(self.total_ms, 1),
+            "bytes": self.bytes,
+            "reused": self.reused
+        }
+
+
+class _TimingMixin:
+
+    def _new_conn(self):
+        timing = getattr(_active, "timing", None)
+        if timing is None:
+            return super()._new_conn()
+        timing.reused = False
+        started = time.perf_counter()
+        try:
+            # Семейство адресов — как у самого urllib3 (без IPv6 на хосте только A)
+            addresses = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(),
+                                           socket.SOCK_STREAM)
+        except OSError:
+            # Ошибку разрешения имени urllib3 сообщит сам
+            addresses = []
+        timing.dns_ms = (time.perf_counter() - started) * 1000
+        if not addresses:
+            return super()._new_conn()
+
+        # Соединяемся по уже найденным адресам, чтобы не разрешать имя дважды,
+        # и перебираем их по порядку, как create_connection: недоступный
+        # AAAA-адрес не мешает соединиться по IPv4. Для TLS имя хоста
+        # восстанавливается до рукопожатия
+        dns_host = self._dns_host
+        error = None
+        try:
+            for address in dict.fromkeys(item[4][0] for item in addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = dns_host
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            # Неудачная попытка тоже замеряется: таймаут соединения — данные
+            timing = getattr(_active, "timing", None)
+            if timing is not None:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing.connect_ms = max(0.0, elapsed_ms - timing.dns_ms)
+
+
+class _TimedHTTPConnection(_TimingMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimingMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+
+def timed_session() -> requests.Session:
+    session = requests.Session()
+    adapter = _TimedAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def timed_get(session: requests.Session, url: str, timings: List[RequestTiming],
+              **kwargs) -> requests.Response:
+    """GET с замером этапов; замер добавляется в timings и при ошибке"""
+    timing = RequestTiming(url)
+    _active.timing = timing
+    started = time.perf_counter()
+    try:
+        response = session.get(url, **kwargs)
+        timing.bytes = len(response.content)
+        timing.status_code = response.status_code
+        timing.ttfb_ms = response.elapsed.total_seconds() * 1000
+        return response
+    finally:
+        _active.timing = None
+        timing.total_ms = (time.perf_counter() - started) * 1000
+        timings.append(timing)
+
+
+def summarize(timings: List[RequestTiming], elapsed_ms: float) -> Dict:
+    """Сводка запросов одного источника для meta записей истории.
+
+    Страницы могут запрашиваться параллельно, поэтому этапы берутся
+    по самому медленному запросу, а request_ms — общее время источника.
+    """
+    failed = [timing.status_code for timing in timings if timing.status_code != 200]
+    return {
+        "request_ms": round(elapsed_ms, 1),
+        "status_code": failed[0] if failed else 200,
+        "requests": len(timings),
+        "dns_ms": round(max((timing.dns_ms for timing in timings), default=0.0), 1),
+        "connect_ms": round(max((timing.connect_ms for timing in timings), default=0.0), 1),
+        "ttfb_ms": round(max((timing.ttfb_ms for timing in timings), default=0.0), 1),
+        "bytes": sum(timing.bytes for timing in timings)
+    }
@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+from ..infra.locking import FileLock
+from ..infra.serialization import dump
+from .http_timing import RequestTiming
+
+# Верхние границы корзин, мс; последняя корзина — всё, что дольше
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Этапы запроса, по которым ведутся гистограммы
+METRICS = ("total", "dns", "connect", "ttfb")
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами"""
+
+    __slots__ = ('counts', 'count', 'sum_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        i = 0
+        while i < len(BUCKETS_MS) and value_ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-й процентиль"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return float(min(BUCKETS_MS[i], self.max_ms)) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    @property
+    def mean_ms(self) -> float:
+        return self.sum_ms / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict:
+        return {"counts": self.counts, "count": self.count,
+                "sum_ms": round(self.sum_ms, 1), "max_ms": round(self.max_ms, 1)}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        histogram = cls()
+        if len(data.get("counts", [])) == len(histogram.counts):
+            histogram.counts = list(data["counts"])
+            histogram.count = data["count"]
+            histogram.sum_ms = data["sum_ms"]
+            histogram.max_ms = data["max_ms"]
+        return histogram
+
+
+class SourceLatency:
+    """Накопленные замеры одного источника"""
+
+    __slots__ = ('requests', 'failures', 'bytes', 'histograms')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.histograms = {metric: LatencyHistogram() for metric in METRICS}
+
+    def observe(self, timing: RequestTiming):
+        self.requests += 1
+        if timing.status_code != 200:
+            self.failures += 1
+        self.bytes += timing.bytes
+        self.histograms["total"].observe(timing.total_ms)
+        if timing.status_code is not None:
+            self.histograms["ttfb"].observe(timing.ttfb_ms)
+        # Этапы соединения есть только у новых соединений
+        if not timing.reused:
+            self.histograms["dns"].observe(timing.dns_ms)
+            self.histograms["connect"].observe(timing.connect_ms)
+
+    def to_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "bytes": self.bytes,
+            "histograms": {metric: histogram.to_dict()
+                           for metric, histogram in self.histograms.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SourceLatency":
+        latency = cls()
+        latency.requests = data.get("requests", 0)
+        latency.failures = data.get("failures", 0)
+        latency.bytes = data.get("bytes", 0)
+        for metric, histogram in data.get("histograms", {}).items():
+            if metric in latency.histograms:
+                latency.histograms[metric] = LatencyHistogram.from_dict(histogram)
+        return latency
+
+
+class LatencyStore:
+    """Гистограммы задержек по источникам в data/latency.json.
+
+    Копятся между запусками, чтобы таймауты можно было выбирать по данным.
+    """
+
+    def __init__(self, path="data/latency.json"):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = FileLock(self.path)
+
+    def load(self) -> Dict[str, SourceLatency]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        return {source: SourceLatency.from_dict(item) for source, item in data.items()}
+
+    def record(self, timings: Dict[str, List[RequestTiming]]):
+        """timings: {источник: замеры запросов за обновление}"""
+        with self._lock:
+            sources = self.load()
+            for source, items in timings.items():
+                latency = sources.setdefault(source, SourceLatency())
+                for timing in items:
+                    latency.observe(timing)
+            data = {source: latency.to_dict() for source, latency in sources.items()}
+            temp_file = self.path.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                dump(data, f)
+            temp_file.replace(self.path)
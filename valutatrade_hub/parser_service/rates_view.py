@@ -0,0 +1,128 @@
+"""Представление текущих курсов для show-rates.
+
+Строится один раз на снимок курсов и базовую валюту: индекс котировок по
+валютам пары, цена каждой валюты в базовой (прямая пара, обратная или
+кросс-курс через общую валюту), изменение за окно по истории и готовые
+порядки сортировки. Повторные show-rates на том же снимке только
+выбирают строки из готового порядка.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from .history import HistoryIndex, parse_timestamp
+
+SORT_KEYS = ("code", "price", "change", "stale", "mcap")
+
+CHANGE_WINDOW = 86400
+
+
+class RateRow:
+    """Цена одной валюты в базовой валюте представления"""
+
+    __slots__ = ('code', 'price', 'change_pct', 'updated_at', 'updated', 'source',
+                 'market_cap', 'path')
+
+    def __init__(self, code: str, price: float, updated_at: str, updated: float,
+                 source: str, market_cap: float, path: str):
+        self.code = code
+        self.price = price
+        self.change_pct: Optional[float] = None
+        self.updated_at = updated_at
+        # Момент самой старой из использованных котировок
+        self.updated = updated
+        self.source = source
+        self.market_cap = market_cap
+        # "direct", "inverse" или "via XXX"
+        self.path = path
+
+
+class RatesView:
+
+    def __init__(self, snapshot, base: str, history: Optional[HistoryIndex] = None,
+                 via: str = "USD", change_window: float = CHANGE_WINDOW):
+        self.base = base
+        self.last_refresh = snapshot.last_refresh
+        # Котировки по валюте: код -> {другая валюта: (курс кода в ней, момент,
+        # источник, время строкой, обратная ли пара)}; прямая пара важнее обратной
+        self._quotes: Dict[str, Dict[str, Tuple[float, float, str, str, bool]]] = {}
+        moments: Dict[str, float] = {}
+        market_caps: Dict[str, float] = {}
+        for pair_key, record in snapshot.items():
+            from_currency, _, to_currency = pair_key.partition('_')
+            rate = record["rate"]
+            if not rate:
+                continue
+            updated_at = record["updated_at"]
+            moment = moments.get(updated_at)
+            if moment is None:
+                moment = moments[updated_at] = parse_timestamp(updated_at) if updated_at else 0.0
+            source = record["source"]
+            self._quotes.setdefault(from_currency, {})[to_currency] = (
+                rate, moment, source, updated_at, False)
+            self._quotes.setdefault(to_currency, {}).setdefault(
+                from_currency, (1 / rate, moment, source, updated_at, True))
+            market_cap = snapshot.get_market_cap(pair_key)
+            if market_cap > 0:
+                market_caps[from_currency] = market_cap
+
+        self.rows: Dict[str, RateRow] = {}
+        for code in sorted(self._quotes):
+            if code == base:
+                continue
+            row = self._convert(code, base, via)
+            if row is not None:
+                row.market_cap = market_caps.get(code, 0.0)
+                self.rows[code] = row
+
+        if history is not None:
+            for row in self.rows.values():
+                previous = history.cross_rates_at(row.code, base, via,
+                                                  [row.updated - change_window])[0]
+                if previous:
+                    row.change_pct = (row.price / previous - 1) * 100
+
+        rows = list(self.rows.values())
+        # Без изменения — в конце любой сортировки по изменению
+        self._orders: Dict[str, List[str]] = {
+            "code": [row.code for row in rows],
+            "price": [row.code for row in sorted(rows, key=lambda row: -row.price)],
+            "change": [row.code for row in sorted(
+                rows, key=lambda row: (row.change_pct is None, -(row.change_pct or 0.0)))],
+            "stale": [row.code for row in sorted(rows, key=lambda row: row.updated)],
+            "mcap": [row.code for row in sorted(
+                (row for row in rows if row.market_cap > 0), key=lambda row: -row.market_cap)],
+        }
+
+    def _convert(self, code: str, base: str, via: str) -> Optional[RateRow]:
+        quotes = self._quotes.get(code, {})
+        direct = quotes.get(base)
+        if direct is not None:
+            rate, moment, source, updated_at, inverted = direct
+            return RateRow(code, rate, updated_at, moment, source, 0.0,
+                           "inverse" if inverted else "direct")
+
+        # Кросс-курс через общую валюту: сначала через via, затем любую
+        base_quotes = self._quotes.get(base, {})
+        common = [pivot for pivot in quotes if pivot in base_quotes]
+        if not common:
+            return None
+        pivot = via if via in common else sorted(common)[0]
+        first, second = quotes[pivot], base_quotes[pivot]
+        older = first if first[1] <= second[1] else second
+        source = first[2] if first[2] == second[2] else f"{first[2]}/{second[2]}"
+        return RateRow(code, first[0] / second[0], older[3], older[1], source, 0.0,
+                       f"via {pivot}")
+
+    def select(self, sort: str = "code", currencies: Optional[Iterable[str]] = None,
+               top: Optional[int] = None) -> List[RateRow]:
+        """Строки в готовом порядке; currencies — точные коды валют"""
+        if sort not in self._orders:
+            raise ValueError(f"Неизвестный ключ сортировки: {sort}")
+        order = self._orders[sort]
+        if currencies is not None:
+            wanted = set(currencies)
+            order = [code for code in order if code in wanted]
+        if top is not None:
+            order = order[:top]
+        return [self.rows[code] for code in order]
+
+    def missing(self, currencies: Iterable[str]) -> List[str]:
+        return [code for code in currencies if code not in self.rows and code != self.base]
@@ -0,0 +1,106 @@
+"""Нагрузочный прогон цикла обновления курсов на записанной истории.
+
+Запуск: python -m valutatrade_hub.parser_service.replay_bench --updates 500 --users 20
+
+Прогон идёт во временном каталоге с копией истории и текущих курсов;
+загрузчик берёт курсы только из источника replay — точка истории на
+каждое обновление, по кругу. Пользователи ставят оповещения и лимитные
+заявки около текущих курсов, после каждого обновления пересчитываются
+оценки их портфелей. Печатаются обновления в секунду, время фаз,
+сработавшие оповещения и исполненные заявки.
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[2]
+
+_PAIRS = ("BTC_USD", "ETH_USD")
+
+
+def _prepare_users(auth, users: int):
+    snapshot = auth.rates_updater.storage.get_snapshot()
+    sessions = []
+    for i in range(users):
+        auth.create_user(f"replay{i}", "pass")
+        session = auth.login(f"replay{i}", "pass")
+        auth.execute_trade(session, "buy", "USD", 100000.0)
+        auth.execute_trade(session, "buy", "BTC", 0.05)
+        for pair_key in _PAIRS:
+            rate = snapshot.get_rate(pair_key)
+            if rate is None:
+                continue
+            step = 0.005 * (i % 5 + 1)
+            auth.add_alert(session, pair_key, "above", round(rate * (1 + step), 2))
+            auth.add_alert(session, pair_key, "below", round(rate * (1 - step), 2))
+        btc = snapshot.get_rate("BTC_USD")
+        if btc is not None:
+            auth.place_order(session, "buy", "BTC", 0.001, round(btc * (1 - 0.01 * (i % 3 + 1)), 2))
+            auth.place_order(session, "sell", "BTC", 0.001, round(btc * (1 + 0.01 * (i % 3 + 1)), 2))
+        sessions.append(session)
+    return sessions
+
+
+def run(updates: int, users: int):
+    from ..core.usecases import AuthUseCase
+
+    auth = AuthUseCase()
+    with redirect_stdout(io.StringIO()):
+        sessions = _prepare_users(auth, users)
+    alerts_before, orders_before = len(auth.alerts), len(auth.orders)
+
+    update_time = valuation_time = 0.0
+    failed = 0
+    with redirect_stdout(io.StringIO()):
+        for _ in range(updates):
+            started = time.perf_counter()
+            if not auth.rates_updater.run_update()["success"]:
+                failed += 1
+            update_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            for session in sessions:
+                auth.portfolio_valuation(session, "USD")
+            valuation_time += time.perf_counter() - started
+
+    total = update_time + valuation_time
+    print(f"Обновлений: {updates} ({failed} с ошибками), пользователей: {users}")
+    print(f"Всего {total:.2f} с, {updates / total:,.1f} циклов/с")
+    print(f"   обновление курсов (с оповещениями и заявками): "
+          f"{update_time / updates * 1000:.2f} мс на цикл")
+    print(f"   оценка портфелей: {valuation_time / updates * 1000:.2f} мс на цикл")
+    print(f"Сработало оповещений: {alerts_before - len(auth.alerts)} из {alerts_before}, "
+          f"исполнено заявок: {orders_before - len(auth.orders)} из {orders_before}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Цикл обновления курсов на записанной истории")
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--history", default=str(_ROOT / "data" / "exchange_rates.json"),
+                        help="Файл истории для воспроизведения")
+    parser.add_argument("--start-offset", type=float, default=0.0,
+                        help="Сдвиг старта от первой записи, секунд")
+    args = parser.parse_args()
+
+    # Конфиг загрузчика читает окружение при импорте, поэтому use-case'ы
+    # импортируются в run() уже после настройки
+    os.environ.update(RATES_SOURCES="replay", REPLAY_LOOP="1", REPLAY_SPEED="0",
+                      REPLAY_HISTORY_PATH=str(Path(args.history).resolve()),
+                      REPLAY_START_OFFSET=str(args.start_offset))
+    with tempfile.TemporaryDirectory(prefix="valutatrade-replay-") as workdir:
+        (Path(workdir) / "data").mkdir()
+        for name in ("rates.json", "rates.bin"):
+            if (_ROOT / "data" / name).exists():
+                shutil.copy(_ROOT / "data" / name, Path(workdir) / "data" / name)
+        os.chdir(workdir)
+        run(args.updates, args.users)
+
+
+if __name__ == "__main__":
+    main()
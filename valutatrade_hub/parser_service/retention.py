@@ -0,0 +1,173 @@
+"""Политика хранения истории курсов: сырые точки, затем свечи OHLC.
+
+Свечи пишутся в тот же файл истории записями с полем "interval". Их
+"rate" — цена закрытия, "timestamp" — время последней точки свечи, поэтому
+индекс истории, оценка портфеля на дату и воспроизведение работают со
+сжатой историей без изменений и не заглядывают в будущее внутри свечи.
+"""
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+from .history import format_timestamp, parse_timestamp
+from ..infra.serialization import ArrayWriter, iter_array
+
+_DAY = 86400
+
+INTERVALS = {60: "1m", 3600: "1h", _DAY: "1d"}
+_SECONDS = {label: seconds for seconds, label in INTERVALS.items()}
+
+
+@dataclass
+class RetentionPolicy:
+    """Возраст в днях, до которого хранится каждый уровень детализации"""
+
+    raw_days: float = 7
+    minute_days: float = 30
+    hour_days: float = 365
+
+    def interval_for(self, age_seconds: float) -> int:
+        """Шаг свечи для точки такого возраста; 0 — хранить как есть"""
+        days = age_seconds / _DAY
+        if days < self.raw_days:
+            return 0
+        if days < self.minute_days:
+            return 60
+        if days < self.hour_days:
+            return 3600
+        return _DAY
+
+    def bucket_interval(self, moment: float, now: float) -> int:
+        """Шаг свечи для точки или свечи, начинающейся в moment: самый
+        крупный шаг, начало корзины которого уже старше срока этого шага.
+
+        Уровень выбирается по началу корзины, а не по возрасту самой точки,
+        поэтому корзина на границе уровней не делится: все точки и свечи
+        одной корзины попадают на один уровень, и повторное сжатие с тем
+        же now ничего не меняет.
+        """
+        for interval in sorted(INTERVALS, reverse=True):
+            if self.interval_for(now - (moment - moment % interval)) >= interval:
+                return interval
+        return 0
+
+
+class _Bar:
+
+    __slots__ = ('start', 'interval', 'open', 'high', 'low', 'close', 'count',
+                 'last_time', 'source')
+
+    def __init__(self, start: float, interval: int, record: Dict, moment: float):
+        self.start = start
+        self.interval = interval
+        self.open = record.get("open", record["rate"])
+        self.high = record.get("high", record["rate"])
+        self.low = record.get("low", record["rate"])
+        self.close = record["rate"]
+        self.count = record.get("count", 1)
+        self.last_time = moment
+        self.source = record.get("source", "")
+
+    def add(self, record: Dict, moment: float):
+        self.high = max(self.high, record.get("high", record["rate"]))
+        self.low = min(self.low, record.get("low", record["rate"]))
+        self.close = record["rate"]
+        self.count += record.get("count", 1)
+        self.last_time = moment
+        self.source = record.get("source", self.source)
+
+    def to_record(self, from_currency: str, to_currency: str) -> Dict:
+        label = INTERVALS[self.interval]
+        bar_start = format_timestamp(self.start)
+        return {
+            "id": f"{from_currency}_{to_currency}_{label}_{bar_start}",
+            "from_currency": from_currency,
+            "to_currency": to_currency,
+            "rate": self.close,
+            "timestamp": format_timestamp(self.last_time),
+            "source": self.source,
+            "interval": label,
+            "bar_start": bar_start,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "count": self.count
+        }
+
+
+def compact_history(path: Path, policy: RetentionPolicy, now: Optional[float] = None) -> Dict:
+    """Один потоковый проход по файлу истории.
+
+    Сырые точки младше raw_days остаются, подряд идущие точки пары с тем
+    же курсом выбрасываются; более старые точки и свечи сворачиваются в
+    свечи 1m/1h/1d по возрасту. В памяти — только открытые свечи и
+    последний курс на пару, поэтому размер файла не ограничен.
+    """
+    path = Path(path)
+    now = time.time() if now is None else now
+    started = time.perf_counter()
+    stats = {"records_in": 0, "records_out": 0, "duplicates": 0,
+             "bars": {label: 0 for label in INTERVALS.values()},
+             "bytes_before": path.stat().st_size if path.exists() else 0}
+    if not path.exists():
+        stats.update(bytes_after=0, seconds=0.0)
+        return stats
+
+    last_rate: Dict[str, float] = {}
+    # (пара, шаг) -> открытая свеча
+    open_bars: Dict[tuple, _Bar] = {}
+    temp_file = path.with_suffix(f'.compact.{os.getpid()}.tmp')
+
+    with open(temp_file, 'w', encoding='utf-8') as out:
+        writer = ArrayWriter(out)
+
+        def flush(pair_key: str, interval: int):
+            bar = open_bars.pop((pair_key, interval))
+            writer.write(bar.to_record(*pair_key.split('_', 1)))
+            stats["bars"][INTERVALS[interval]] += 1
+
+        for record in iter_array(path):
+            stats["records_in"] += 1
+            pair_key = f"{record['from_currency']}_{record['to_currency']}"
+            moment = parse_timestamp(record["timestamp"])
+            own = _SECONDS.get(record.get("interval"), 0)
+            start_moment = parse_timestamp(record["bar_start"]) if own else moment
+
+            interval = policy.bucket_interval(start_moment, now)
+            if interval <= own:
+                # Сырая точка в окне хранения или свеча не мельче нужной
+                if own == 0 and last_rate.get(pair_key) == record["rate"]:
+                    stats["duplicates"] += 1
+                    continue
+                for key in [key for key in open_bars if key[0] == pair_key]:
+                    flush(*key)
+                last_rate[pair_key] = record["rate"]
+                writer.write(record)
+                continue
+
+            bucket = start_moment - start_moment % interval
+            bar = open_bars.get((pair_key, interval))
+            if bar is not None and bar.start != bucket:
+                flush(pair_key, interval)
+                bar = None
+            # Свеча другого шага той же пары закрывается, чтобы порядок
+            # записей пары в файле оставался хронологическим
+            for key in [key for key in open_bars if key[0] == pair_key and key[1] != interval]:
+                flush(*key)
+            if bar is None:
+                open_bars[(pair_key, interval)] = _Bar(bucket, interval, record, moment)
+            else:
+                bar.add(record, moment)
+            last_rate[pair_key] = record["rate"]
+
+        for key in list(open_bars):
+            flush(*key)
+        writer.close()
+        stats["records_out"] = writer.count
+
+    temp_file.replace(path)
+    stats["bytes_after"] = path.stat().st_size
+    stats["seconds"] = time.perf_counter() - started
+    return stats
@@ -0,0 +1,248 @@
+"""Скользящие статистики курсов по парам за 1ч/24ч/7д.
+
+Состояние обновляется на каждой записи истории и хранится в небольшом
+файле рядом с ней, историю для ответа перечитывать не нужно. Окно
+разбито на BUCKETS корзин по времени: в корзине число точек, сумма,
+минимум, максимум, первый курс и накопители Уэлфорда для логарифмических
+доходностей. Корзины старше окна отбрасываются, поэтому среднее, min/max
+и изменение считаются с точностью до корзины (1/BUCKETS окна), а ответ —
+свёртка не более BUCKETS корзин. EWMA ведётся с затуханием по времени,
+постоянная времени — длина окна.
+"""
+import json
+import math
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from .history import format_timestamp, parse_timestamp
+from ..infra.locking import FileLock
+from ..infra.serialization import write_file
+
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+BUCKETS = 30
+
+
+def _merge_welford(a: tuple, b: tuple) -> tuple:
+    """Объединение (n, mean, M2) двух выборок — формула Чана"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if not n:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+
+class _Bucket:
+
+    __slots__ = ('start', 'count', 'total', 'low', 'high', 'first',
+                 'returns', 'returns_mean', 'returns_m2')
+
+    def __init__(self, start: float, rate: float):
+        self.start = start
+        self.count = 0
+        self.total = 0.0
+        self.low = rate
+        self.high = rate
+        self.first = rate
+        self.returns = 0
+        self.returns_mean = 0.0
+        self.returns_m2 = 0.0
+
+    def add(self, rate: float, log_return: Optional[float]):
+        self.count += 1
+        self.total += rate
+        self.low = min(self.low, rate)
+        self.high = max(self.high, rate)
+        if log_return is not None:
+            # Шаг Уэлфорда
+            self.returns += 1
+            delta = log_return - self.returns_mean
+            self.returns_mean += delta / self.returns
+            self.returns_m2 += delta * (log_return - self.returns_mean)
+
+    def to_list(self) -> list:
+        return [self.start, self.count, self.total, self.low, self.high, self.first,
+                self.returns, self.returns_mean, self.returns_m2]
+
+    @classmethod
+    def from_list(cls, data: list) -> "_Bucket":
+        bucket = cls(data[0], data[5])
+        (bucket.count, bucket.total, bucket.low, bucket.high, _,
+         bucket.returns, bucket.returns_mean, bucket.returns_m2) = data[1:]
+        return bucket
+
+
+class WindowStats:
+    """Скользящее окно одной длины для одной пары"""
+
+    __slots__ = ('seconds', 'width', 'buckets', 'ewma')
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.width = seconds / BUCKETS
+        self.buckets = deque()
+        self.ewma: Optional[float] = None
+
+    def add(self, moment: float, rate: float, log_return: Optional[float],
+            elapsed: Optional[float]):
+        start = moment - moment % self.width
+        if not self.buckets or self.buckets[-1].start != start:
+            self.buckets.append(_Bucket(start, rate))
+        self.buckets[-1].add(rate, log_return)
+        # Корзина целиком вне окна — отбрасывается
+        while self.buckets[0].start + self.width <= moment - self.seconds:
+            self.buckets.popleft()
+
+        if self.ewma is None or elapsed is None:
+            self.ewma = rate
+        else:
+            alpha = 1 - math.exp(-elapsed / self.seconds)
+            self.ewma += alpha * (rate - self.ewma)
+
+    def summary(self, last_rate: float) -> Dict:
+        count = sum(bucket.count for bucket in self.buckets)
+        if not count:
+            return {"points": 0}
+        returns = (0, 0.0, 0.0)
+        for bucket in self.buckets:
+            returns = _merge_welford(returns, (bucket.returns, bucket.returns_mean,
+                                               bucket.returns_m2))
+        first = self.buckets[0].first
+        return {
+            "points": count,
+            "sma": sum(bucket.total for bucket in self.buckets) / count,
+            "ewma": self.ewma,
+            "min": min(bucket.low for bucket in self.buckets),
+            "max": max(bucket.high for bucket in self.buckets),
+            "change_pct": (last_rate / first - 1) * 100 if first else None,
+            # Стандартное отклонение логарифмических доходностей между точками, %
+            "volatility_pct": (math.sqrt(returns[2] / (returns[0] - 1)) * 100
+                               if returns[0] > 1 else None),
+            "since": format_timestamp(self.buckets[0].start)
+        }
+
+    def to_dict(self) -> Dict:
+        return {"ewma": self.ewma, "buckets": [bucket.to_list() for bucket in self.buckets]}
+
+    @classmethod
+    def from_dict(cls, seconds: float, data: Dict) -> "WindowStats":
+        window = cls(seconds)
+        window.ewma = data.get("ewma")
+        window.buckets = deque(_Bucket.from_list(item) for item in data.get("buckets", []))
+        return window
+
+
+class PairStats:
+
+    __slots__ = ('last_rate', 'last_time', 'windows')
+
+    def __init__(self):
+        self.last_rate: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.windows = {label: WindowStats(seconds) for label, seconds in WINDOWS.items()}
+
+    def add(self, moment: float, rate: float) -> bool:
+        # Точки не новее последней (повтор или запись задним числом) пропускаются
+        if self.last_time is not None and moment <= self.last_time:
+            return False
+        log_return = None
+        elapsed = None
+        if self.last_rate and rate > 0:
+            log_return = math.log(rate / self.last_rate)
+            elapsed = moment - self.last_time
+        for window in self.windows.values():
+            window.add(moment, rate, log_return, elapsed)
+        self.last_rate = rate
+        self.last_time = moment
+        return True
+
+    def summary(self) -> Dict:
+        return {
+            "rate": self.last_rate,
+            "updated_at": format_timestamp(self.last_time) if self.last_time else None,
+            "windows": {label: window.summary(self.last_rate)
+                        for label, window in self.windows.items()}
+        }
+
+    def to_dict(self) -> Dict:
+        return {"last_rate": self.last_rate, "last_time": self.last_time,
+                "windows": {label: window.to_dict() for label, window in self.windows.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PairStats":
+        stats = cls()
+        stats.last_rate = data.get("last_rate")
+        stats.last_time = data.get("last_time")
+        for label, seconds in WINDOWS.items():
+            if label in data.get("windows", {}):
+                stats.windows[label] = WindowStats.from_dict(seconds, data["windows"][label])
+        return stats
+
+
+class RollingStats:
+    """Статистики всех пар в data/rate_stats.json"""
+
+    def __init__(self, path="data/rate_stats.json"):
+        self.path = Path(path)
+        self._lock = FileLock(self.path)
+        self._pairs: Dict[str, PairStats] = {}
+        self._mtime = None
+
+    def _load(self) -> Dict[str, PairStats]:
+        # Файл перечитывается, только если его изменил другой процесс
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._pairs, self._mtime = {}, None
+            return self._pairs
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            self._pairs = {pair_key: PairStats.from_dict(item) for pair_key, item in data.items()}
+            self._mtime = mtime
+        return self._pairs
+
+    def _save(self, pairs: Dict[str, PairStats]):
+        write_file(self.path, {pair_key: stats.to_dict() for pair_key, stats in pairs.items()})
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def update(self, rates: Dict[str, float], moment: float) -> int:
+        """Добавляет точки одного обновления; возвращает число учтённых пар"""
+        with self._lock:
+            pairs = self._load()
+            added = 0
+            for pair_key, rate in rates.items():
+                stats = pairs.get(pair_key)
+                if stats is None:
+                    stats = pairs[pair_key] = PairStats()
+                added += stats.add(moment, float(rate))
+            if added:
+                self._save(pairs)
+            return added
+
+    def rebuild(self, records: Iterable[Dict]) -> int:
+        """Пересчёт с нуля одним проходом по истории"""
+        pairs: Dict[str, PairStats] = {}
+        count = 0
+        for record in records:
+            pair_key = f"{record['from_currency']}_{record['to_currency']}"
+            stats = pairs.get(pair_key)
+            if stats is None:
+                stats = pairs[pair_key] = PairStats()
+            count += stats.add(parse_timestamp(record["timestamp"]), float(record["rate"]))
+        with self._lock:
+            self._save(pairs)
+            self._pairs = pairs
+        return count
+
+    def get(self, pair_key: str) -> Optional[Dict]:
+        stats = self._load().get(pair_key)
+        return None if stats is None else stats.summary()
+
+    def pairs(self) -> List[str]:
+        return sorted(self._load())
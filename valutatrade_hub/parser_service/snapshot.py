@@ -0,0 +1,169 @@
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+from ..core.currencies import get_registry
+
+
+class RatesSnapshot:
+    """Снимок текущих курсов в колоночном виде.
+
+    Вместо JSON-объекта на каждую пару хранится индекс кодов пар и
+    массив float, а источник и время обновления — номерами в маленьких
+    таблицах строк. Поиск курса по паре — одно обращение к словарю.
+    """
+
+    __slots__ = ('_pairs', '_index', '_rates', '_sources', '_source_idx',
+                 '_timestamps', '_timestamp_idx', '_market_caps', '_mcap_rank',
+                 '_extra', 'last_refresh')
+
+    def __init__(self, last_refresh: Optional[str] = None):
+        self._pairs = []
+        self._index = {}
+        self._rates = array('d')
+        self._sources = []
+        self._source_idx = array('H')
+        self._timestamps = []
+        self._timestamp_idx = array('H')
+        self._market_caps = array('d')
+        # Номера пар по убыванию капитализации, считаются один раз при публикации
+        self._mcap_rank = None
+        # Валюты, которых нет в core/currencies.json: код -> вид
+        self._extra = {}
+        self.last_refresh = last_refresh
+
+    @staticmethod
+    def _intern(table: list, value: str) -> int:
+        try:
+            return table.index(value)
+        except ValueError:
+            table.append(value)
+            return len(table) - 1
+
+    def set(self, pair_key: str, rate: float, source: str, updated_at: str,
+            market_cap: float = 0.0):
+        source_id = self._intern(self._sources, source)
+        timestamp_id = self._intern(self._timestamps, updated_at)
+        i = self._index.get(pair_key)
+        if i is None:
+            self._index[pair_key] = len(self._pairs)
+            self._pairs.append(pair_key)
+            self._rates.append(rate)
+            self._source_idx.append(source_id)
+            self._timestamp_idx.append(timestamp_id)
+            self._market_caps.append(market_cap)
+        else:
+            self._rates[i] = rate
+            self._source_idx[i] = source_id
+            self._timestamp_idx[i] = timestamp_id
+            self._market_caps[i] = market_cap
+        self._mcap_rank = None
+
+    def copy_pair(self, other: "RatesSnapshot", pair_key: str) -> bool:
+        """Переносит пару из другого снимка вместе с её временем обновления"""
+        i = other._index.get(pair_key)
+        if i is None:
+            return False
+        self.set(pair_key, other._rates[i], other._sources[other._source_idx[i]],
+                 other._timestamps[other._timestamp_idx[i]], other._market_caps[i])
+        code = pair_key.split('_')[0]
+        if code in other._extra:
+            self._extra[code] = other._extra[code]
+        return True
+
+    def rank_by_market_cap(self):
+        caps = self._market_caps
+        self._mcap_rank = sorted((i for i in range(len(caps)) if caps[i] > 0),
+                                 key=lambda i: -caps[i])
+
+    def top_by_market_cap(self, n: int):
+        if self._mcap_rank is None:
+            self.rank_by_market_cap()
+        return [(self._pairs[i], self._record(i)) for i in self._mcap_rank[:n]]
+
+    def get_market_cap(self, pair_key: str) -> float:
+        i = self._index.get(pair_key)
+        return 0.0 if i is None else self._market_caps[i]
+
+    def add_currency(self, code: str, kind: str):
+        if code not in get_registry():
+            self._extra[code] = kind
+
+    def get_rate(self, pair_key: str) -> Optional[float]:
+        i = self._index.get(pair_key)
+        return None if i is None else self._rates[i]
+
+    def get(self, pair_key: str) -> Optional[Dict]:
+        i = self._index.get(pair_key)
+        return None if i is None else self._record(i)
+
+    def _record(self, i: int) -> Dict:
+        return {
+            "rate": self._rates[i],
+            "updated_at": self._timestamps[self._timestamp_idx[i]],
+            "source": self._sources[self._source_idx[i]]
+        }
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        for i, pair_key in enumerate(self._pairs):
+            yield pair_key, self._record(i)
+
+    def pairs(self) -> Tuple[str, ...]:
+        return tuple(self._pairs)
+
+    def __contains__(self, pair_key):
+        return pair_key in self._index
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def extend_registry(self):
+        # Реестр валют пополняется кодами, пришедшими от API,
+        # криптовалюты получают актуальную капитализацию
+        registry = get_registry()
+        for code, kind in self._extra.items():
+            registry.ensure(code, kind)
+        for i, market_cap in enumerate(self._market_caps):
+            if market_cap > 0:
+                currency = registry.find(self._pairs[i].split('_')[0])
+                if currency is not None and currency.kind == 'crypto':
+                    currency.market_cap = market_cap
+
+    def to_json(self) -> Dict:
+        return {
+            "format": "columnar",
+            "last_refresh": self.last_refresh,
+            "pairs": self._pairs,
+            "rates": self._rates.tolist(),
+            "sources": self._sources,
+            "source_idx": self._source_idx.tolist(),
+            "timestamps": self._timestamps,
+            "timestamp_idx": self._timestamp_idx.tolist(),
+            "market_caps": self._market_caps.tolist(),
+            "mcap_rank": self._mcap_rank,
+            "currencies": self._extra
+        }
+
+    def to_legacy_json(self) -> Dict:
+        return {"pairs": dict(self.items()), "last_refresh": self.last_refresh}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "RatesSnapshot":
+        snapshot = cls(data.get("last_refresh"))
+        if data.get("format") == "columnar":
+            snapshot._pairs = list(data["pairs"])
+            snapshot._index = {pair_key: i for i, pair_key in enumerate(snapshot._pairs)}
+            snapshot._rates = array('d', data["rates"])
+            snapshot._sources = list(data["sources"])
+            snapshot._source_idx = array('H', data["source_idx"])
+            snapshot._timestamps = list(data["timestamps"])
+            snapshot._timestamp_idx = array('H', data["timestamp_idx"])
+            snapshot._market_caps = array('d', data.get("market_caps")
+                                          or bytes(8 * len(snapshot._pairs)))
+            snapshot._mcap_rank = data.get("mcap_rank")
+            snapshot._extra = dict(data.get("currencies", {}))
+        else:
+            # Старый формат: объект {"rate", "updated_at", "source"} на пару
+            for pair_key, record in data.get("pairs", {}).items():
+                snapshot.set(pair_key, record["rate"], record.get("source", ""),
+                             record.get("updated_at", snapshot.last_refresh or ""))
+        snapshot.extend_registry()
+        return snapshot
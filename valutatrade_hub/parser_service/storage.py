@@ -1,121 +1,304 @@
 import json
+import time
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, Optional
 import logging
+from .snapshot import RatesSnapshot
+from .analytics import MarketAnalytics, compute_analytics, default_step
+from .rates_view import RatesView
+from .history import HistoryIndex, parse_timestamp
+from .archive import HistoryArchive, iter_history
+from .retention import RetentionPolicy, compact_history
+from .rolling import RollingStats
+from .binary_snapshot import BinaryRatesSnapshot, write_binary_snapshot, read_generation
+from ..infra.locking import FileLock
+from ..infra.serialization import append_array, dump
 
 logger = logging.getLogger("valutatrade")
 
 
 class RatesStorage:
 
-    def __init__(self, rates_file_path: str, history_file_path: str):
+    def __init__(self, rates_file_path: str, history_file_path: str,
+                 base_currency: str = "USD", archive_dir: Optional[str] = None,
+                 stats_path: Optional[str] = None):
         self.rates_file_path = Path(rates_file_path)
         self.history_file_path = Path(history_file_path)
+        # Закрытые месяцы истории — сжатые сегменты в data/history/
+        self.archive = HistoryArchive(archive_dir or self.history_file_path.parent / "history")
+        # Скользящие статистики пар, обновляются при каждой записи истории
+        self.rolling = RollingStats(stats_path or self.history_file_path.with_name("rate_stats.json"))
+        # Рядом с rates.json публикуется бинарный снимок для чтения через mmap
+        self.binary_file_path = self.rates_file_path.with_suffix('.bin')
+        self.base_currency = base_currency
 
         self.rates_file_path.parent.mkdir(exist_ok=True, parents=True)
         self.history_file_path.parent.mkdir(exist_ok=True, parents=True)
 
-    def save_current_rates(self, rates: Dict[str, float], source: str):
-
-        try:
-            timestamp = datetime.utcnow().isoformat() + "Z"
+        self._snapshot = None
+        self._snapshot_mtime = None
+        self._binary = None
+        self._history_index = None
+        self._history_mtime = None
+        # Представления show-rates по базовой валюте для текущего снимка
+        self._views: Dict[str, RatesView] = {}
+        self._views_snapshot = None
+        # Кросс-парная аналитика по (окно, шаг, пары) для текущего поколения снимка
+        self._analytics: Dict[tuple, MarketAnalytics] = {}
+        self._analytics_version = None
+        # Подписчики на публикацию нового снимка: callback(generation)
+        self._publish_listeners = []
+        # Общие для всех писателей файлов курсов; RatesUpdater держит
+        # rates_lock на всё время публикации
+        self.rates_lock = FileLock(self.rates_file_path)
+        self.history_lock = FileLock(self.history_file_path)
+
+    def save_current_rates(self, rates: Dict[str, float], source: str,
+                           currencies: Optional[Dict[str, str]] = None,
+                           market_caps: Optional[Dict[str, float]] = None,
+                           sources: Optional[Dict[str, str]] = None,
+                           carry_over: Iterable[str] = ()):
+        """sources — источник по паре, если пары пришли из разных мест;
+        carry_over — пары, переносимые из текущего снимка без изменений"""
+
+        with self.rates_lock:
+            try:
+                timestamp = datetime.utcnow().isoformat() + "Z"
+
+                market_caps = market_caps or {}
+                sources = sources or {}
+                snapshot = RatesSnapshot(timestamp)
+                for pair_key, rate in rates.items():
+                    snapshot.set(pair_key, rate, sources.get(pair_key, source), timestamp,
+                                 market_caps.get(pair_key.split('_')[0], 0.0))
+                for code, kind in (currencies or {}).items():
+                    snapshot.add_currency(code, kind)
+
+                if carry_over:
+                    current = self.get_snapshot()
+                    for pair_key in carry_over:
+                        if pair_key not in rates:
+                            snapshot.copy_pair(current, pair_key)
+                snapshot.rank_by_market_cap()
+
+                temp_file = self.rates_file_path.with_suffix('.tmp')
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    dump(snapshot.to_json(), f)
+
+                temp_file.replace(self.rates_file_path)
+                snapshot.extend_registry()
+                self._snapshot = snapshot
+                self._snapshot_mtime = self.rates_file_path.stat().st_mtime_ns
+
+                generation = read_generation(self.binary_file_path) + 1
+                write_binary_snapshot(self.binary_file_path, snapshot, self.base_currency,
+                                      generation)
+                for listener in self._publish_listeners:
+                    listener(generation)
+
+                logger.info(
+                    f"Сохранено {len(rates)} курсов в {self.rates_file_path}")
+                return True
+
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении текущих курсов: {e}")
+                return False
+
+    def save_to_history(self, rates: Dict[str, float], source: str,
+                        meta: Optional[Dict] = None):
+        """meta — замеры запроса к источнику (request_ms, status_code, ...)"""
+
+        with self.history_lock:
+            try:
+                timestamp = datetime.utcnow().isoformat() + "Z"
+
+                records = []
+                for pair_key, rate in rates.items():
+
+                    from_currency, to_currency = pair_key.split('_')
+
+                    record_id = f"{from_currency}_{to_currency}_{timestamp}"
+
+                    record = {
+                        "id": record_id,
+                        "from_currency": from_currency,
+                        "to_currency": to_currency,
+                        "rate": rate,
+                        "timestamp": timestamp,
+                        "source": source,
+                        "meta": meta or {}
+                    }
 
-            pairs_data = {}
-            for pair_key, rate in rates.items():
-                pairs_data[pair_key] = {
-                    "rate": rate,
-                    "updated_at": timestamp,
-                    "source": source
-                }
+                    records.append(record)
+                    logger.debug(f"Добавлена историческая запись: {record_id}")
 
-            data = {
-                "pairs": pairs_data,
-                "last_refresh": timestamp
-            }
+                # История только растёт: новые записи дописываются в конец
+                # массива, файл целиком не читается и не переписывается
+                append_array(self.history_file_path, records)
 
-            temp_file = self.rates_file_path.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+                logger.info(f"Добавлено {len(rates)} записей в историю")
 
-            temp_file.replace(self.rates_file_path)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении истории: {e}")
+                return False
 
-            logger.info(
-                f"Сохранено {len(rates)} курсов в {self.rates_file_path}")
+            # Сбой статистик не отменяет уже записанную историю
+            try:
+                self.rolling.update(rates, parse_timestamp(timestamp))
+            except Exception as e:
+                logger.warning(f"Не удалось обновить скользящие статистики: {e}")
             return True
 
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении текущих курсов: {e}")
-            return False
-
-    def save_to_history(self, rates: Dict[str, float], source: str):
-
+    def rebuild_rate_stats(self) -> int:
+        """Пересчёт скользящих статистик по всей истории (архив и файл)"""
+        with self.history_lock:
+            count = self.rolling.rebuild(self.iter_history())
+        logger.info(f"Скользящие статистики пересчитаны по {count} записям истории")
+        return count
+
+    def compact_history(self, policy: RetentionPolicy) -> Dict:
+        """Сжатие истории по политике хранения; см. retention.compact_history"""
+        with self.history_lock:
+            stats = compact_history(self.history_file_path, policy)
+        logger.info(f"История сжата: {stats['records_in']} -> {stats['records_out']} записей, "
+                    f"{stats['bytes_before']} -> {stats['bytes_after']} байт")
+        return stats
+
+    def seal_history(self, codec: str = "gzip") -> Dict:
+        """Перенос закрытых месяцев истории в сжатые сегменты архива"""
+        with self.history_lock:
+            stats = self.archive.seal(self.history_file_path, codec)
+        logger.info(f"В архив перенесено {stats['sealed']} записей истории, "
+                    f"сегментов: {len(stats['segments'])}")
+        return stats
+
+    def iter_history(self, start: Optional[float] = None, end: Optional[float] = None,
+                     pairs: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """Записи истории из архива и открытого файла; start/end — секунды эпохи.
+        До конца перебора держит history_lock: запись истории ждёт"""
+        return iter_history(self.history_file_path, self.archive, start, end, pairs,
+                            self.history_lock)
+
+    def get_history_index(self) -> HistoryIndex:
+        # Индекс строится один раз и перестраивается при изменении истории
+        # или архива; под history_lock, чтобы не читать файл посреди дозаписи
+        with self.history_lock:
+            try:
+                mtime = (self.history_file_path.stat().st_mtime_ns, self.archive.mtime())
+            except FileNotFoundError:
+                mtime = (None, self.archive.mtime())
+            if mtime == (None, None):
+                return HistoryIndex()
+
+            if self._history_index is None or mtime != self._history_mtime:
+                try:
+                    index = HistoryIndex.from_records(self.iter_history())
+                except Exception as e:
+                    # Не кешируется: следующий вызов перечитает историю, а
+                    # до тех пор остаётся прежний индекс, а не пустой
+                    logger.warning(f"Не удалось загрузить историю: {e}")
+                    return self._history_index or HistoryIndex()
+                self._history_index = index
+                self._history_mtime = mtime
+            return self._history_index
+
+    def get_snapshot(self) -> RatesSnapshot:
+        # Файл перечитывается, только если его изменил другой процесс
         try:
-            timestamp = datetime.utcnow().isoformat() + "Z"
-
-            history = self._load_history()
-
-            for pair_key, rate in rates.items():
-
-                from_currency, to_currency = pair_key.split('_')
-
-                record_id = f"{from_currency}_{to_currency}_{timestamp}"
-
-                record = {
-                    "id": record_id,
-                    "from_currency": from_currency,
-                    "to_currency": to_currency,
-                    "rate": rate,
-                    "timestamp": timestamp,
-                    "source": source,
-                    "meta": {
-                        "request_ms": 0,
-                        "status_code": 200
-                    }
-                }
+            mtime = self.rates_file_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return RatesSnapshot()
 
-                history.append(record)
-                logger.debug(f"Добавлена историческая запись: {record_id}")
-
-            temp_file = self.history_file_path.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, indent=2, ensure_ascii=False)
-
-            temp_file.replace(self.history_file_path)
-
-            logger.info(f"Добавлено {len(rates)} записей в историю")
-            return True
+        if self._snapshot is not None and mtime == self._snapshot_mtime:
+            return self._snapshot
 
+        try:
+            with open(self.rates_file_path, 'r', encoding='utf-8') as f:
+                snapshot = RatesSnapshot.from_json(json.load(f))
         except Exception as e:
-            logger.error(f"Ошибка при сохранении истории: {e}")
-            return False
+            logger.error(f"Ошибка при чтении текущих курсов: {e}")
+            return RatesSnapshot()
+
+        self._snapshot = snapshot
+        self._snapshot_mtime = mtime
+        return snapshot
+
+    def get_rates_view(self, base: str) -> RatesView:
+        """Курсы в базовой валюте с готовыми сортировками; строится один раз
+        на снимок и базовую валюту"""
+        snapshot = self.get_snapshot()
+        if snapshot is not self._views_snapshot:
+            self._views = {}
+            self._views_snapshot = snapshot
+        view = self._views.get(base)
+        if view is None:
+            view = self._views[base] = RatesView(snapshot, base, self.get_history_index(),
+                                                 self.base_currency)
+        return view
+
+    def get_market_analytics(self, window: float, step: Optional[float] = None,
+                             pairs: Optional[Iterable[str]] = None) -> MarketAnalytics:
+        """Доходности и матрицы ковариации/корреляции за окно до последнего
+        обновления курсов; пересчитываются только с новым поколением снимка"""
+        version = self.snapshot_version()
+        if version != self._analytics_version:
+            self._analytics = {}
+            self._analytics_version = version
+        step = step or default_step(window)
+        pairs = sorted(set(pairs)) if pairs else None
+        key = (window, step, tuple(pairs) if pairs else None)
+        analytics = self._analytics.get(key)
+        if analytics is not None:
+            return analytics
+
+        # Окно заканчивается на последнем обновлении: у одного поколения
+        # снимка одна и та же сетка
+        last_refresh = self.get_snapshot().last_refresh
+        end = parse_timestamp(last_refresh) if last_refresh else time.time()
+        start = end - window
+        analytics = compute_analytics(self.iter_history(start - step, end, pairs),
+                                      start, end, step, pairs)
+        if version:
+            self._analytics[key] = analytics
+        logger.info(f"Аналитика по {len(analytics.pairs)} парам за {window:g} с: "
+                    f"{analytics.points} доходностей, {analytics.seconds:.3f} с")
+        return analytics
+
+    def add_publish_listener(self, listener):
+        self._publish_listeners.append(listener)
+
+    def get_binary_snapshot(self) -> Optional[BinaryRatesSnapshot]:
+        # Файл заменяется атомарно, поэтому новый снимок узнаётся по inode
+        try:
+            inode = self.binary_file_path.stat().st_ino
+        except FileNotFoundError:
+            return None
 
-    def _load_history(self) -> List[dict]:
+        if self._binary is not None and self._binary.inode == inode:
+            return self._binary
 
         try:
-            if self.history_file_path.exists():
-                with open(self.history_file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
-        except Exception as e:
-            logger.warning(f"Не удалось загрузить историю: {e}")
-            return []
+            self._binary = BinaryRatesSnapshot.open(self.binary_file_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось открыть бинарный снимок курсов: {e}")
+            self._binary = None
+        return self._binary
+
+    def snapshot_version(self) -> int:
+        """Поколение опубликованного снимка курсов, растёт с каждой записью"""
+        binary = self.get_binary_snapshot()
+        return binary.generation if binary is not None else 0
 
     def get_current_rates(self) -> Dict:
 
-        try:
-            if self.rates_file_path.exists():
-                with open(self.rates_file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {"pairs": {}, "last_refresh": None}
-        except Exception as e:
-            logger.error(f"Ошибка при чтении текущих курсов: {e}")
-            return {"pairs": {}, "last_refresh": None}
+        return self.get_snapshot().to_legacy_json()
 
     def is_cache_expired(self, ttl_seconds: int) -> bool:
 
-        data = self.get_current_rates()
-        last_refresh = data.get("last_refresh")
+        binary = self.get_binary_snapshot()
+        snapshot = binary if binary is not None else self.get_snapshot()
+        last_refresh = snapshot.last_refresh
 
         if not last_refresh:
             return True
@@ -0,0 +1,311 @@
+"""Локальная заглушка CoinGecko и ExchangeRate-API для офлайн-проверок.
+
+Запуск: python -m valutatrade_hub.parser_service.stub_server --port 8765
+затем
+  COINGECKO_URL=http://127.0.0.1:8765/api/v3/simple/price
+  COINGECKO_MARKETS_URL=http://127.0.0.1:8765/api/v3/coins/markets
+  EXCHANGERATE_API_URL=http://127.0.0.1:8765/v6 EXCHANGERATE_API_KEY=stub
+
+Сбои задаются отдельно для каждого API: задержка ответа, доля ответов
+429 и 5xx, медленная отдача тела, размер выдачи. Случайность идёт от
+seed, поэтому последовательность сбоев воспроизводима.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+from ..core.currencies import get_registry
+from .config import ParserConfig
+
+COINGECKO = "coingecko"
+EXCHANGERATE = "exchangerate"
+
+_KNOWN_COINS = [
+    ("bitcoin", "btc", "Bitcoin", 92468.0, 1.84e12),
+    ("ethereum", "eth", "Ethereum", 3246.1, 3.9e11),
+    ("solana", "sol", "Solana", 138.05, 7.5e10),
+]
+
+
+def _symbol(n: int) -> str:
+    letters = ""
+    while True:
+        n, rest = divmod(n, 26)
+        letters = chr(ord('a') + rest) + letters
+        if n == 0:
+            return "x" + letters
+
+
+def generate_coins(count: int, seed: int = 42):
+    """Детерминированный список монет по убыванию капитализации"""
+    rng = random.Random(seed)
+    coins = []
+    market_cap = _KNOWN_COINS[-1][4]
+    for i in range(count):
+        if i < len(_KNOWN_COINS):
+            coin_id, symbol, name, price, market_cap = _KNOWN_COINS[i]
+        else:
+            market_cap *= rng.uniform(0.9, 0.999)
+            coin_id, symbol = f"stub-coin-{i}", _symbol(i)
+            name, price = f"Stub Coin {i}", round(rng.uniform(0.0001, 500.0), 6)
+        coins.append({
+            "id": coin_id,
+            "symbol": symbol,
+            "name": name,
+            "current_price": price,
+            "market_cap": market_cap,
+            "market_cap_rank": i + 1,
+        })
+    return coins
+
+def generate_fiat_rates(count: int, seed: int = 42):
+    """Курсы к USD в формате conversion_rates: валюты реестра и ещё
+    count сгенерированных кодов для большой выдачи"""
+    rng = random.Random(seed)
+    rates = {"USD": 1.0}
+    for currency in get_registry():
+        if currency.kind == "fiat" and currency.code != "USD":
+            rates[currency.code] = round(rng.uniform(0.5, 150.0), 6)
+    target = len(rates) + count
+    i = 0
+    while len(rates) < target:
+        # Буквенные коды на Z, не пересекающиеся с реестром
+        code = "Z" + _symbol(i)[1:].upper().rjust(2, "A")
+        rates.setdefault(code, round(rng.uniform(0.01, 5000.0), 6))
+        i += 1
+    return rates
+
+
+class Faults:
+    """Сбои одного API; поля можно менять на работающем сервере"""
+
+    __slots__ = ('latency_ms', 'jitter_ms', 'error_rate', 'rate_limit_rate',
+                 'slow_body_ms', 'pad_bytes')
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 slow_body_ms: float = 0.0, pad_bytes: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Доля ответов 500/502/503 и доля ответов 429
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # Тело ответа отдаётся частями на протяжении стольких миллисекунд
+        self.slow_body_ms = slow_body_ms
+        # Дополнительные байты в каждой монете выдачи markets
+        self.pad_bytes = pad_bytes
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, как у настоящих API: клиенты держат соединения в пуле
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status: int = 200, faults: Optional[Faults] = None,
+                   headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if faults is None or faults.slow_body_ms <= 0 or not body:
+            self.wfile.write(body)
+            return
+        chunks = 10
+        size = max(1, len(body) // chunks)
+        for start in range(0, len(body), size):
+            self.wfile.write(body[start:start + size])
+            self.wfile.flush()
+            time.sleep(faults.slow_body_ms / 1000 / chunks)
+
+    def _inject(self, api: str) -> Optional[Faults]:
+        """Задержка и, возможно, ответ-сбой; None — ответ уже отправлен"""
+        server = self.server
+        faults = server.faults[api]
+        with server.rng_lock:
+            delay = faults.latency_ms + server.rng.uniform(0, faults.jitter_ms)
+            roll = server.rng.random()
+            status = server.rng.choice((500, 502, 503))
+        if delay > 0:
+            time.sleep(delay / 1000)
+        server.requests[api] += 1
+        if roll < faults.rate_limit_rate:
+            self._send_json({"status": {"error_code": 429, "error_message": "rate limited"}},
+                            429, headers={"Retry-After": "1"})
+            return None
+        if roll < faults.rate_limit_rate + faults.error_rate:
+            self._send_json({"error": "injected failure"}, status)
+            return None
+        return faults
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path.endswith("/coins/markets"):
+            faults = self._inject(COINGECKO)
+            if faults is None:
+                return
+            coins = self.server.coins
+            if "ids" in query:
+                wanted = set(query["ids"].split(","))
+                page = [coin for coin in coins if coin["id"] in wanted]
+            else:
+                per_page = int(query.get("per_page", 100))
+                start = (int(query.get("page", 1)) - 1) * per_page
+                page = coins[start:start + per_page]
+            if faults.pad_bytes:
+                page = [dict(coin, image="x" * faults.pad_bytes) for coin in page]
+            self._send_json(page, faults=faults)
+
+        elif url.path.endswith("/simple/price"):
+            faults = self._inject(COINGECKO)
+            if faults is None:
+                return
+            wanted = set(query.get("ids", "").split(","))
+            self._send_json({coin["id"]: {"usd": coin["current_price"]}
+                             for coin in self.server.coins if coin["id"] in wanted},
+                            faults=faults)
+
+        elif "/latest/" in url.path:
+            faults = self._inject(EXCHANGERATE)
+            if faults is None:
+                return
+            # /v6/<ключ>/latest/<база>
+            parts = url.path.strip("/").split("/")
+            key, base = parts[-3], parts[-1].upper()
+            if key in ("", "invalid"):
+                self._send_json({"result": "error", "error-type": "invalid-key"}, 403)
+                return
+            rates = self.server.fiat_rates
+            if base not in rates:
+                self._send_json({"result": "error", "error-type": "unsupported-code"}, 404)
+                return
+            self._send_json({
+                "result": "success",
+                "base_code": base,
+                "conversion_rates": {code: rate / rates[base] for code, rate in rates.items()}
+            }, faults=faults)
+
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+class StubApiServer:
+    """HTTP-сервер с ответами в формате CoinGecko и ExchangeRate-API,
+    работает в фоновом потоке"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 coins: int = 500, seed: int = 42, fiat: int = 0,
+                 coingecko_faults: Optional[Faults] = None,
+                 exchangerate_faults: Optional[Faults] = None):
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.coins = generate_coins(coins, seed)
+        self._server.fiat_rates = generate_fiat_rates(fiat, seed)
+        self._server.faults = {COINGECKO: coingecko_faults or Faults(),
+                               EXCHANGERATE: exchangerate_faults or Faults()}
+        self._server.rng = random.Random(seed)
+        self._server.rng_lock = threading.Lock()
+        self._server.requests = {COINGECKO: 0, EXCHANGERATE: 0}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def faults(self):
+        return self._server.faults
+
+    @property
+    def requests(self):
+        """Число запросов к каждому API с момента запуска"""
+        return dict(self._server.requests)
+
+    def parser_config(self, **overrides) -> ParserConfig:
+        config = ParserConfig(
+            COINGECKO_URL=f"{self.url}/api/v3/simple/price",
+            COINGECKO_MARKETS_URL=f"{self.url}/api/v3/coins/markets",
+            EXCHANGERATE_API_URL=f"{self.url}/v6",
+            EXCHANGERATE_API_KEY="stub",
+        )
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        return config
+
+    def start(self) -> "StubApiServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--faulty", choices=["both", COINGECKO, EXCHANGERATE], default="both",
+                        help="К какому API применять сбои")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Задержка ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Случайная добавка к задержке")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--slow-body-ms", type=float, default=0.0,
+                        help="Время отдачи тела ответа по частям")
+    parser.add_argument("--pad-bytes", type=int, default=0,
+                        help="Лишние байты в каждой монете выдачи markets")
+
+
+def faults_from_args(args):
+    """(сбои CoinGecko, сбои ExchangeRate-API) из аргументов add_fault_arguments"""
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                    args.slow_body_ms, args.pad_bytes)
+    return (faults if args.faulty in ("both", COINGECKO) else Faults(),
+            faults if args.faulty in ("both", EXCHANGERATE) else Faults())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка CoinGecko и ExchangeRate-API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--coins", type=int, default=500, help="Число монет в выдаче")
+    parser.add_argument("--fiat", type=int, default=0,
+                        help="Дополнительных валют в выдаче ExchangeRate-API")
+    parser.add_argument("--seed", type=int, default=42)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    coingecko_faults, exchangerate_faults = faults_from_args(args)
+    server = StubApiServer(args.host, args.port, args.coins, args.seed, args.fiat,
+                           coingecko_faults, exchangerate_faults)
+    print(f"Заглушка запущена на {server.url}")
+    print(f"  COINGECKO_URL={server.url}/api/v3/simple/price")
+    print(f"  COINGECKO_MARKETS_URL={server.url}/api/v3/coins/markets")
+    print(f"  EXCHANGERATE_API_URL={server.url}/v6 EXCHANGERATE_API_KEY=stub")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
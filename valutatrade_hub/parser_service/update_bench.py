@@ -0,0 +1,90 @@
+"""Прогон update-rates против локальной заглушки API со сбоями.
+
+Запуск: python -m valutatrade_hub.parser_service.update_bench --updates 50 \
+            --latency-ms 40 --jitter-ms 60 --error-rate 0.1 --rate-limit-rate 0.05
+
+Заглушка поднимается в том же процессе, загрузчик работает во временном
+каталоге. Сбои воспроизводимы при одном и том же --seed. Печатаются
+время обновления (p50/p95/max), доля успешных обновлений, ошибки по
+источникам и состояние автоматов отключения в конце прогона.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from .stub_server import StubApiServer, add_fault_arguments, faults_from_args
+
+
+def run(args):
+    from .updater import RatesUpdater
+
+    coingecko_faults, exchangerate_faults = faults_from_args(args)
+    server = StubApiServer(coins=args.coins, seed=args.seed, fiat=args.fiat,
+                           coingecko_faults=coingecko_faults,
+                           exchangerate_faults=exchangerate_faults).start()
+    try:
+        config = server.parser_config(
+            REQUEST_TIMEOUT=args.timeout,
+            COINGECKO_TOP_N=args.top,
+            EXCHANGERATE_KEEP_ALL=args.fiat > 0,
+            BREAKER_FAILURE_THRESHOLD=args.breaker_threshold or 10 ** 9,
+        )
+        updater = RatesUpdater(config)
+        durations, failures = [], Counter()
+        successes = 0
+        for _ in range(args.updates):
+            started = time.perf_counter()
+            result = updater.run_update()
+            durations.append((time.perf_counter() - started) * 1000)
+            successes += result["success"]
+            for name, stats in result["sources"].items():
+                if stats["last_status"] != "ok":
+                    failures[(name, stats["last_status"])] += 1
+    finally:
+        server.stop()
+
+    durations.sort()
+    count = len(durations)
+    print(f"Обновлений: {count}, успешных: {successes} ({successes / count:.0%})")
+    print(f"Время обновления, мс: p50 {durations[count // 2]:.1f}, "
+          f"p95 {durations[min(count - 1, int(count * 0.95))]:.1f}, max {durations[-1]:.1f}")
+    print(f"Запросов к заглушке: {server.requests}")
+    for (name, status), times in sorted(failures.items()):
+        print(f"   {name}: {status} ×{times}")
+    for name, state in result["breakers"].items():
+        print(f"Автомат {name}: {state['state']}, размыканий подряд {state['trips']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="update-rates против заглушки API со сбоями")
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true",
+                        help="Печатать журнал загрузчика (ошибки источников)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="REQUEST_TIMEOUT, с")
+    parser.add_argument("--coins", type=int, default=500, help="Монет у заглушки")
+    parser.add_argument("--top", type=int, default=100, help="COINGECKO_TOP_N")
+    parser.add_argument("--fiat", type=int, default=0,
+                        help="Дополнительных валют у ExchangeRate-API")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--breaker-threshold", type=int, default=0,
+                        help="Ошибок подряд до отключения источника; 0 — не отключать")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    if args.updates < 1:
+        parser.error("--updates должен быть не меньше 1")
+    # Каждый внесённый сбой — предупреждение в журнале; без --verbose
+    # видна только итоговая сводка
+    if not args.verbose:
+        logging.getLogger("valutatrade").setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory(prefix="valutatrade-update-") as workdir:
+        (Path(workdir) / "data").mkdir()
+        os.chdir(workdir)
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 
 import logging
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict
 from .config import ParserConfig
-from .api_clients import CoinGeckoClient, ExchangeRateApiClient
+from .api_clients import BaseApiClient, SourceQuotes, create_providers
+from .breaker import HALF_OPEN, CircuitBreakers
+from .consensus import aggregate
+from .latency import LatencyStore
 from .storage import RatesStorage
-from ..core.exceptions import ApiRequestError
 
 logger = logging.getLogger("valutatrade")
 
@@ -14,78 +18,204 @@ class RatesUpdater:
     def __init__(self, config: ParserConfig = None):  # type: ignore
         self.config = config or ParserConfig()
 
-        self.coingecko_client = CoinGeckoClient(self.config)
-        self.exchangerate_client = ExchangeRateApiClient(self.config)
+        # Статистика по источникам за время жизни процесса
+        self.source_stats: Dict[str, Dict] = {}
+        # Гистограммы задержек копятся между запусками
+        self.latency = LatencyStore(self.config.LATENCY_FILE_PATH)
+        # Состояние автоматов общее для всех процессов
+        self.breakers = CircuitBreakers(
+            self.config.BREAKERS_FILE_PATH,
+            self.config.BREAKER_FAILURE_THRESHOLD,
+            self.config.BREAKER_BASE_DELAY,
+            self.config.BREAKER_MAX_DELAY,
+            self.config.BREAKER_JITTER,
+            probe_timeout=2 * self.config.REQUEST_TIMEOUT
+        )
 
         self.storage = RatesStorage(
             self.config.RATES_FILE_PATH,
-            self.config.HISTORY_FILE_PATH
+            self.config.HISTORY_FILE_PATH,
+            self.config.BASE_CURRENCY,
+            self.config.HISTORY_ARCHIVE_DIR,
+            self.config.RATE_STATS_FILE_PATH
         )
 
+        # Все зарегистрированные источники; новый клиент подключается
+        # объявлением подкласса BaseApiClient с именем. Источник replay
+        # читает историю под блокировкой хранилища
+        self.providers = create_providers(self.config, self.storage.history_lock)
+        self._weights = {client.name: self.config.SOURCE_WEIGHTS.get(client.name, client.weight)
+                         for client in self.providers}
+
+        # Подписчики на опубликованные курсы: listener(previous, current)
+        self._listeners = []
+
         logger.info("Инициализирован RatesUpdater")
 
+    def add_listener(self, listener: Callable[[Dict[str, float], Dict[str, float]], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, previous: Dict[str, float], current: Dict[str, float]):
+        for listener in self._listeners:
+            try:
+                listener(previous, current)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика обновления курсов: {e}")
+
+    def _fetch_source(self, client: BaseApiClient) -> SourceQuotes:
+        logger.info(f"Получение курсов от {client.display_name}...")
+        return client.fetch()
+
+    def _stats(self, name: str) -> Dict:
+        return self.source_stats.setdefault(name, {
+            "requests": 0, "failures": 0, "skipped": 0, "pairs": 0, "missing": 0,
+            "outliers": 0, "last_status": None, "last_ms": 0.0, "last_bytes": 0,
+            "last_success": None, "last_error": None
+        })
+
+    def _record_stats(self, client: BaseApiClient, quotes: SourceQuotes):
+        stats = self._stats(client.name)
+        stats["requests"] += 1
+        stats["last_ms"] = round(quotes.elapsed_ms, 1)
+        stats["last_bytes"] = sum(timing.bytes for timing in quotes.timings)
+        if quotes.error is not None:
+            stats["failures"] += 1
+            stats["last_status"] = "failed"
+            stats["last_error"] = str(quotes.error)
+            return
+        stats["last_status"] = "ok"
+        stats["pairs"] = len(quotes.rates)
+        stats["missing"] = sum(1 for pair_key in client.pairs() if pair_key not in quotes.rates)
+        stats["last_success"] = datetime.utcnow().isoformat() + "Z"
+        stats["last_error"] = None
+
+    def _carry_over(self, snapshot, fresh, rates: Dict[str, float]):
+        """Пары прошлого снимка от источников, не ответивших в этот раз.
+
+        Они переносятся в новый снимок как есть, со старым временем
+        обновления: при недоступном источнике остаются последние курсы.
+        Пару, которую источник перестал котировать, ответивший источник
+        не сохраняет.
+        """
+        stale = [client for client in self.providers if client not in fresh]
+        declared = {pair_key for client in stale for pair_key in client.pairs()}
+        names = {client.display_name for client in stale}
+        return [pair_key for pair_key, record in snapshot.items()
+                if pair_key not in rates
+                and (pair_key in declared or names.intersection(record["source"].split("+")))]
+
     def run_update(self, source: str = None) -> Dict:  # type: ignore
 
         logger.info("=" * 50)
         logger.info("Начало обновления курсов валют")
 
         all_rates = {}
+        carried = []
         errors = []
 
         try:
-
-            if source in [None, "coingecko"]:
-                try:
-                    logger.info("Получение курсов криптовалют от CoinGecko...")
-                    crypto_rates = self.coingecko_client.fetch_rates()
-                    all_rates.update(crypto_rates)
-
-                    self.storage.save_to_history(crypto_rates, "CoinGecko")
-                    logger.info(
-                        f"✓ Получено {len(crypto_rates)} крипто-курсов")
-
-                except ApiRequestError as e:
-                    error_msg = f"Ошибка CoinGecko: {e}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-
-            if source in [None, "exchangerate"]:
-                try:
-                    logger.info(
-                        "Получение курсов фиатных валют от ExchangeRate-API...")
-                    fiat_rates = self.exchangerate_client.fetch_rates()
-                    all_rates.update(fiat_rates)
-
-                    self.storage.save_to_history(
-                        fiat_rates, "ExchangeRate-API")
-                    logger.info(f"✓ Получено {len(fiat_rates)} фиатных курсов")
-
-                except ApiRequestError as e:
-                    error_msg = f"Ошибка ExchangeRate-API: {e}"
+            providers = [client for client in self.providers
+                         if source is None or client.name == source]
+            if not providers:
+                raise ValueError(f"Источник курсов '{source}' не подключён")
+
+            # Разомкнутые источники пропускаются без запроса
+            allowed = []
+            for client in providers:
+                blocked = self.breakers.admit(client.name)
+                if blocked is None:
+                    allowed.append(client)
+                    continue
+                stats = self._stats(client.name)
+                stats["skipped"] += 1
+                stats["last_status"] = "skipped"
+                if blocked["state"] == HALF_OPEN:
+                    # Пробный запрос уже выполняет другой процесс
+                    error_msg = (f"{client.display_name} проверяется пробным запросом "
+                                 f"другого процесса, оставлены последние курсы")
+                else:
+                    error_msg = (f"{client.display_name} отключён до {blocked['retry_at']}, "
+                                 f"оставлены последние курсы")
+                logger.warning(error_msg)
+                errors.append(error_msg)
+
+            # Источники опрашиваются одновременно; время обновления —
+            # время самого медленного из них
+            responses = []
+            if allowed:
+                with ThreadPoolExecutor(max_workers=len(allowed)) as executor:
+                    responses = list(executor.map(self._fetch_source, allowed))
+                # Замеры копятся и по неудачным запросам: таймауты тоже задержка
+                self.latency.record({quotes.name: quotes.timings for quotes in responses})
+
+            quotes_by_source: Dict[str, SourceQuotes] = {}
+            fresh = []
+            for client, quotes in zip(allowed, responses):
+                self._record_stats(client, quotes)
+                if quotes.error is not None:
+                    self.breakers.record_failure(client.name, str(quotes.error))
+                    error_msg = f"Ошибка {client.display_name}: {quotes.error}"
                     logger.error(error_msg)
                     errors.append(error_msg)
+                    continue
+                self.breakers.record_success(client.name)
+                quotes_by_source[client.name] = quotes
+                fresh.append(client)
+                if client.record_history:
+                    self.storage.save_to_history(quotes.rates, quotes.display_name,
+                                                 quotes.meta())
+                logger.info(f"✓ {client.display_name}: получено {len(quotes.rates)} курсов "
+                            f"за {quotes.elapsed_ms:.0f} мс")
+
+            currency_kinds = {}
+            market_caps = {}
+            for quotes in quotes_by_source.values():
+                currency_kinds.update(quotes.currency_kinds)
+                market_caps.update(quotes.market_caps)
+
+            consensus = aggregate(
+                {name: quotes.rates for name, quotes in quotes_by_source.items()},
+                self._weights, self.config.AGGREGATION_METHOD, self.config.OUTLIER_THRESHOLD)
+            all_rates = consensus.rates
+            for name, pairs in consensus.rejected.items():
+                self.source_stats[name]["outliers"] += len(pairs)
+                logger.warning(f"Отброшены выбросы {quotes_by_source[name].display_name}: "
+                               f"{', '.join(pairs)}")
 
             if all_rates:
-
-                if source == "coingecko":
-                    save_source = "CoinGecko"
-                elif source == "exchangerate":
-                    save_source = "ExchangeRate-API"
-                else:
-                    save_source = "Mixed"
-
-                success = self.storage.save_current_rates(
-                    all_rates, save_source)
-                if success:
-                    logger.info(f"✓ Сохранено {len(all_rates)} курсов в кеш")
-                else:
-                    errors.append("Не удалось сохранить курсы в кеш")
+                display = {name: quotes.display_name for name, quotes in quotes_by_source.items()}
+                pair_sources = {pair_key: "+".join(display[name] for name in names)
+                                for pair_key, names in consensus.contributors.items()}
+                save_source = (display[providers[0].name] if len(providers) == 1
+                               else "Mixed")
+
+                # Предыдущие курсы, запись и уведомление — под одной
+                # блокировкой, иначе параллельное обновление подменит «было»
+                with self.storage.rates_lock:
+                    snapshot = self.storage.get_snapshot()
+                    previous = {pair_key: snapshot.get_rate(pair_key) for pair_key in all_rates}
+                    carried = self._carry_over(snapshot, fresh, all_rates)
+
+                    success = self.storage.save_current_rates(
+                        all_rates, save_source, currency_kinds, market_caps, pair_sources,
+                        carried)
+                    if success:
+                        logger.info(f"✓ Сохранено {len(all_rates)} курсов в кеш, "
+                                    f"без изменений оставлено {len(carried)}")
+                        self._notify(previous, all_rates)
+                    else:
+                        errors.append("Не удалось сохранить курсы в кеш")
 
             result = {
                 "total_rates": len(all_rates),
                 "updated_pairs": list(all_rates.keys()),
                 "errors": errors,
-                "success": len(errors) == 0
+                "success": len(errors) == 0,
+                "stale_pairs": len(carried),
+                "sources": {client.name: dict(self._stats(client.name))
+                            for client in providers},
+                "breakers": {name: state for name, state in self.breakers.states().items()
+                             if name in {client.name for client in providers}}
             }
 
             if errors:
@@ -106,9 +236,15 @@ class RatesUpdater:
 
     def get_cache_info(self) -> Dict:
 
-        data = self.storage.get_current_rates()
-        pairs_count = len(data.get("pairs", {}))
-        last_refresh = data.get("last_refresh", "Никогда")
+        # Бинарный снимок читается без разбора JSON; rates.json — только
+        # если снимок ещё не публиковался
+        snapshot = self.storage.get_binary_snapshot()
+        if snapshot is not None:
+            pairs_count = snapshot.pairs_count
+        else:
+            snapshot = self.storage.get_snapshot()
+            pairs_count = len(snapshot)
+        last_refresh = snapshot.last_refresh or "Никогда"
 
         return {
             "pairs_count": pairs_count,